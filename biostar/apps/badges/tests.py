@@ -24,15 +24,15 @@ class AwardTest(TestCase):
         eq(0, award_count())
 
         jane = User.objects.get(email=self.email)
-        awards.create_user_award(jane)
+        awards.create_user_award(jane.id)
 
         # No award for new user.
         eq(0, award_count())
 
         jane.profile.info = "A" * 1000
-        jane.save()
+        jane.profile.save()
 
         # Check for the autobiographer award.
-        awards.create_user_award(jane)
+        awards.create_user_award(jane.id)
 
         eq(1, award_count())
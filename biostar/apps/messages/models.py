@@ -80,6 +80,79 @@ class Message(models.Model):
         data = (self.body.subject, self.body.text, settings.DEFAULT_FROM_EMAIL, recipient_list)
         return data
 
+class QueuedEmail(models.Model):
+    """
+    An email waiting in the outbound queue. Emails that fail are retried
+    with an exponential backoff until they run out of attempts.
+    """
+    PENDING, SENDING, SENT, FAILED = range(4)
+    STATE_CHOICES = [(PENDING, "Pending"), (SENDING, "Sending"), (SENT, "Sent"), (FAILED, "Failed")]
+
+    # The delay before the first retry in seconds, doubles with each attempt.
+    RETRY_DELAY = 60
+
+    # The longest delay between two attempts.
+    MAX_DELAY = 6 * 3600
+
+    # Emails with the same key are only queued once.
+    key = models.CharField(max_length=255, unique=True)
+
+    state = models.IntegerField(choices=STATE_CHOICES, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    next_attempt = models.DateTimeField(db_index=True)
+    creation_date = models.DateTimeField()
+    sent_at = models.DateTimeField(null=True)
+    error = models.TextField(default="", blank=True)
+
+    subject = models.TextField()
+    from_email = models.TextField()
+    to = models.TextField()
+    reply_to = models.TextField(default="", blank=True)
+    text = models.TextField()
+    html = models.TextField(default="", blank=True)
+
+    def __unicode__(self):
+        return u"QueuedEmail %s to %s" % (self.key, self.to)
+
+    @staticmethod
+    def from_message(key, email):
+        "Creates a queue entry for an EmailMultiAlternatives instance"
+        html = [content for content, mimetype in getattr(email, 'alternatives', []) if mimetype == "text/html"]
+        date = now()
+        return QueuedEmail(key=key, subject=email.subject, from_email=email.from_email, to=",".join(email.to),
+                           reply_to=email.extra_headers.get('Reply-To', ''), text=email.body,
+                           html=html[0] if html else '', creation_date=date, next_attempt=date)
+
+    @staticmethod
+    def enqueue(items):
+        """
+        Adds (key, email) pairs to the queue, skips the keys that are already there.
+        Returns the number of emails that were added.
+        """
+        items = dict(items)
+        keys, existing = items.keys(), set()
+        for i in range(0, len(keys), 500):
+            query = QueuedEmail.objects.filter(key__in=keys[i:i + 500])
+            existing.update(query.values_list('key', flat=True))
+        entries = [QueuedEmail.from_message(key, email) for key, email in items.items() if key not in existing]
+        QueuedEmail.objects.bulk_create(entries, batch_size=100)
+        return len(entries)
+
+    def message(self):
+        "The email that this entry stands for"
+        headers = {'Reply-To': self.reply_to} if self.reply_to else {}
+        email = mail.EmailMultiAlternatives(subject=self.subject, body=self.text, from_email=self.from_email,
+                                            to=self.to.split(","), headers=headers)
+        if self.html:
+            email.attach_alternative(self.html, "text/html")
+        return email
+
+    def retry_delay(self):
+        "The wait before the next attempt"
+        seconds = min(self.RETRY_DELAY * 2 ** (self.attempts - 1), self.MAX_DELAY)
+        return datetime.timedelta(seconds=seconds)
+
+
 # Admin interface to Message and MessageBody.
 class MessageBodyAdmin(admin.ModelAdmin):
     search_fields = ('sender__name', 'sender__email', 'recipient__name', 'recipient__email', 'subject')
@@ -76,3 +76,65 @@ class NoteTest(TestCase):
 
 
 
+
+
+class QueueTest(TestCase):
+
+    def setUp(self):
+        from biostar.const import ALL_MESSAGES
+        self.author = User.objects.create(email="author@this.edu")
+        self.watchers = []
+        for email in ["john@this.edu", "jane@this.edu"]:
+            user = User.objects.create(email=email)
+            user.profile.message_prefs = ALL_MESSAGES
+            user.profile.save()
+            self.watchers.append(user)
+
+    def test_post_emails_are_queued(self):
+        "Emails for a new post go through the queue"
+        from biostar.apps.messages.models import QueuedEmail
+        from biostar.mailer import send_queued_emails
+
+        post = Post(title="Test", author=self.author, type=Post.QUESTION)
+        post.save()
+
+        self.assertEqual(QueuedEmail.objects.filter(state=QueuedEmail.PENDING).count(), 2)
+        self.assertEqual(len(mail.outbox), 0)
+
+        self.assertEqual(send_queued_emails(), 2)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ["jane@this.edu", "john@this.edu"])
+        self.assertEqual(QueuedEmail.objects.filter(state=QueuedEmail.SENT).count(), 2)
+
+        # Nothing is sent twice.
+        self.assertEqual(send_queued_emails(), 0)
+
+    def test_dedup(self):
+        "Emails with the same key are queued once"
+        from biostar.apps.messages.models import QueuedEmail
+
+        email = mail.EmailMessage("Subject", "Body", "from@this.edu", ["to@this.edu"])
+        self.assertEqual(QueuedEmail.enqueue([("key", email)]), 1)
+        self.assertEqual(QueuedEmail.enqueue([("key", email)]), 0)
+
+    def test_retry(self):
+        "Failed emails are retried later with a growing delay"
+        from biostar.apps.messages.models import QueuedEmail
+        from biostar import mailer
+
+        email = mail.EmailMessage("Subject", "Body", "from@this.edu", ["to@this.edu"])
+        QueuedEmail.enqueue([("key", email)])
+
+        with self.settings(EMAIL_BACKEND='biostar.server.tests.test_mailer.FailingBackend'):
+            entry = QueuedEmail.objects.get(key="key")
+            entry.to = "bad@test.com"
+            entry.save()
+            self.assertEqual(mailer.send_queued_emails(), 0)
+
+        entry = QueuedEmail.objects.get(key="key")
+        self.assertEqual(entry.state, QueuedEmail.PENDING)
+        self.assertEqual(entry.attempts, 1)
+        self.assertTrue(entry.error)
+
+        # Not due yet.
+        self.assertEqual(mailer.send_queued_emails(), 0)
+        self.assertEqual(len(mail.outbox), 0)
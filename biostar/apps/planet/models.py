@@ -1,6 +1,7 @@
 from django.db import models
+from django.db.models import F
 from django.conf import settings
-import os, urllib, logging, feedparser, datetime
+import os, urllib2, logging, feedparser, datetime
 from django.core.urlresolvers import reverse
 from django.utils.timezone import utc
 from django.contrib import admin
@@ -25,6 +26,28 @@ class Blog(models.Model):
     active = models.BooleanField(default=True)
     list_order = models.IntegerField(default=0)
 
+    # Validators of the last download, sent back to make the request conditional.
+    etag = models.CharField(max_length=255, default="", blank=True)
+    last_modified = models.CharField(max_length=255, default="", blank=True)
+
+    # Hash of the feed file at the last parse, an unchanged file is not parsed again.
+    feed_hash = models.CharField(max_length=32, default="", blank=True)
+
+    # Totals of the blog posts, maintained when the entries are added.
+    last_post_date = models.DateTimeField(null=True, db_index=True)
+    post_count = models.IntegerField(default=0)
+
+    def add_posts(self, posts):
+        "Updates the totals after the posts have been added"
+        if not posts:
+            return
+        last = max(post.creation_date for post in posts)
+        if self.last_post_date and self.last_post_date > last:
+            last = self.last_post_date
+        Blog.objects.filter(id=self.id).update(last_post_date=last, post_count=F('post_count') + len(posts))
+        self.last_post_date = last
+        self.post_count += len(posts)
+
     @property
     def fname(self):
         fname = abspath(settings.PLANET_DIR, '%s.xml' % self.id)
@@ -38,14 +61,33 @@ class Blog(models.Model):
             doc = None
         return doc
 
-    def download(self):
+    def download(self, timeout=30):
+        """
+        Downloads the feed unless the server reports it unchanged. Updates the
+        validators but does not save them. Returns True when the feed file was written.
+        """
+        request = urllib2.Request(self.feed)
+        if os.path.isfile(self.fname):
+            if self.etag:
+                request.add_header('If-None-Match', self.etag)
+            if self.last_modified:
+                request.add_header('If-Modified-Since', self.last_modified)
         try:
-            text = urllib.urlopen(self.feed).read()
+            response = urllib2.urlopen(request, timeout=timeout)
+            text = response.read()
             stream = file(self.fname, 'wt')
             stream.write(text)
             stream.close()
+            headers = response.info()
+            self.etag = headers.get('ETag', '')[:255]
+            self.last_modified = headers.get('Last-Modified', '')[:255]
+            return True
+        except urllib2.HTTPError, exc:
+            if exc.code != 304:
+                logger.error("error %s downloading %s" % (exc, self.feed))
         except Exception, exc:
-            logger.error("error %s downloading %s", (exc, self.feed))
+            logger.error("error %s downloading %s" % (exc, self.feed))
+        return False
 
     def __unicode__(self):
         return self.title
@@ -5,7 +5,16 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+import os, shutil, tempfile, threading, logging
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
 from django.test import TestCase
+from django.core.urlresolvers import reverse
+
+from biostar.apps.planet.models import Blog
+from biostar.server.management.commands import planet
+
+logging.disable(logging.INFO)
 
 
 class SimpleTest(object):
@@ -16,4 +25,81 @@ class SimpleTest(object):
         self.assertEqual(1 + 1, 2)
 
 
+FEED = """<?xml version="1.0"?><rss version="2.0"><channel><title>Blog</title><link>http://example.com</link>
+<item><title>Entry title</title><guid>entry-1</guid><link>http://example.com/1</link>
+<description>Entry body</description><pubDate>Mon, 06 Sep 2010 16:45:00 GMT</pubDate></item>
+</channel></rss>"""
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    "Serves the feed with an etag and honors conditional requests"
+    def do_GET(self):
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', '"v1"')
+        self.end_headers()
+        self.wfile.write(FEED)
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloadTest(TestCase):
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), FeedHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.planet_dir = tempfile.mkdtemp()
+        url = "http://127.0.0.1:%s/feed" % self.server.server_port
+        self.blog = Blog.objects.create(title="Blog", feed=url, link="http://example.com")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.planet_dir)
+
+    def test_conditional_download(self):
+        with self.settings(PLANET_DIR=self.planet_dir):
+            self.assertEqual(len(planet.download_blogs(workers=2, timeout=5)), 1)
+            self.assertTrue(os.path.isfile(self.blog.fname))
+            self.assertEqual(Blog.objects.get(id=self.blog.id).etag, '"v1"')
+
+            # The server reports the feed unchanged.
+            self.assertEqual(len(planet.download_blogs(workers=2, timeout=5)), 0)
+
+    def test_update_entries(self):
+        from biostar.apps.planet.models import BlogPost
+
+        with self.settings(PLANET_DIR=self.planet_dir):
+            planet.download_blogs(workers=1, timeout=5)
+            planet.update_entries(count=3)
+            self.assertEqual(BlogPost.objects.filter(blog=self.blog, uid="entry-1").count(), 1)
+            self.assertTrue(Blog.objects.get(id=self.blog.id).feed_hash)
+
+            # An unchanged file is not parsed again, a changed one adds no duplicates.
+            planet.update_entries(count=3)
+            Blog.objects.filter(id=self.blog.id).update(feed_hash="")
+            planet.update_entries(count=3)
+            self.assertEqual(BlogPost.objects.filter(blog=self.blog).count(), 1)
+
+            # The totals are kept on the blog.
+            blog = Blog.objects.get(id=self.blog.id)
+            self.assertEqual(blog.post_count, 1)
+            self.assertEqual(blog.last_post_date.year, 2010)
+
+            r = self.client.get(reverse("planet"))
+            self.assertContains(r, "1 posts")
+
+    def test_save_posts(self):
+        from biostar.apps.planet.models import BlogPost, now
 
+        # The entry without a date fails, the other one is still saved.
+        posts = [BlogPost(blog=self.blog, uid="good", title="Good", creation_date=now()),
+                 BlogPost(blog=self.blog, uid="bad", title="Bad", creation_date=None)]
+        saved = planet.save_posts(posts)
+        self.assertEqual([post.uid for post in saved], ["good"])
+        self.assertEqual(list(BlogPost.objects.filter(blog=self.blog).values_list('uid', flat=True)), ["good"])
@@ -2,16 +2,7 @@
 from django.views.generic import DetailView, ListView, TemplateView, UpdateView, View
 from .models import Blog, BlogPost
 from django.conf import settings
-from django.db.models import Max, Count
-
-
-def reset_counts(request, label):
-    "Resets counts in the session"
-    label = label.lower()
-    counts = request.session.get(settings.SESSION_KEY, {})
-    if label in counts:
-        counts[label] = ''
-        request.session[settings.SESSION_KEY] = counts
+from biostar.server.middleware import reset_counts
 
 
 class BlogPostList(ListView):
@@ -34,9 +25,8 @@ class BlogPostList(ListView):
         context['q'] = get('q', '')
         context['sort'] = get('sort', '')
 
-        # Sort blog posts by latest insert time
-        blogs = Blog.objects.all().annotate(updated_date=Max("blogpost__creation_date"),
-                                            count=Count("blogpost__id")).order_by("-updated_date", "-list_order")
+        # Sort blogs by their latest post, the totals are kept on the blog.
+        blogs = Blog.objects.all().order_by("-last_post_date", "-list_order")
         context['blogs'] = blogs
 
         reset_counts(self.request, self.topic)
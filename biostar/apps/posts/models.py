@@ -356,6 +356,11 @@ class Post(models.Model):
             Post.objects.filter(id=post.id).update(view_count=F('view_count') + 1)
         return post
 
+    @staticmethod
+    def reply_title(ptype, root_title):
+        "The title of a reply is inherited from the top level"
+        return "%s: %s" % (dict(Post.TYPE_CHOICES)[ptype][0], root_title[:80])
+
     @staticmethod
     def check_root(sender, instance, created, *args, **kwargs):
         "We need to ensure that the parent and root are set on object creation."
@@ -381,7 +386,7 @@ class Post(models.Model):
 
             if not instance.is_toplevel:
                 # Title is inherited from top level.
-                instance.title = "%s: %s" % (instance.get_type_display()[0], instance.root.title[:80])
+                instance.title = Post.reply_title(instance.type, instance.root.title)
 
                 if instance.type == Post.ANSWER:
                     Post.objects.filter(id=instance.root.id).update(reply_count=F("reply_count") + 1)
@@ -489,6 +494,107 @@ class VoteAdmin(admin.ModelAdmin):
 
 admin.site.register(Vote, VoteAdmin)
 
+class DailyStats(models.Model):
+    """
+    Site statistics rolled up for a single day. The totals count
+    everything created before the end of the day, the id lists hold
+    the objects created during the day.
+    """
+    date = models.DateField(unique=True)
+
+    questions = models.IntegerField(default=0)
+    answers = models.IntegerField(default=0)
+    toplevel = models.IntegerField(default=0)
+    comments = models.IntegerField(default=0)
+    votes = models.IntegerField(default=0)
+    users = models.IntegerField(default=0)
+
+    # Comma separated ids of the objects created on this day.
+    new_users = models.TextField(default='', blank=True)
+    new_posts = models.TextField(default='', blank=True)
+    new_votes = models.TextField(default='', blank=True)
+
+    @staticmethod
+    def join_ids(ids):
+        return ",".join(map(str, ids))
+
+    @staticmethod
+    def split_ids(text):
+        return [int(x) for x in text.split(",") if x]
+
+    def __unicode__(self):
+        return "Stats: %s" % self.date
+
+
+class DigestDay(models.Model):
+    """
+    The digest content of a single day. Digests that span several days
+    merge the rows of the days instead of scanning the posts again.
+    """
+    date = models.DateField(unique=True)
+
+    # Comma separated ids of the candidate posts of the day.
+    new_posts = models.TextField(default='', blank=True)
+    edited_posts = models.TextField(default='', blank=True)
+    blogs = models.TextField(default='', blank=True)
+
+    # Comma separated user:count pairs of the posts edited on this day.
+    posters = models.TextField(default='', blank=True)
+
+    # Totals at the end of the day.
+    post_count = models.IntegerField(default=0)
+    user_count = models.IntegerField(default=0)
+
+    @staticmethod
+    def join_counts(counts):
+        return ",".join("%s:%s" % pair for pair in counts)
+
+    @staticmethod
+    def split_counts(text):
+        return [tuple(map(int, x.split(":"))) for x in text.split(",") if x]
+
+    def __unicode__(self):
+        return "Digest: %s" % self.date
+
+
+class Change(models.Model):
+    """
+    An entry of the change log. The id of the entry is its sequence number:
+    it grows with every change, so consumers can ask for everything after
+    the last number they have seen.
+    """
+    POST, VOTE, USER = range(3)
+    MODEL_CHOICES = [(POST, "post"), (VOTE, "vote"), (USER, "user")]
+
+    SAVED, DELETED = range(2)
+    ACTION_CHOICES = [(SAVED, "saved"), (DELETED, "deleted")]
+
+    model = models.IntegerField(choices=MODEL_CHOICES)
+    object_id = models.IntegerField()
+    action = models.IntegerField(choices=ACTION_CHOICES, default=SAVED)
+    date = models.DateTimeField(db_index=True)
+
+    @staticmethod
+    def log(model, ids, action=SAVED):
+        "Records a change for each object id"
+        date = now()
+        changes = [Change(model=model, object_id=pk, action=action, date=date) for pk in ids]
+        Change.objects.bulk_create(changes, batch_size=500)
+
+    @staticmethod
+    def settled():
+        """
+        The changes that are older than CHANGE_LOG_LAG_SECONDS. The ids are taken before
+        the transactions commit, so a recent change may become visible before one with
+        a lower id. Readers that move past an id only do so once the lower ids are settled.
+        """
+        cutoff = now() - datetime.timedelta(seconds=settings.CHANGE_LOG_LAG_SECONDS)
+        return Change.objects.filter(date__lte=cutoff)
+
+    def __unicode__(self):
+        return "Change %s: %s %s" % (self.id, self.get_model_display(), self.object_id)
+
+
 class SubscriptionManager(models.Manager):
     def get_subs(self, post):
         "Returns all suscriptions for a post"
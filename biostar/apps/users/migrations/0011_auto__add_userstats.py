@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+from south.utils import datetime_utils as datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'UserStats'
+        db.create_table(u'users_userstats', (
+            ('user', self.gf('django.db.models.fields.related.OneToOneField')(related_name=u'stats', unique=True, primary_key=True, to=orm['users.User'])),
+            ('post_count', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('question_count', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('answer_count', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('comment_count', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('accepted_count', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('vote_count', self.gf('django.db.models.fields.IntegerField')(default=0)),
+            ('award_count', self.gf('django.db.models.fields.IntegerField')(default=0)),
+        ))
+        db.send_create_signal(u'users', ['UserStats'])
+
+        # Adding index on 'Profile', fields ['last_login']
+        db.create_index(u'users_profile', ['last_login'])
+
+        # Adding index on 'Profile', fields ['date_joined']
+        db.create_index(u'users_profile', ['date_joined'])
+
+        # Adding field 'User.name_key'
+        db.add_column(u'users_user', 'name_key',
+                      self.gf('django.db.models.fields.CharField')(default=u'', max_length=255, db_index=True),
+                      keep_default=False)
+
+        # The name search is a prefix match, a LIKE 'x%' query can only use the
+        # index in postgres with a non C collation through the pattern operator class.
+        if db.backend_name == "postgres":
+            db.execute('CREATE INDEX "users_user_name_key_like" ON "users_user" ("name_key" varchar_pattern_ops)')
+
+        # Adding index on 'User', fields ['activity']
+        db.create_index(u'users_user', ['activity'])
+
+        # Adding index on 'User', fields ['score']
+        db.create_index(u'users_user', ['score'])
+
+
+    def backwards(self, orm):
+        # Removing index on 'User', fields ['score']
+        db.delete_index(u'users_user', ['score'])
+
+        # Removing index on 'User', fields ['activity']
+        db.delete_index(u'users_user', ['activity'])
+
+        # Removing index on 'Profile', fields ['date_joined']
+        db.delete_index(u'users_profile', ['date_joined'])
+
+        # Removing index on 'Profile', fields ['last_login']
+        db.delete_index(u'users_profile', ['last_login'])
+
+        # Deleting model 'UserStats'
+        db.delete_table(u'users_userstats')
+
+        # Removing the pattern index on 'User', fields ['name_key']
+        if db.backend_name == "postgres":
+            db.execute('DROP INDEX "users_user_name_key_like"')
+
+        # Deleting field 'User.name_key'
+        db.delete_column(u'users_user', 'name_key')
+
+
+    models = {
+        u'sites.site': {
+            'Meta': {'ordering': "(u'domain',)", 'object_name': 'Site', 'db_table': "u'django_site'"},
+            'domain': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        },
+        u'users.emaillist': {
+            'Meta': {'object_name': 'EmailList'},
+            'active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'date': ('django.db.models.fields.DateTimeField', [], {}),
+            'email': ('django.db.models.fields.EmailField', [], {'unique': 'True', 'max_length': '255', 'db_index': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'type': ('django.db.models.fields.IntegerField', [], {'default': '0'})
+        },
+        u'users.profile': {
+            'Meta': {'object_name': 'Profile'},
+            'date_joined': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True'}),
+            'digest_prefs': ('django.db.models.fields.IntegerField', [], {'default': '2'}),
+            'flag': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'info': ('django.db.models.fields.TextField', [], {'default': "u''", 'null': 'True', 'blank': 'True'}),
+            'last_ip': ('django.db.models.fields.GenericIPAddressField', [], {'max_length': '39', 'null': 'True', 'blank': 'True'}),
+            'last_login': ('django.db.models.fields.DateTimeField', [], {'db_index': 'True'}),
+            'location': ('django.db.models.fields.CharField', [], {'default': "u''", 'max_length': '255', 'blank': 'True'}),
+            'message_prefs': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'my_tags': ('django.db.models.fields.TextField', [], {'default': "u''", 'max_length': '255', 'blank': 'True'}),
+            'opt_in': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'scholar': ('django.db.models.fields.CharField', [], {'default': "u''", 'max_length': '255', 'blank': 'True'}),
+            'tags': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['users.Tag']", 'symmetrical': 'False', 'blank': 'True'}),
+            'twitter_id': ('django.db.models.fields.CharField', [], {'default': "u''", 'max_length': '255', 'blank': 'True'}),
+            'user': ('django.db.models.fields.related.OneToOneField', [], {'to': u"orm['users.User']", 'unique': 'True'}),
+            'uuid': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '255', 'db_index': 'True'}),
+            'watched_tags': ('django.db.models.fields.CharField', [], {'default': "u''", 'max_length': '100', 'blank': 'True'}),
+            'website': ('django.db.models.fields.URLField', [], {'default': "u''", 'max_length': '255', 'blank': 'True'})
+        },
+        u'users.tag': {
+            'Meta': {'object_name': 'Tag'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.TextField', [], {'max_length': '50', 'db_index': 'True'})
+        },
+        u'users.user': {
+            'Meta': {'object_name': 'User'},
+            'activity': ('django.db.models.fields.IntegerField', [], {'default': '0', 'db_index': 'True'}),
+            'badges': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'email': ('django.db.models.fields.EmailField', [], {'unique': 'True', 'max_length': '255', 'db_index': 'True'}),
+            'flair': ('django.db.models.fields.CharField', [], {'default': "u''", 'max_length': '15'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'is_admin': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_staff': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_login': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'message_count': ('django.db.models.fields.IntegerField', [], {'default': '0', 'db_index': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'default': "u''", 'max_length': '255'}),
+            'name_key': ('django.db.models.fields.CharField', [], {'default': "u''", 'max_length': '255', 'db_index': 'True'}),
+            'new_messages': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'score': ('django.db.models.fields.IntegerField', [], {'default': '0', 'db_index': 'True'}),
+            'site': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['sites.Site']", 'null': 'True'}),
+            'status': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'type': ('django.db.models.fields.IntegerField', [], {'default': '0'})
+        },
+        u'users.userstats': {
+            'Meta': {'object_name': 'UserStats'},
+            'accepted_count': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'answer_count': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'award_count': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'comment_count': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'post_count': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'question_count': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'user': ('django.db.models.fields.related.OneToOneField', [], {'related_name': "u'stats'", 'unique': 'True', 'primary_key': 'True', 'to': u"orm['users.User']"}),
+            'vote_count': ('django.db.models.fields.IntegerField', [], {'default': '0'})
+        }
+    }
+
+    complete_apps = ['users']
\ No newline at end of file
@@ -34,13 +34,14 @@ class LocalManager(UserManager):
         days = const.POST_LIMIT_MAP.get(limit, 0)
 
         if q:
-            query = self.filter(name__icontains=q)
+            # A prefix match on the lower cased name can use the index.
+            query = self.filter(name_key__startswith=q.strip().lower())
         else:
-            query = self
+            query = self.all()
 
         if days:
             delta = const.now() - timedelta(days=days)
-            query = self.filter(profile__last_login__gt=delta)
+            query = query.filter(profile__last_login__gt=delta)
 
         if user.is_authenticated() and user.is_moderator:
             query = query.select_related("profile").order_by(sort)
@@ -67,6 +68,9 @@ class User(AbstractBaseUser):
     email = models.EmailField(verbose_name='Email', db_index=True, max_length=255, unique=True)
     name = models.CharField(verbose_name='Name', max_length=255, default="", blank=False)
 
+    # The lower cased name, used for prefix searches.
+    name_key = models.CharField(max_length=255, default="", db_index=True)
+
     # Fields used by the Django admin.
     is_active = models.BooleanField(default=True)
     is_admin = models.BooleanField(default=False)
@@ -81,14 +85,17 @@ class User(AbstractBaseUser):
     # The number of new messages for the user.
     new_messages = models.IntegerField(default=0)
 
+    # The number of messages in the inbox of the user.
+    message_count = models.IntegerField(default=0, db_index=True)
+
     # The number of badges for the user.
     badges = models.IntegerField(default=0)
 
     # Activity score computed over a shorter period.
-    score = models.IntegerField(default=0)
+    score = models.IntegerField(default=0, db_index=True)
 
     # User's recent activity level.
-    activity = models.IntegerField(default=0)
+    activity = models.IntegerField(default=0, db_index=True)
 
     # Display next to a user name.
     flair = models.CharField(verbose_name='Flair', max_length=15, default="")
@@ -144,6 +151,8 @@ class User(AbstractBaseUser):
             # Name should be set.
             self.name = self.email.split("@")[0]
 
+        self.name_key = self.name.lower()
+
         super(User, self).save(*args, **kwargs)
 
     @property
@@ -198,10 +207,13 @@ class Profile(models.Model):
     uuid = models.CharField(null=False, db_index=True, unique=True, max_length=255)
 
     # The last visit by the user.
-    last_login = models.DateTimeField()
+    last_login = models.DateTimeField(db_index=True)
+
+    # The address of the last visit, used to guess the location.
+    last_ip = models.GenericIPAddressField(null=True, blank=True)
 
     # The last visit by the user.
-    date_joined = models.DateTimeField()
+    date_joined = models.DateTimeField(db_index=True)
 
     # User provided location.
     location = models.CharField(default="", max_length=255, blank=True)
@@ -293,6 +305,81 @@ class Profile(models.Model):
             prof.save()
 
 
+class UserStats(models.Model):
+    """
+    Activity counters shown on the user pages. The signals in biostar.server.models
+    keep them up to date, rebuild() recomputes them from the data.
+    Deleted posts are not counted.
+    """
+    user = models.OneToOneField(User, primary_key=True, related_name="stats")
+
+    post_count = models.IntegerField(default=0)
+    question_count = models.IntegerField(default=0)
+    answer_count = models.IntegerField(default=0)
+    comment_count = models.IntegerField(default=0)
+
+    # Answers by the user that are accepted, either by a vote or by a moderator.
+    accepted_count = models.IntegerField(default=0)
+
+    # Upvotes received on the posts of the user.
+    vote_count = models.IntegerField(default=0)
+
+    award_count = models.IntegerField(default=0)
+
+    @classmethod
+    def add(cls, user_id, fields, change=1):
+        "Changes the counters of a user"
+        if not fields:
+            return
+        values = dict((field, models.F(field) + change) for field in fields)
+        cls.objects.filter(user_id=user_id).update(**values)
+
+    @classmethod
+    def rebuild(cls, ids=None):
+        "Recomputes the counters of the users with the ids, of all users when ids is None"
+        from biostar.apps.posts.models import Post, Vote
+        from biostar.apps.badges.models import Award
+        from django.db import transaction
+        from django.db.models import Count
+
+        def grouped(query, *keys):
+            if ids is not None:
+                query = query.filter(**{"%s__in" % keys[0]: ids})
+            return query.order_by().values_list(*keys).annotate(Count('id'))
+
+        users = User.objects.all() if ids is None else User.objects.filter(id__in=ids)
+        stats = dict((pk, cls(user_id=pk)) for pk in users.values_list("id", flat=True))
+
+        fields = {Post.QUESTION: "question_count", Post.ANSWER: "answer_count", Post.COMMENT: "comment_count"}
+        for author_id, ptype, count in grouped(Post.objects.exclude(status=Post.DELETED), "author_id", "type"):
+            if author_id in stats:
+                stats[author_id].post_count += count
+                if ptype in fields:
+                    setattr(stats[author_id], fields[ptype], count)
+
+        accepted = Post.objects.filter(type=Post.ANSWER, has_accepted=True).exclude(status=Post.DELETED)
+        counts = [
+            ("vote_count", grouped(Vote.objects.filter(type=Vote.UP), "post__author_id")),
+            ("accepted_count", grouped(accepted, "author_id")),
+            ("award_count", grouped(Award.objects.all(), "user_id")),
+        ]
+        for field, query in counts:
+            for pk, count in query:
+                if pk in stats:
+                    setattr(stats[pk], field, count)
+
+        with transaction.atomic():
+            stale = cls.objects.all() if ids is None else cls.objects.filter(user_id__in=ids)
+            stale.delete()
+            cls.objects.bulk_create(stats.values(), batch_size=500)
+
+    @staticmethod
+    def auto_create(sender, instance, created, *args, **kwargs):
+        "Should run on every user creation."
+        if created:
+            UserStats.objects.get_or_create(user=instance)
+
+
 class UserCreationForm(forms.ModelForm):
     """A form for creating new users."""
     password1 = forms.CharField(label='Password', widget=forms.PasswordInput)
@@ -374,6 +461,7 @@ admin.site.register(User, BiostarUserAdmin)
 from django.db.models.signals import post_save
 
 post_save.connect(Profile.auto_create, sender=User)
+post_save.connect(UserStats.auto_create, sender=User)
 
 NEW_USER_WELCOME_TEMPLATE = "messages/new_user_welcome.html"
 
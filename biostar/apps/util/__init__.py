@@ -46,4 +46,18 @@ def decode(text, digest, key):
 
 def always_true(*args, **kwargs):
     "A helper we can substitue into any conditional function call"
-    return True
\ No newline at end of file
+    return True
+
+
+def worker_pool(workers):
+    """
+    A process pool for the management commands. The database connection is closed
+    before forking, otherwise the workers share its socket with the parent and the
+    first worker that closes it ends the session of the parent. Both sides reconnect
+    when they need the database.
+    """
+    from multiprocessing import Pool
+    from django.db import connection
+
+    connection.close()
+    return Pool(workers)
@@ -0,0 +1,123 @@
+"""
+Country lookup from a local IP range database.
+
+The database is a csv file (optionally gzipped) with one range per line:
+the first two columns hold the start and end of the range, either as integers
+or dotted quads, the last column holds the country name. The free ip2location
+and GeoLite country csv files both follow this layout.
+"""
+import csv, gzip, logging, os, socket, struct
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Country names that mean the range is not assigned.
+UNKNOWN = set(["", "-", "unknown"])
+
+
+def ip_to_int(ip):
+    "Converts an IPv4 address into an integer, returns None for anything else"
+    if ip.isdigit():
+        return int(ip)
+    try:
+        return struct.unpack("!I", socket.inet_aton(ip))[0]
+    except (socket.error, struct.error):
+        return None
+
+
+class LRU(object):
+    "A dictionary that keeps the most recently used keys"
+
+    def __init__(self, size):
+        self.size = size
+        self.data = OrderedDict()
+
+    def get(self, key, default=None):
+        if key not in self.data:
+            return default
+        value = self.data.pop(key)
+        self.data[key] = value
+        return value
+
+    def set(self, key, value):
+        self.data.pop(key, None)
+        self.data[key] = value
+        if len(self.data) > self.size:
+            self.data.popitem(last=False)
+
+
+class GeoIP(object):
+    """
+    The ranges are kept in sorted arrays and looked up by binary search,
+    recent addresses are answered from an LRU cache.
+    """
+
+    def __init__(self, rows, cache_size=10000):
+        rows = sorted(rows)
+        self.starts = array('L', (row[0] for row in rows))
+        self.ends = array('L', (row[1] for row in rows))
+
+        # Each country name is stored once.
+        self.names, index = [], {}
+        self.countries = array('H')
+        for start, end, name in rows:
+            if name not in index:
+                index[name] = len(self.names)
+                self.names.append(name)
+            self.countries.append(index[name])
+
+        self.cache = LRU(cache_size)
+
+    @classmethod
+    def load(cls, fname, cache_size=10000):
+        stream = gzip.open(fname, 'rb') if fname.endswith(".gz") else open(fname, 'rb')
+        rows = []
+        for row in csv.reader(stream):
+            if len(row) < 3:
+                continue
+            start, end, name = ip_to_int(row[0]), ip_to_int(row[1]), row[-1].strip()
+            if start is None or end is None or name.lower() in UNKNOWN:
+                continue
+            rows.append((start, end, name.title()))
+        stream.close()
+        logger.info("loaded %s ip ranges from %s" % (len(rows), fname))
+        return cls(rows, cache_size=cache_size)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def country(self, ip):
+        "Returns the country of an ip address or an empty string when unknown"
+        name = self.cache.get(ip)
+        if name is None:
+            name, value = '', ip_to_int(ip)
+            if value is not None:
+                pos = bisect_right(self.starts, value) - 1
+                if pos >= 0 and value <= self.ends[pos]:
+                    name = self.names[self.countries[pos]]
+            self.cache.set(ip, name)
+        return name
+
+
+DATABASE = None
+
+
+def get_database():
+    "The database is loaded once per process, None when there is no database file"
+    global DATABASE
+    if DATABASE is None:
+        fname = settings.GEOIP_DATABASE
+        if not os.path.isfile(fname):
+            logger.warning("geoip database %s not found" % fname)
+            return None
+        DATABASE = GeoIP.load(fname, cache_size=settings.GEOIP_CACHE_SIZE)
+    return DATABASE
+
+
+def country(ip):
+    "Returns the country of an ip address or an empty string when unknown"
+    database = get_database()
+    return database.country(ip) if database else ''
@@ -31,31 +31,36 @@ def init_awards():
 
 @app.task
 # Tries to award a badge to the user
-def check_user_profile(ip, user):
-    import urllib2, json
-    logger.info("profile check from %s on %s" % (ip, user))
-    if not user.profile.location:
-        try:
-            url = "http://api.hostip.info/get_json.php?ip=%s" % ip
-            logger.info("%s, %s, %s" % (ip, user, url))
-            f = urllib2.urlopen(url, timeout=3)
-            data = json.loads(f.read())
-            f.close()
-            location = data.get('country_name', '').title()
-            if "unknown" not in location.lower():
-                user.profile.location = location
-                user.profile.save()
-        except Exception, exc:
-            logger.error(exc)
+def check_user_profile(ip, user_id=None, user=None):
+    from biostar.apps.users.models import Profile
+    from biostar.apps.posts.models import Change
+    from biostar.apps.util import geoip
+
+    # Tasks queued by the previous release pass the user.
+    if user is not None:
+        user_id = user.id
+
+    logger.info("profile check from %s on %s" % (ip, user_id))
+    location = geoip.country(ip)
+    if location and Profile.objects.filter(user_id=user_id, location="").update(location=location):
+        Change.log(Change.USER, [user_id])
 
 @app.task
 # Tries to award a badge to the user
-def create_user_award(user):
+def create_user_award(user_id=None, user=None):
     from biostar.apps.users.models import User
     from biostar.apps.posts.models import Post
     from biostar.apps.badges.models import Badge, Award
     from biostar.apps.badges.award_defs import ALL_AWARDS
 
+    # Tasks queued by the previous release pass the user.
+    if user is not None:
+        user_id = user.id
+
+    user = User.objects.filter(pk=user_id).select_related('profile').first()
+    if not user:
+        return
+
     logger.info("award check for %s" % user)
 
     # Update user status.
@@ -21,6 +21,50 @@ app.autodiscover_tasks(
 )
 
 
+# How long the task counters are kept.
+METER_SECONDS = 7 * 24 * 60 * 60
+
+
+def meter(name, event):
+    "Counts task events in the cache"
+    from django.core.cache import cache
+    key = "tasks-%s-%s" % (name, event)
+    if not cache.add(key, 1, METER_SECONDS):
+        try:
+            cache.incr(key)
+        except ValueError:
+            # The counter expired in the meantime.
+            cache.add(key, 1, METER_SECONDS)
+
+
+def task_meter(name):
+    "Returns the number of sent and dropped calls of a debounced task"
+    from django.core.cache import cache
+    return dict((event, cache.get("tasks-%s-%s" % (name, event), 0)) for event in ("sent", "dropped"))
+
+
+def debounce(task, key, *args, **kwargs):
+    """
+    Enqueues a task at most once per key within the window set in TASK_DEBOUNCE_SECONDS.
+    The marker is kept in the cache, calls that find the marker are dropped.
+    """
+    from django.core.cache import cache
+    name = task.name.split(".")[-1]
+    window = settings.TASK_DEBOUNCE_SECONDS.get(name, settings.SESSION_UPDATE_SECONDS)
+    marker = "debounce-%s-%s" % (name, key)
+    if not cache.add(marker, 1, window):
+        meter(name, "dropped")
+        return None
+    try:
+        result = task.delay(*args, **kwargs)
+    except Exception:
+        # The task never reached the broker, the next call may enqueue it.
+        cache.delete(marker)
+        raise
+    meter(name, "sent")
+    return result
+
+
 @app.task
 def post_created(user):
     "Executed on a post creation"
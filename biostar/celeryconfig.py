@@ -18,6 +18,17 @@ CELERYBEAT_SCHEDULE = {
         'kwargs': dict(name="prune_data")
     },
 
+    'daily_stats': {
+        'task': 'biostar.celery.call_command',
+        'schedule': crontab(hour=0, minute=30),
+        'args': ["daily_stats"],
+    },
+
+    'email_queue': {
+        'task': 'biostar.mailer.send_queued_emails',
+        'schedule': timedelta(minutes=1),
+    },
+
     'sitemap': {
         'task': 'biostar.celery.call_command',
         'schedule': timedelta(hours=6),
@@ -1,6 +1,8 @@
 from __future__ import absolute_import
 import smtplib
 import logging
+import time
+from datetime import timedelta
 from django.conf import settings
 from django.core.mail.utils import DNS_NAME
 from django.core.mail.backends import smtp
@@ -28,6 +30,18 @@ TASK_CONFIG = {
 }
 TASK_CONFIG.update(CONFIG)
 
+# The number of messages sent by a single task over one connection.
+CHUNK_SIZE = getattr(settings, 'CELERY_EMAIL_CHUNK_SIZE', 50)
+
+# The number of queued emails sent by one run of the queue.
+QUEUE_BATCH_SIZE = getattr(settings, 'EMAIL_QUEUE_BATCH_SIZE', 100)
+
+# Queued emails are given up after this many attempts.
+QUEUE_MAX_ATTEMPTS = getattr(settings, 'EMAIL_QUEUE_MAX_ATTEMPTS', 8)
+
+# An email that is being sent for longer than this is considered lost.
+QUEUE_LEASE = timedelta(minutes=30)
+
 @app.task
 def send_email(message, **kwargs):
 
@@ -42,6 +56,94 @@ def send_email(message, **kwargs):
                      message.from_email, message.to, e)
         #send_email.retry(exc=e)
 
+@app.task
+def send_emails(messages, **kwargs):
+    """
+    Sends a chunk of messages over a single connection. Reports the
+    time taken by the chunk and the recipients that have failed.
+    """
+    conn = get_connection(backend=BACKEND,
+                          **kwargs.pop('_backend_init_kwargs', {}))
+    start, sent, failed = time.time(), 0, []
+    for message in messages:
+        try:
+            # Opens the connection unless it is already open.
+            conn.open()
+            sent += conn.send_messages([message]) or 0
+        except Exception as e:
+            logger.error("Error sending email from %s to %r: %s",
+                         message.from_email, message.to, e)
+            failed.append(message.to)
+            # The connection may be broken, reopen it for the next message.
+            try:
+                conn.close()
+            except Exception:
+                pass
+    conn.close()
+    logger.info("send_emails sent %s of %s messages in %.2f seconds, failed: %s",
+                sent, len(messages), time.time() - start, len(failed))
+    if failed:
+        logger.warning("send_emails failed recipients %r", failed)
+    return sent
+
+
+def queue_backend():
+    "The queue sends directly, not through yet another celery task"
+    if settings.EMAIL_BACKEND == 'biostar.mailer.CeleryEmailBackend':
+        return BACKEND
+    return settings.EMAIL_BACKEND
+
+@app.task
+def send_queued_emails(batch_size=None):
+    """
+    Sends the queued emails that are due, oldest first, over one connection.
+    Emails are claimed one by one so that concurrent runs never send the same
+    email. Returns the number of emails sent.
+    """
+    from biostar.apps.messages.models import QueuedEmail, now
+    from django.db.models import Q
+
+    batch_size = batch_size or QUEUE_BATCH_SIZE
+    due = QueuedEmail.objects.filter(Q(state=QueuedEmail.PENDING) | Q(state=QueuedEmail.SENDING),
+                                     next_attempt__lte=now()).order_by('next_attempt')
+
+    conn = get_connection(backend=queue_backend())
+    start, sent, failed = time.time(), 0, 0
+    for entry in due[:batch_size]:
+        lease = now() + QUEUE_LEASE
+        claimed = QueuedEmail.objects.filter(id=entry.id, state=entry.state, next_attempt=entry.next_attempt) \
+            .update(state=QueuedEmail.SENDING, next_attempt=lease)
+        if not claimed:
+            continue
+
+        entry.attempts += 1
+        try:
+            conn.open()
+            conn.send_messages([entry.message()])
+            entry.state, entry.sent_at, entry.error = QueuedEmail.SENT, now(), ''
+            sent += 1
+        except Exception as e:
+            logger.error("Error sending queued email %s to %s: %s", entry.key, entry.to, e)
+            entry.error = "%s" % e
+            if entry.attempts >= QUEUE_MAX_ATTEMPTS:
+                entry.state = QueuedEmail.FAILED
+            else:
+                entry.state, entry.next_attempt = QueuedEmail.PENDING, now() + entry.retry_delay()
+            failed += 1
+            # The connection may be broken, reopen it for the next message.
+            try:
+                conn.close()
+            except Exception:
+                pass
+        QueuedEmail.objects.filter(id=entry.id).update(state=entry.state, attempts=entry.attempts,
+                                                       next_attempt=entry.next_attempt, sent_at=entry.sent_at,
+                                                       error=entry.error)
+    conn.close()
+    if sent or failed:
+        logger.info("send_queued_emails sent %s, failed %s in %.2f seconds", sent, failed, time.time() - start)
+    return sent
+
+
 class SSLEmailBackend(smtp.EmailBackend):
     "Required for Amazon SES"
     def __init__(self, *args, **kwargs):
@@ -68,9 +170,11 @@ class CeleryEmailBackend(BaseEmailBackend):
         self.init_kwargs = kwargs
 
     def send_messages(self, email_messages, **kwargs):
+        "Groups the messages into chunks, each chunk is sent by one task"
         logger.debug("send_messages %s" % len(email_messages))
         results = []
         kwargs['_backend_init_kwargs'] = self.init_kwargs
-        for msg in email_messages:
-            results.append(send_email.delay(msg, **kwargs))
+        for i in range(0, len(email_messages), CHUNK_SIZE):
+            chunk = email_messages[i:i + CHUNK_SIZE]
+            results.append(send_emails.delay(chunk, **kwargs))
         return results
\ No newline at end of file
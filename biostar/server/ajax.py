@@ -1,8 +1,8 @@
 __author__ = 'ialbert'
 import json, traceback, logging
 from braces.views import JSONResponseMixin
-from biostar.apps.posts.models import Post, Vote
-from biostar.apps.users.models import User
+from biostar.apps.posts.models import Post, Vote, Change
+from biostar.apps.users.models import User, UserStats
 from django.views.generic import View
 from django.shortcuts import render_to_response, render
 from django.http import HttpResponse, HttpResponseRedirect, HttpResponsePermanentRedirect, Http404
@@ -82,6 +82,10 @@ def perform_vote(post, user, vote_type):
         Post.objects.filter(pk=post.root_id).update(subs_count=F('subs_count') + change)
 
     elif vote_type == Vote.ACCEPT:
+        if post.type == Post.ANSWER and post.status != Post.DELETED and post.has_accepted != (change > 0):
+            # The acceptance bypasses the save signals that keep the user stats.
+            UserStats.add(post.author_id, ["accepted_count"], change)
+
         if change > 0:
             # There does not seem to be a negation operator for F objects.
             Post.objects.filter(pk=post.id).update(vote_count=F('vote_count') + change, has_accepted=True)
@@ -95,6 +99,11 @@ def perform_vote(post, user, vote_type):
     else:
         Post.objects.filter(pk=post.id).update(vote_count=F('vote_count') + change)
 
+    # The counts above bypass the save signals.
+    Change.log(Change.POST, set([post.id, post.root_id]))
+    if post.author != user:
+        Change.log(Change.USER, [post.author.id])
+
     # Clear old votes.
     if votes:
         votes.delete()
@@ -1,17 +1,24 @@
 import json
 import logging
+import hashlib
+from collections import defaultdict
 from datetime import datetime, timedelta
 from calendar import timegm
-from os.path import join, normpath, isfile, exists
-from os import makedirs
 
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse, Http404
+from django.core.urlresolvers import reverse
 from django.contrib.sites.models import get_current_site
 from django.conf import settings
 from django.core.cache import get_cache
+from django.db import connection, transaction, IntegrityError
+from django.db.models import Count, Max, Q
+from django.views.decorators.gzip import gzip_page
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import urlencode
 
-from ..apps.users.models import User
-from ..apps.posts.models import Vote, Post, PostView
+from ..apps.users.models import User, Profile
+from ..apps.posts.models import Vote, Post, PostView, DailyStats, Change
 
 
 logger = logging.getLogger(__name__)
@@ -28,7 +35,7 @@ def json_response(f):
         Creates the actual HttpResponse with json content.
         """
         data = f(request, *args, **kwargs)
-        response = HttpResponse(json.dumps(data, sort_keys=True, indent=4),
+        response = HttpResponse(json.dumps(data, separators=(',', ':')),
                                 content_type="application/json")
         if not data:
             response.status_code = 404
@@ -83,6 +90,83 @@ def user_details(request, id):
     return data
 
 
+# The post columns fetched in a single query, along with the related author and root.
+POST_VALUES = [
+    'id', 'title', 'type', 'status', 'creation_date', 'lastedit_date', 'lastedit_user', 'author',
+    'author__name', 'thread_score', 'rank', 'vote_count', 'view_count', 'reply_count',
+    'comment_count', 'book_count', 'subs_count', 'root__reply_count', 'has_accepted', 'parent',
+    'root', 'html', 'tag_val',
+]
+
+VOTE_VALUES = ['id', 'author', 'author__name', 'post', 'type', 'date']
+
+POST_TYPE_MAP = dict(Post.TYPE_CHOICES)
+POST_STATUS_MAP = dict(Post.STATUS_CHOICES)
+VOTE_TYPE_MAP = dict(Vote.TYPE_CHOICES)
+
+
+def post_to_data(row, domain):
+    """
+    Converts the values of a post to the data returned by the api.
+
+    Parameters:
+    row -- a dictionary with the `POST_VALUES` of a post.
+    domain -- the domain of the site.
+    """
+    url = reverse("post-details", kwargs=dict(pk=row['root']))
+    if row['type'] not in Post.TOP_LEVEL:
+        url = "%s#%s" % (url, row['id'])
+
+    data = {
+        'id': row['id'],
+        'title': row['title'],
+        'type': POST_TYPE_MAP.get(row['type']),
+        'type_id': row['type'],
+        'creation_date': datetime_to_iso(row['creation_date']),
+        'lastedit_date': datetime_to_iso(row['lastedit_date']),
+        'lastedit_user_id': row['lastedit_user'],
+        'author_id': row['author'],
+        'author': row['author__name'],
+        'status': POST_STATUS_MAP.get(row['status']),
+        'status_id': row['status'],
+        'thread_score': row['thread_score'],
+        'rank': row['rank'],
+        'vote_count': row['vote_count'],
+        'view_count': row['view_count'],
+        'reply_count': row['reply_count'],
+        'comment_count': row['comment_count'],
+        'book_count': row['book_count'],
+        'subs_count': row['subs_count'],
+        'answer_count': row['root__reply_count'],
+        'has_accepted': row['has_accepted'],
+        'parent_id': row['parent'],
+        'root_id': row['root'],
+        'xhtml': row['html'],
+        'tag_val': row['tag_val'],
+        'url': 'http://{}{}'.format(domain, url),
+    }
+    return data
+
+
+def vote_to_data(row):
+    """
+    Converts the values of a vote to the data returned by the api.
+
+    Parameters:
+    row -- a dictionary with the `VOTE_VALUES` of a vote.
+    """
+    data = {
+        'id': row['id'],
+        'author_id': row['author'],
+        'author': row['author__name'],
+        'post_id': row['post'],
+        'type': VOTE_TYPE_MAP.get(row['type']),
+        'type_id': row['type'],
+        'date': datetime_to_iso(row['date']),
+    }
+    return data
+
+
 @json_response
 def post_details(request, id):
     """
@@ -91,40 +175,10 @@ def post_details(request, id):
     Parameters:
     id -- the id of the `Post`.
     """
-    try:
-        post = Post.objects.get(pk=id)
-    except Post.DoesNotExist:
+    rows = Post.objects.filter(pk=id).values(*POST_VALUES)
+    if not rows:
         return {}
-
-    data = {
-        'id': post.id,
-        'title': post.title,
-        'type': post.get_type_display(),
-        'type_id': post.type,
-        'creation_date': datetime_to_iso(post.creation_date),
-        'lastedit_date': datetime_to_iso(post.lastedit_date),
-        'lastedit_user_id': post.lastedit_user.id,
-        'author_id': post.author.id,
-        'author': post.author.name,
-        'status': post.get_status_display(),
-        'status_id': post.status,
-        'thread_score': post.thread_score,
-        'rank': post.rank,
-        'vote_count': post.vote_count,
-        'view_count': post.view_count,
-        'reply_count': post.reply_count,
-        'comment_count': post.comment_count,
-        'book_count': post.book_count,
-        'subs_count': post.subs_count,
-        'answer_count': post.root.reply_count,
-        'has_accepted': post.has_accepted,
-        'parent_id': post.parent.id,
-        'root_id': post.root_id,
-        'xhtml': post.html,
-        'tag_val': post.tag_val,
-        'url': 'http://{}{}'.format(get_current_site(request).domain, post.get_absolute_url()),
-    }
-    return data
+    return post_to_data(rows[0], get_current_site(request).domain)
 
 
 @json_response
@@ -135,21 +189,10 @@ def vote_details(request, id):
     Parameters:
     id -- the id of the `Vote`.
     """
-    try:
-        vote = Vote.objects.get(pk=id)
-    except Vote.DoesNotExist:
+    rows = Vote.objects.filter(pk=id).values(*VOTE_VALUES)
+    if not rows:
         return {}
-
-    data = {
-        'id': vote.id,
-        'author_id': vote.author.id,
-        'author': vote.author.name,
-        'post_id': vote.post.id,
-        'type': vote.get_type_display(),
-        'type_id': vote.type,
-        'date': datetime_to_iso(vote.date),
-    }
-    return data
+    return vote_to_data(rows[0])
 
 
 @json_response
@@ -179,116 +222,429 @@ def daily_stats_on_date(request, year, month, day):
     month -- Month, 2 digits.
     day -- Day, 2 digits.
     """
-    date = datetime(int(year), int(month), int(day))
+    try:
+        date = datetime(int(year), int(month), int(day))
+    except ValueError:
+        return {}
     # We don't provide stats for today or the future.
     if date.date() >= datetime.today().date():
         return {}
     return compute_stats(date)
 
 
-## Statistics #####################################################################################
+# The metrics returned by the stats range endpoint, one array each.
+STATS_RANGE_FIELDS = ['questions', 'answers', 'toplevel', 'comments', 'votes', 'users',
+                      'new_users', 'new_posts', 'new_votes']
 
-STATS_FOLDER = normpath(join(settings.EXPORT_DIR, 'stats'))
 
+@gzip_page
+def daily_stats_range(request, start, end):
+    """
+    Statistics about this website for a range of dates, both ends included.
+    The data is columnar: one array per metric, each with an entry per day.
+    Only days that have been rolled up are returned.
 
-def compute_stats(date):
+    Parameters:
+    start -- the first date, formatted as YYYY-MM-DD.
+    end -- the last date, formatted as YYYY-MM-DD.
     """
-    Statistics about this website for the given date.
-    Statistics are stored to a json file for caching purpose.
+    try:
+        start, end = parse_date(start), parse_date(end)
+    except ValueError:
+        # Well formatted but not a valid date, like 2014-02-30.
+        raise Http404
+    if not (start and end) or start > end:
+        raise Http404
+
+    query = DailyStats.objects.filter(date__gte=start, date__lte=end)
+
+    # The rows change only when the days are recomputed, that also changes their ids.
+    info = query.aggregate(count=Count('id'), last=Max('id'))
+    etag = '"%s"' % hashlib.md5('{}-{}-{count}-{last}'.format(start, end, **info)).hexdigest()
+
+    # The gzip middleware marks the etags of compressed responses.
+    etags = request.META.get('HTTP_IF_NONE_MATCH', '')
+    etags = [e.strip().replace(';gzip"', '"') for e in etags.split(',')]
+    if etag in etags:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    data = dict(start=datetime_to_iso(start), end=datetime_to_iso(end), date=[], timestamp=[])
+    for field in STATS_RANGE_FIELDS:
+        data[field] = []
+
+    for stats in query.order_by('date'):
+        row = stats_to_data(stats)
+        data['date'].append(row['date'])
+        data['timestamp'].append(row['timestamp'])
+        for field in STATS_RANGE_FIELDS:
+            data[field].append(row[field])
+
+    response = HttpResponse(json.dumps(data, separators=(',', ':')), content_type="application/json")
+    response['ETag'] = etag
+    return response
+
+
+## Bulk access ####################################################################################
+
+def json_lines(objects):
+    """
+    Streams each object as compact json on a separate line.
+    """
+    for obj in objects:
+        yield json.dumps(obj, separators=(',', ':')) + '\n'
+
+
+def json_lines_response(objects):
+    return StreamingHttpResponse(json_lines(objects), content_type="application/x-ndjson")
+
+
+def since_to_datetime(timestamp):
+    """
+    Converts a Unix timestamp to an aware datetime.
+    """
+    return datetime.utcfromtimestamp(float(timestamp)).replace(tzinfo=timezone.utc)
+
+
+def post_list(request):
+    """
+    Details for multiple posts, one post per line.
 
     Parameters:
-    date -- a `datetime`.
+    ids -- comma separated ids of the posts, passed as a GET parameter.
     """
+    ids = request.GET.get('ids', '').split(',')
+    ids = [int(pk) for pk in ids if pk.strip().isdigit()][:settings.API_BULK_LIMIT]
 
-    start = date.date()
-    end = start + timedelta(days=1)
+    domain = get_current_site(request).domain
+    rows = Post.objects.filter(pk__in=ids).order_by('id').values(*POST_VALUES)
+    return json_lines_response(post_to_data(row, domain) for row in rows.iterator())
 
-    try:
-        return load_stats_from_file(start)
-    except IOError:  # This will be FileNotFoundError in Python3.
-        logger.info('No stats file for {}.'.format(start))
 
-    query = Post.objects.filter
+def since_page(request, query, field, timestamp):
+    """
+    Selects the rows changed since a timestamp, ordered by the date field and the id.
+    Returns at most `API_BULK_LIMIT` rows and the continuation of the page, None on the last page.
 
-    questions = query(type=Post.QUESTION, creation_date__lt=end).count()
-    answers = query(type=Post.ANSWER, creation_date__lt=end).count()
-    toplevel = query(type__in=Post.TOP_LEVEL, creation_date__lt=end).exclude(
-        type=Post.BLOG).count()
-    comments = query(type=Post.COMMENT, creation_date__lt=end).count()
-    votes = Vote.objects.filter(date__lt=end).count()
-    users = User.objects.filter(profile__date_joined__lt=end).count()
+    Many rows may share a second, so a page is continued from the exact date and the
+    id of its last row, passed as the `after` GET parameter in the form `<iso date>,<id>`.
+    """
+    limit = settings.API_BULK_LIMIT
+    query = query.filter(**{field + '__gte': since_to_datetime(timestamp)})
+
+    after = request.GET.get('after')
+    if after:
+        try:
+            date, pk = after.rsplit(',', 1)
+            date, pk = parse_datetime(date), int(pk)
+        except ValueError:
+            raise Http404
+        if not date:
+            raise Http404
+        query = query.filter(Q(**{field + '__gt': date}) | Q(**{field: date, 'id__gt': pk}))
+
+    rows = list(query.order_by(field, 'id')[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, '%s,%s' % (datetime_to_iso(last[field]), last['id'])
+
+
+def since_response(request, objects, after):
+    """
+    Streams the objects, the url of the next page is sent in the `X-Next-Page` header.
+    """
+    response = json_lines_response(objects)
+    if after:
+        response['X-Next-Page'] = '%s?%s' % (request.path, urlencode(dict(after=after)))
+    return response
 
-    new_users = User.objects.filter(profile__date_joined__gte=start, profile__date_joined__lt=end)
-    new_users_ids = [user.id for user in new_users]
 
-    new_posts = Post.objects.filter(creation_date__gte=start, creation_date__lt=end)
-    new_posts_ids = [post.id for post in new_posts]
+def posts_since(request, timestamp):
+    """
+    Details for the posts edited since a date, one post per line, the oldest first.
+    At most `API_BULK_LIMIT` posts are returned: fetch the url of the
+    `X-Next-Page` header for the rest, it is missing on the last page.
+
+    Parameters:
+    timestamp -- a Unix timestamp.
+    after -- the continuation of a previous page, passed as a GET parameter.
+    """
+    query = Post.objects.values(*POST_VALUES)
+    rows, after = since_page(request, query, 'lastedit_date', timestamp)
+
+    domain = get_current_site(request).domain
+    return since_response(request, (post_to_data(row, domain) for row in rows), after)
 
-    new_votes = Vote.objects.filter(date__gte=start, date__lt=end)
-    new_votes_ids = [vote.id for vote in new_votes]
+
+def votes_since(request, timestamp):
+    """
+    Details for the votes cast since a date, one vote per line, the oldest first.
+    At most `API_BULK_LIMIT` votes are returned: fetch the url of the
+    `X-Next-Page` header for the rest, it is missing on the last page.
+
+    Parameters:
+    timestamp -- a Unix timestamp.
+    after -- the continuation of a previous page, passed as a GET parameter.
+    """
+    query = Vote.objects.values(*VOTE_VALUES)
+    rows, after = since_page(request, query, 'date', timestamp)
+    return since_response(request, (vote_to_data(row) for row in rows), after)
+
+
+CHANGE_MODEL_MAP = dict(Change.MODEL_CHOICES)
+CHANGE_ACTION_MAP = dict(Change.ACTION_CHOICES)
+
+
+@json_response
+def changes_since(request, seq):
+    """
+    The changes recorded after a sequence number, the oldest first. At most
+    `API_BULK_LIMIT` changes are returned: continue from the `last` sequence
+    number while `more` is true. Changes younger than `CHANGE_LOG_LAG_SECONDS`
+    are held back until the changes logged before them have committed.
+
+    Parameters:
+    seq -- the last sequence number seen by the consumer, 0 to start.
+    """
+    seq = int(seq)
+    limit = settings.API_BULK_LIMIT
+
+    rows = Change.settled().filter(id__gt=seq).order_by('id')
+    rows = list(rows.values_list('id', 'model', 'object_id', 'action', 'date')[:limit + 1])
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    changes = [
+        {
+            'seq': pk,
+            'type': CHANGE_MODEL_MAP.get(model),
+            'id': object_id,
+            'action': CHANGE_ACTION_MAP.get(action),
+            'date': datetime_to_iso(date),
+        } for pk, model, object_id, action, date in rows
+    ]
 
     data = {
-        'date': datetime_to_iso(start),
-        'timestamp': datetime_to_unix(start),
-        'questions': questions,
-        'answers': answers,
-        'toplevel': toplevel,
-        'comments': comments,
-        'votes': votes,
-        'users': users,
-        'new_users': new_users_ids,
-        'new_posts': new_posts_ids,
-        'new_votes': new_votes_ids,
+        'since': seq,
+        'last': rows[-1][0] if rows else seq,
+        'more': more,
+        'changes': changes,
     }
-
-    if not settings.DEBUG:
-        dump_stats_to_file(start, data)
     return data
 
 
-def load_stats_from_file(date):
+## Statistics #####################################################################################
+
+def compute_stats(date):
     """
-    Load stats data from a stat file.
+    Statistics about this website for the given date.
+    Statistics are read from the daily rollup table. Days that have not been
+    rolled up yet are computed and stored in the table.
 
-    Params:
-    date -- a `datetime` instance.
+    Parameters:
+    date -- a `datetime`.
     """
-    file_path = _build_stats_file_path(date)
+    start = date.date()
 
-    if not isfile(file_path):
-        raise IOError  # This will be FileNotFoundError in Python3.
+    try:
+        stats = DailyStats.objects.get(date=start)
+    except DailyStats.DoesNotExist:
+        logger.info('No daily stats for {}.'.format(start))
+        stats = build_daily_stats(start)
+        if not settings.DEBUG:
+            try:
+                with transaction.atomic():
+                    stats.save()
+            except IntegrityError:
+                # Another request has stored the same day.
+                pass
+
+    return stats_to_data(stats)
+
+
+def stats_to_data(stats):
+    """
+    Converts a daily stats row to the data returned by the api.
 
-    with open(file_path, 'r') as fin:
-        return json.loads(fin.read())
+    Params:
+    stats -- a `DailyStats` instance.
+    """
+    data = {
+        'date': datetime_to_iso(stats.date),
+        'timestamp': datetime_to_unix(stats.date),
+        'questions': stats.questions,
+        'answers': stats.answers,
+        'toplevel': stats.toplevel,
+        'comments': stats.comments,
+        'votes': stats.votes,
+        'users': stats.users,
+        'new_users': DailyStats.split_ids(stats.new_users),
+        'new_posts': DailyStats.split_ids(stats.new_posts),
+        'new_votes': DailyStats.split_ids(stats.new_votes),
+    }
+    return data
 
 
-def dump_stats_to_file(date, data):
+def day_bounds(day):
     """
-    Store stats data to a json file for caching purpose.
+    The start and the end of a day in the default timezone.
 
     Params:
-    date -- a `datetime` instance.
-    data -- stats data in a dictionary.
+    day -- a `date` instance.
     """
-    if not exists(STATS_FOLDER):
-        # Ensure STATS_FOLDER exists.
-        makedirs(STATS_FOLDER)
+    tz = timezone.get_default_timezone()
+    start = timezone.make_aware(datetime.combine(day, datetime.min.time()), tz)
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), datetime.min.time()), tz)
+    return start, end
 
-    file_path = _build_stats_file_path(date)
 
-    with open(file_path, 'w') as fout:
-        fout.write(json.dumps(data))
+def add_type_counts(stats, type_counts):
+    """
+    Adds post counts, given as a dictionary keyed by post type, to the totals of a stats row.
+    """
+    stats.questions += type_counts.get(Post.QUESTION, 0)
+    stats.answers += type_counts.get(Post.ANSWER, 0)
+    stats.comments += type_counts.get(Post.COMMENT, 0)
+    stats.toplevel += sum(type_counts.get(code, 0) for code in Post.TOP_LEVEL if code != Post.BLOG)
 
 
-def _build_stats_file_path(date):
+def build_daily_stats(day, previous=None):
     """
-    Build the path of a stat file from a date.
+    Builds the stats row for a single day. When the row of the previous day is
+    known the totals are obtained by adding the changes of the day to it,
+    otherwise the totals are counted from the beginning.
 
     Params:
-    date -- a `datetime` instance.
+    day -- a `date` instance.
+    previous -- the `DailyStats` of the day before, optional.
+    """
+    start, end = day_bounds(day)
+
+    new_users = User.objects.filter(profile__date_joined__gte=start, profile__date_joined__lt=end)
+    new_posts = Post.objects.filter(creation_date__gte=start, creation_date__lt=end)
+    new_votes = Vote.objects.filter(date__gte=start, date__lt=end)
+
+    user_ids = list(new_users.order_by('id').values_list('id', flat=True))
+    post_ids = list(new_posts.order_by('id').values_list('id', flat=True))
+    vote_ids = list(new_votes.order_by('id').values_list('id', flat=True))
+
+    stats = DailyStats(date=day)
+    stats.new_users = DailyStats.join_ids(user_ids)
+    stats.new_posts = DailyStats.join_ids(post_ids)
+    stats.new_votes = DailyStats.join_ids(vote_ids)
+
+    if previous:
+        posts = new_posts
+        for field in ('questions', 'answers', 'toplevel', 'comments', 'votes', 'users'):
+            setattr(stats, field, getattr(previous, field))
+        stats.votes += len(vote_ids)
+        stats.users += len(user_ids)
+    else:
+        posts = Post.objects.filter(creation_date__lt=end)
+        stats.votes = Vote.objects.filter(date__lt=end).count()
+        stats.users = User.objects.filter(profile__date_joined__lt=end).count()
+
+    type_counts = dict(posts.order_by().values_list('type').annotate(Count('id')))
+    add_type_counts(stats, type_counts)
+
+    return stats
+
+
+def update_daily_stats():
+    """
+    Rolls up every day that is missing since the first stored day. The api stores
+    the days it is asked for, so there may be gaps before the last stored day.
+    Runs nightly. Falls back to a full backfill when the table is empty.
+    """
+    stored = set(DailyStats.objects.values_list('date', flat=True))
+    if not stored:
+        return backfill_daily_stats()
+
+    # The days before the first gap are complete.
+    day = min(stored)
+    while day + timedelta(days=1) in stored:
+        day += timedelta(days=1)
+    previous = DailyStats.objects.get(date=day)
+
+    today = datetime.today().date()
+    day, count = day + timedelta(days=1), 0
+    while day < today:
+        if day in stored:
+            previous = DailyStats.objects.get(date=day)
+        else:
+            previous = build_daily_stats(day, previous=previous)
+            previous.save()
+            count += 1
+        day += timedelta(days=1)
+    return count
+
+
+def backfill_daily_stats():
+    """
+    Recomputes the stats of all days before today in a single run. The counts
+    are grouped by day in the database then summed up in date order.
     """
-    file_name = '{}-{}-{}.json'.format(date.year, date.month, date.day)
-    return normpath(join(STATS_FOLDER, file_name))
+    tzname = timezone.get_default_timezone_name()
+    qn = connection.ops.quote_name
+
+    def by_day(query, field):
+        "Adds the day of a datetime field as the extra column 'day'"
+        column = "%s.%s" % (qn(query.model._meta.db_table), qn(field))
+        sql, params = connection.ops.datetime_trunc_sql('day', column, tzname)
+        return query.order_by().extra(select={'day': sql}, select_params=params)
+
+    def to_date(value):
+        "The truncated day is a string on some backends"
+        if isinstance(value, datetime):
+            return value.date()
+        return parse_date(value[:10])
+
+    # Post counts by day and type.
+    type_counts = defaultdict(dict)
+    rows = by_day(Post.objects.all(), 'creation_date').values('day', 'type').annotate(count=Count('id'))
+    for row in rows:
+        type_counts[to_date(row['day'])][row['type']] = row['count']
+
+    # The ids created on each day.
+    new_ids = defaultdict(lambda: defaultdict(list))
+    queries = [
+        ('new_posts', by_day(Post.objects.all(), 'creation_date'), 'id'),
+        ('new_votes', by_day(Vote.objects.all(), 'date'), 'id'),
+        ('new_users', by_day(Profile.objects.all(), 'date_joined'), 'user'),
+    ]
+    for name, query, field in queries:
+        for day, pk in query.values_list('day', field).order_by(field).iterator():
+            new_ids[to_date(day)][name].append(pk)
+
+    days = set(type_counts) | set(new_ids)
+    if not days:
+        return 0
+
+    today = datetime.today().date()
+    day, rows = min(days), []
+    stats = DailyStats()
+    while day < today:
+        stats = DailyStats(date=day, questions=stats.questions, answers=stats.answers,
+                           toplevel=stats.toplevel, comments=stats.comments,
+                           votes=stats.votes, users=stats.users)
+        add_type_counts(stats, type_counts.get(day, {}))
+        ids = new_ids.get(day, {})
+        stats.votes += len(ids.get('new_votes', []))
+        stats.users += len(ids.get('new_users', []))
+        for name in ('new_posts', 'new_votes', 'new_users'):
+            setattr(stats, name, DailyStats.join_ids(ids.get(name, [])))
+        rows.append(stats)
+        day += timedelta(days=1)
+
+    with transaction.atomic():
+        DailyStats.objects.all().delete()
+        DailyStats.objects.bulk_create(rows, batch_size=500)
+
+    return len(rows)
 
 
 ## Date utils #####################################################################################
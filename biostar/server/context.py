@@ -82,7 +82,7 @@ def shortcuts(request):
         "RECENT_USERS": get_recent_users(),
         "RECENT_AWARDS": get_recent_awards(),
         'USE_COMPRESSOR': settings.USE_COMPRESSOR,
-        'COUNTS': request.session.get(settings.SESSION_KEY, {}),
+        'COUNTS': getattr(request, "counts", {}),
         'SITE_ADMINS': settings.ADMINS,
         'TOP_BANNER': settings.TOP_BANNER,
         'BANNER_TRIGGER': banner_trigger(request),
@@ -2,6 +2,10 @@ from __future__ import unicode_literals, absolute_import, print_function
 
 from django.contrib.syndication.views import Feed
 from django.shortcuts import get_object_or_404
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified, Http404
+from django.utils.http import http_date, parse_http_date_safe
 from biostar.apps.posts.models import Post
 from biostar.apps.users.models import User
 from biostar.apps.messages.models import Message
@@ -10,7 +14,8 @@ from biostar.apps.planet.models import BlogPost
 from django.conf import settings
 from django.contrib.sites.models import Site
 from datetime import datetime, timedelta
-import bleach
+from calendar import timegm
+import bleach, hashlib
 from biostar import const
 
 SITE = Site.objects.get(id=settings.SITE_ID)
@@ -18,6 +23,9 @@ SITE_NAME = settings.SITE_NAME
 
 FEED_COUNT = 25
 
+# How long is a rendered feed kept in the cache.
+FEED_CACHE_SECONDS = settings.FEED_CACHE_SECONDS
+
 
 def reduce_html(text):
     if len(text) > 1500:
@@ -31,7 +39,60 @@ def split(text):
     rows = text.split('+')
     return rows
 
-class PlanetFeed(Feed):
+class CachedFeed(Feed):
+    """
+    Keeps the rendered feed in the cache and answers conditional GET requests.
+
+    The cache is keyed by the feed type and the url parameters. The ETag
+    is formed from the same key and the timestamp of the newest item,
+    so feed readers that already have the content get a 304 without
+    the posts being queried or rendered again.
+    """
+
+    def cache_key(self, kwargs):
+        params = "&".join("%s=%s" % (k, v) for k, v in sorted(kwargs.items()))
+        digest = hashlib.md5(params.encode("utf-8")).hexdigest()
+        return "feed-%s-%s" % (self.__class__.__name__.lower(), digest)
+
+    def render(self, request, key, *args, **kwargs):
+        "Renders the feed and returns the data that is stored in the cache"
+        try:
+            obj = self.get_object(request, *args, **kwargs)
+        except ObjectDoesNotExist:
+            raise Http404('Feed object does not exist.')
+        feedgen = self.get_feed(obj, request)
+        stamp = timegm(feedgen.latest_post_date().utctimetuple())
+        etag = '"%s"' % hashlib.md5(("%s-%s" % (key, stamp)).encode("utf-8")).hexdigest()
+        content = feedgen.writeString('utf-8')
+        return dict(content=content, mime_type=feedgen.mime_type, etag=etag, stamp=stamp)
+
+    def not_modified(self, request, data):
+        "Checks the conditional headers sent by the client"
+        etags = request.META.get('HTTP_IF_NONE_MATCH')
+        if etags:
+            return data['etag'] in [e.strip() for e in etags.split(",")]
+        since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        return since is not None and data['stamp'] <= since
+
+    def __call__(self, request, *args, **kwargs):
+        key = self.cache_key(kwargs)
+        data = cache.get(key)
+
+        if not data:
+            data = self.render(request, key, *args, **kwargs)
+            cache.set(key, data, FEED_CACHE_SECONDS)
+
+        if self.not_modified(request, data):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(data['content'], content_type=data['mime_type'])
+
+        response['ETag'] = data['etag']
+        response['Last-Modified'] = http_date(data['stamp'])
+        return response
+
+
+class PlanetFeed(CachedFeed):
     "Latest posts"
     link = "/"
     FEED_COUNT = 50
@@ -51,12 +112,15 @@ class PlanetFeed(Feed):
     def item_guid(self, obj):
         return "%s" % obj.id
 
+    def item_pubdate(self, item):
+        return item.creation_date
+
     def items(self):
         posts = BlogPost.objects.select_related("blog").order_by('-creation_date')
         return posts[:FEED_COUNT]
 
 
-class PostBase(Feed):
+class PostBase(CachedFeed):
     "Forms the base class to any feed producing posts"
     link = "/"
     title = "title"
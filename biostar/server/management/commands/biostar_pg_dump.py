@@ -1,8 +1,13 @@
 """
 Dumps a postgresql database into a file
+
+The plain format streams the SQL through a compressor, the directory format lets
+pg_dump write the tables in parallel. Databases other than postgresql are dumped
+with the Django serializer. Every dump is recorded in a manifest with its size,
+duration and checksum, and older daily dumps are rotated out.
 """
 
-import os
+import os, time, json, gzip, shutil, hashlib, subprocess
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 from datetime import datetime
@@ -13,6 +18,24 @@ import logging
 
 logger = logging.getLogger("command")
 
+MANIFEST = "manifest.json"
+
+# The apps that the serializer fallback dumps.
+APPS = "users posts messages badges planet".split()
+
+# The serializer fallback writes this many objects per line.
+SERIALIZER_BATCH = 1000
+
+FORMATS = ("plain", "directory")
+
+# File extensions of the common compressors.
+EXTENSIONS = dict(gzip="gz", pigz="gz", bzip2="bz2", pbzip2="bz2", xz="xz", pxz="xz", zstd="zst")
+
+BACKUP_FORMAT = getattr(settings, 'BACKUP_FORMAT', 'plain')
+BACKUP_COMPRESSOR = getattr(settings, 'BACKUP_COMPRESSOR', 'gzip')
+BACKUP_JOBS = getattr(settings, 'BACKUP_JOBS', 4)
+BACKUP_KEEP = getattr(settings, 'BACKUP_KEEP', 14)
+
 
 def abspath(*args):
     """Generates absolute paths"""
@@ -27,6 +50,14 @@ class Command(BaseCommand):
         make_option('-u', dest='pg_user', default="www", help='postgres user default=%default'),
         make_option('-p', dest='prog', default="/usr/bin/pg_dump", help='the postgres program default=%default'),
         make_option('-o', dest='outdir', default="~/data/", help='output directory default=%default'),
+        make_option('-F', '--format', dest='format', default=BACKUP_FORMAT, choices=FORMATS,
+                    help='plain or directory format default=%default'),
+        make_option('-j', '--jobs', dest='jobs', default=BACKUP_JOBS, type=int,
+                    help='parallel jobs for the directory format default=%default'),
+        make_option('-z', '--compress', dest='compress', default=BACKUP_COMPRESSOR,
+                    help='compressor command for the plain format default=%default'),
+        make_option('-k', '--keep', dest='keep', default=BACKUP_KEEP, type=int,
+                    help='number of daily dumps to keep, 0 keeps all default=%default'),
     )
 
     def handle(self, *args, **options):
@@ -34,10 +65,121 @@ class Command(BaseCommand):
         prog = options['prog']
         hourly = options['hourly']
         outdir = options['outdir']
-        main(pg_user=pg_user, hourly=hourly, prog=prog, outdir=outdir)
+        main(pg_user=pg_user, hourly=hourly, prog=prog, outdir=outdir, format=options['format'],
+             jobs=options['jobs'], compress=options['compress'], keep=options['keep'])
+
+
+def is_postgres():
+    return 'postgresql' in settings.DATABASES['default']['ENGINE']
 
 
-def main(pg_user, hourly, prog, outdir):
+def checksum(path):
+    """The md5 of a file, or of all files of a directory in name order"""
+    md5 = hashlib.md5()
+    if os.path.isdir(path):
+        fnames = [abspath(path, fname) for fname in sorted(os.listdir(path))]
+    else:
+        fnames = [path]
+    for fname in fnames:
+        with open(fname, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(1024 * 1024), ''):
+                md5.update(chunk)
+    return md5.hexdigest()
+
+
+def disk_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(abspath(path, fname)) for fname in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def read_manifest(outdir):
+    fname = abspath(outdir, MANIFEST)
+    if not os.path.isfile(fname):
+        return dict(dumps=[])
+    return json.load(open(fname))
+
+
+def write_manifest(outdir, manifest):
+    fname = abspath(outdir, MANIFEST)
+    temp = fname + ".tmp"
+    with open(temp, 'wt') as fp:
+        json.dump(manifest, fp, indent=2)
+    os.rename(temp, fname)
+
+
+def run(*cmds, **kwds):
+    """
+    Runs the commands as a pipeline, the first one reads from the input file and
+    the last one writes into the output file. Raises CommandError when any of them fails.
+    """
+    output = kwds.get("output")
+    logger.info("%s" % " | ".join(" ".join(cmd) for cmd in cmds))
+    procs, stdin = [], kwds.get("input")
+    for index, cmd in enumerate(cmds):
+        last = index == len(cmds) - 1
+        stdout = output if last else subprocess.PIPE
+        proc = subprocess.Popen(cmd, stdin=stdin, stdout=stdout)
+        if index:
+            # Lets the earlier process receive SIGPIPE if the later one exits.
+            stdin.close()
+        stdin = proc.stdout
+        procs.append(proc)
+    codes = [proc.wait() for proc in procs]
+    if any(codes):
+        raise CommandError("command failed with exit codes %s" % codes)
+
+
+def pg_dump(prog, pg_user, pg_name, path, format, jobs, compress):
+    if format == "directory":
+        run([prog, "-Fd", "-j", str(jobs), "-x", "-O", "-b", "-U", pg_user, "-f", path, pg_name])
+    else:
+        with open(path, 'wb') as fp:
+            run([prog, "-Fp", "-x", "-O", "-b", "-U", pg_user, pg_name], compress.split(), output=fp)
+
+
+def serializer_dump(path):
+    """
+    Streams the tables with the Django serializer. Each line is a JSON list of objects
+    of the same model so that the restore never loads more than one line at a time.
+    """
+    from django.core import serializers
+    from django.core.management.commands.dumpdata import sort_dependencies
+    from django.db.models import get_app
+
+    models = sort_dependencies([(get_app(label), None) for label in APPS])
+    with gzip.open(path, 'wb') as fp:
+        for model in models:
+            batch = []
+            for obj in model._default_manager.order_by('pk').iterator():
+                batch.append(obj)
+                if len(batch) == SERIALIZER_BATCH:
+                    fp.write(serializers.serialize("json", batch) + "\n")
+                    batch = []
+            if batch:
+                fp.write(serializers.serialize("json", batch) + "\n")
+
+
+def rotate(outdir, manifest, keep):
+    """Removes all but the latest daily dumps"""
+    if not keep:
+        return
+    daily = [entry for entry in manifest['dumps'] if not entry['hourly']]
+    daily.sort(key=lambda entry: entry['date'], reverse=True)
+    for entry in daily[keep:]:
+        logger.info("removing %s" % entry['name'])
+        remove(abspath(outdir, entry['name']))
+        manifest['dumps'].remove(entry)
+
+
+def main(pg_user, hourly, prog, outdir, format="plain", jobs=4, compress="gzip", keep=0):
     # Get the full path to the directory.
     outdir = os.path.expanduser(outdir)
     if not os.path.isdir(outdir):
@@ -54,26 +196,45 @@ def main(pg_user, hourly, prog, outdir):
         # These names include the date.
         tstamp = datetime.now().strftime("%Y-%m-%d")
 
-    db_file = "%s-%s-%s.sql.gz" % (pg_name, biostar.VERSION, tstamp)
-    db_file = abspath(outdir, db_file)
+    if not is_postgres():
+        format = "serializer"
+        suffix = "json.gz"
+    elif format == "directory":
+        suffix = "dir"
+    else:
+        suffix = "sql.%s" % EXTENSIONS.get(os.path.basename(compress.split()[0]), "z")
 
-    params = dict(
-        pg_user=pg_user,
-        pg_name=pg_name,
-        version=biostar.VERSION,
-        db_file=db_file,
-        prog=prog,
-    )
+    name = "%s-%s-%s.%s" % (os.path.basename(pg_name), biostar.VERSION, tstamp, suffix)
+    db_file = abspath(outdir, name)
+
+    # Dump next to the target and swap it in once complete.
+    temp = db_file + ".tmp"
+    remove(temp)
+
+    start = time.time()
+    if format == "serializer":
+        logger.info("saving %s to %s with the serializer" % (pg_name, db_file))
+        serializer_dump(temp)
+    else:
+        pg_dump(prog=prog, pg_user=pg_user, pg_name=pg_name, path=temp, format=format, jobs=jobs, compress=compress)
+    duration = time.time() - start
+
+    remove(db_file)
+    os.rename(temp, db_file)
 
-    #logger.info("saving %(pg_name)s to %(db_file)s" % params)
+    entry = dict(name=name, format=format, compress=compress if format == "plain" else None,
+                 hourly=hourly, date=datetime.now().isoformat(), version=biostar.VERSION,
+                 size=disk_size(db_file), duration=round(duration, 3), checksum=checksum(db_file))
+    logger.info("saved %(name)s, %(size)s bytes in %(duration)ss" % entry)
 
-    cmd = "%(prog)s -Fp -x -O -b -U %(pg_user)s %(pg_name)s | gzip > %(db_file)s" % params
+    manifest = read_manifest(outdir)
+    manifest['dumps'] = [e for e in manifest['dumps'] if e['name'] != name] + [entry]
+    rotate(outdir, manifest, keep)
+    write_manifest(outdir, manifest)
 
-    # Running the command
-    logger.info("%s" % cmd)
-    os.system(cmd)
+    return entry
 
 
 if __name__ == '__main__':
     #generate_sitemap()
-    pass
\ No newline at end of file
+    pass
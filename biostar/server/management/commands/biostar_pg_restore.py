@@ -0,0 +1,104 @@
+"""
+Restores a database dump made with biostar_pg_dump
+"""
+
+import os, gzip
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+
+import logging
+
+from biostar.server.management.commands.biostar_pg_dump import abspath, checksum, read_manifest, run, BACKUP_JOBS
+
+logger = logging.getLogger("command")
+
+
+class Command(BaseCommand):
+    help = 'Restores a database dump into an empty database.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('-f', dest='name', default=None, help='the dump to restore, default is the latest one'),
+        make_option('-i', dest='indir', default="~/data/", help='the directory of the dumps default=%default'),
+        make_option('-u', dest='pg_user', default="www", help='postgres user default=%default'),
+        make_option('-p', dest='prog', default="/usr/bin/pg_restore",
+                    help='restore program for the directory format default=%default'),
+        make_option('--psql', dest='psql', default="/usr/bin/psql",
+                    help='restore program for the plain format default=%default'),
+        make_option('-j', '--jobs', dest='jobs', default=BACKUP_JOBS, type=int,
+                    help='parallel jobs for the directory format default=%default'),
+        make_option('--no-verify', dest='verify', action='store_false', default=True,
+                    help='skip the checksum verification'),
+    )
+
+    def handle(self, *args, **options):
+        main(name=options['name'], indir=options['indir'], pg_user=options['pg_user'], prog=options['prog'],
+             psql=options['psql'], jobs=options['jobs'], verify=options['verify'])
+
+
+def serializer_restore(path):
+    """
+    Loads a serializer dump one line at a time. The objects are inserted in bulk
+    so that no signals fire, the database is expected to be empty.
+    """
+    from django.core import serializers
+    from django.db import connection, transaction
+    from django.core.management.color import no_style
+
+    models = set()
+    with transaction.atomic():
+        for line in gzip.open(path, 'rb'):
+            objects = list(serializers.deserialize("json", line))
+            if not objects:
+                continue
+            model = type(objects[0].object)
+            models.add(model)
+            model._default_manager.bulk_create([obj.object for obj in objects])
+
+            # Many to many relations go straight into the intermediate tables.
+            for field in model._meta.many_to_many:
+                through = field.rel.through
+                if not through._meta.auto_created:
+                    continue
+                source, target = "%s_id" % field.m2m_field_name(), "%s_id" % field.m2m_reverse_field_name()
+                links = [through(**{source: obj.object.pk, target: pk})
+                         for obj in objects for pk in obj.m2m_data.get(field.name, [])]
+                through.objects.bulk_create(links)
+
+        cursor = connection.cursor()
+        for sql in connection.ops.sequence_reset_sql(no_style(), list(models)):
+            cursor.execute(sql)
+
+
+def main(name, indir, pg_user, prog, psql, jobs=4, verify=True):
+    indir = os.path.expanduser(indir)
+    manifest = read_manifest(indir)
+    if not manifest['dumps']:
+        raise CommandError("no dumps found in %s" % indir)
+
+    if name:
+        entries = [e for e in manifest['dumps'] if e['name'] == os.path.basename(name)]
+        if not entries:
+            raise CommandError("dump %s is not in the manifest" % name)
+        entry = entries[0]
+    else:
+        entry = max(manifest['dumps'], key=lambda e: e['date'])
+
+    path = abspath(indir, entry['name'])
+    if verify:
+        logger.info("verifying %s" % path)
+        if checksum(path) != entry['checksum']:
+            raise CommandError("checksum mismatch for %s" % path)
+
+    pg_name = settings.DATABASE_NAME
+    logger.info("restoring %s into %s" % (path, pg_name))
+
+    if entry['format'] == "serializer":
+        serializer_restore(path)
+    elif entry['format'] == "directory":
+        run([prog, "-j", str(jobs), "-x", "-O", "-U", pg_user, "-d", pg_name, path])
+    else:
+        with open(path, 'rb') as fp:
+            run(entry['compress'].split() + ["-dc"], [psql, "-q", "-U", pg_user, pg_name], input=fp)
+
+    return entry
@@ -0,0 +1,28 @@
+"""
+Rolls up the daily statistics served by the stats api.
+"""
+from django.core.management.base import BaseCommand
+from optparse import make_option
+
+import logging
+
+logger = logging.getLogger("command")
+
+
+class Command(BaseCommand):
+    help = 'Rolls up the site statistics for each day that has passed'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--backfill', dest='backfill', action='store_true', default=False,
+                    help='recomputes the statistics of all days'),
+    )
+
+    def handle(self, *args, **options):
+        from biostar.server.api import update_daily_stats, backfill_daily_stats
+
+        if options['backfill']:
+            count = backfill_daily_stats()
+        else:
+            count = update_daily_stats()
+
+        logger.info("rolled up %s days" % count)
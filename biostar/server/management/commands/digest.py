@@ -1,5 +1,5 @@
 from __future__ import unicode_literals, absolute_import, division
-import logging, string, time
+import logging, string, time, os, threading, Queue
 
 from django.core.management.base import BaseCommand
 from django.conf import settings
@@ -12,44 +12,306 @@ from optparse import make_option
 from biostar.apps.util import html
 from django.contrib.sites.models import Site
 from django.db.models import Count
+from django.db import connection, transaction, IntegrityError
+from collections import Counter
 from django.core.urlresolvers import reverse
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
+
+# Stands in for the user specific part of the links while the digest is rendered.
+UUID_MARKER = "digestuuidmarker"
+
+
+class Digest(object):
+    """
+    A digest rendered once. The user specific unsubscribe link is
+    filled in by joining the pieces of the body around it.
+    """
+
+    def __init__(self, subject, text_body, html_body):
+        self.subject = subject
+        extras = {
+            "%(digest_manage)s": reverse("digest_manage"),
+            "%(digest_unsubscribe)s": reverse("digest_unsubscribe", kwargs=dict(uuid=UUID_MARKER)),
+        }
+        for key, value in extras.items():
+            text_body = text_body.replace(key, value)
+            html_body = html_body.replace(key, value)
+        self.text_parts = text_body.split(UUID_MARKER)
+        self.html_parts = html_body.split(UUID_MARKER)
+
+    def fill(self, uuid):
+        "Returns the text and html body for a user"
+        return uuid.join(self.text_parts), uuid.join(self.html_parts)
+
+    def message(self, email, uuid):
+        text_content, html_content = self.fill(uuid)
+        msg = EmailMultiAlternatives(self.subject, text_content, settings.DEFAULT_FROM_EMAIL, [email])
+        if html_content:
+            msg.attach_alternative(html_content, "text/html")
+        return msg
+
+
+class TokenBucket(object):
+    """
+    Limits the rate of the sends across threads. Holds up to `burst` tokens
+    that are refilled at `rate` tokens per second.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate, self.burst = float(rate), burst
+        self.tokens, self.last = burst, time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class Checkpoint(object):
+    """
+    Appends the emails that have been sent to a file, so that
+    a run that crashed is resumed without sending twice.
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.lock = threading.Lock()
+        if os.path.isfile(fname):
+            self.done = set(map(string.strip, open(fname)))
+        else:
+            self.done = set()
+        self.stream = open(fname, 'at')
+
+    def add(self, email):
+        with self.lock:
+            self.stream.write("%s\n" % email)
+            self.stream.flush()
+
+    def finish(self):
+        "The run is complete, there is nothing left to resume."
+        self.stream.close()
+        os.remove(self.fname)
+
+
+def send_digest(digest, recipients, checkpoint, rate, workers):
+    """
+    Sends the digest to the (email, uuid) recipients. Each worker thread keeps
+    its own connection open for the whole run. Returns the number of emails
+    sent and failed.
+    """
+    backend = getattr(settings, 'DIGEST_EMAIL_BACKEND', settings.EMAIL_BACKEND)
+    bucket = TokenBucket(rate=rate, burst=workers)
+    todo = Queue.Queue(maxsize=workers * 100)
+    counts = dict(sent=0, failed=0)
+    lock = threading.Lock()
+
+    def work():
+        conn = get_connection(backend=backend)
+        while True:
+            item = todo.get()
+            if item is None:
+                break
+            email, uuid = item
+            bucket.acquire()
+            try:
+                conn.send_messages([digest.message(email, uuid)])
+                checkpoint.add(email)
+                key = 'sent'
+            except Exception, exc:
+                logger.error('error %s sending email to %s' % (exc, email))
+                # The connection may be broken, it reopens on the next send.
+                conn.close()
+                key = 'failed'
+            with lock:
+                counts[key] += 1
+        conn.close()
+
+    threads = [threading.Thread(target=work) for i in range(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    start = time.time()
+    for email, uuid in recipients:
+        if email not in checkpoint.done:
+            todo.put((email, uuid))
+
+    for thread in threads:
+        todo.put(None)
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.time() - start
+    logger.info('sent %(sent)s, failed %(failed)s' % counts + ' in %.1f seconds' % elapsed)
+    return counts
+
+
+def file_recipients(fname):
+    "Generates the (email, uuid) pairs for the emails listed in a file"
+    from biostar.apps.users.models import User
+
+    emails = map(string.strip, open(fname))
+
+    def chunks(data, size):
+        "Break into chunks of 100"
+        for i in xrange(0, len(data), size):
+            yield data[i:i+size]
+
+    for chunk in chunks(emails, 100):
+        users = User.objects.filter(email__in=chunk).select_related('profile')
+        for user in users:
+            yield user.email, user.profile.uuid
+
+
+def digest_prefs():
+    "Maps the digest names to the profile preferences"
+    from biostar.apps.users.models import Profile
+
+    return dict(daily=Profile.DAILY_DIGEST, weekly=Profile.WEEKLY_DIGEST, monthly=Profile.MONTHLY_DIGEST)
+
+
+def pref_recipients(pref, size=1000):
+    """
+    Generates the (email, uuid) pairs for the users subscribed to a digest.
+    The rows are streamed with a server side cursor where the database has one,
+    no model instances are created.
+    """
+    from biostar.apps.users.models import User, Profile
+
+    sql = "SELECT u.email, p.uuid FROM %s u JOIN %s p ON p.user_id = u.id " \
+          "WHERE p.digest_prefs = %%s AND u.status NOT IN (%%s, %%s) ORDER BY p.id" \
+          % (User._meta.db_table, Profile._meta.db_table)
+    params = [digest_prefs()[pref], User.SUSPENDED, User.BANNED]
+
+    if connection.vendor == 'postgresql':
+        # Named cursors keep the result on the server, withhold allows them in autocommit mode.
+        connection.ensure_connection()
+        cursor = connection.connection.cursor(name="digest_recipients", withhold=True)
+        cursor.itersize = size
+    else:
+        cursor = connection.cursor()
+
+    try:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(size)
+            if not rows:
+                break
+            for email, uuid in rows:
+                yield email, uuid
+    finally:
+        cursor.close()
+
+
+# The number of candidate posts kept per day for each section of the digest.
+DIGEST_CANDIDATES = 25
+
+
+def build_digest_day(day):
+    "Collects the digest content of a single day"
+    from biostar.apps.posts.models import Post, DailyStats, DigestDay
+    from biostar.apps.users.models import User
+    from biostar.server.api import day_bounds
+
+    start, end = day_bounds(day)
+
+    posts = Post.objects.filter(status=Post.OPEN)
+    created = posts.filter(creation_date__gte=start, creation_date__lt=end)
+    edited = posts.filter(lastedit_date__gte=start, lastedit_date__lt=end)
+
+    new_posts = created.filter(type__in=Post.TOP_LEVEL).order_by('-view_count')
+    blogs = created.filter(type=Post.BLOG).order_by('-creation_date')
+    edited_posts = edited.exclude(creation_date__gte=start, type__in=Post.TOP_LEVEL).order_by('-vote_count')
+    posters = edited.order_by().values_list('author').annotate(Count('id'))
+
+    row = DigestDay(date=day)
+    row.new_posts = DailyStats.join_ids(new_posts.values_list('id', flat=True)[:DIGEST_CANDIDATES])
+    row.edited_posts = DailyStats.join_ids(edited_posts.values_list('id', flat=True)[:DIGEST_CANDIDATES])
+    row.blogs = DailyStats.join_ids(blogs.values_list('id', flat=True)[:DIGEST_CANDIDATES])
+    row.posters = DigestDay.join_counts(posters)
+    row.post_count = posts.filter(creation_date__lt=end).count()
+    row.user_count = User.objects.filter(profile__date_joined__lt=end).count()
+    return row
+
+
+def digest_days(days):
+    """
+    Returns the digest rows of the days before today in date order.
+    The rows that do not exist yet are built and stored.
+    """
+    from biostar.apps.posts.models import DigestDay
+
+    today = datetime.today().date()
+    first = today - timedelta(days=days)
+
+    rows = dict((row.date, row) for row in DigestDay.objects.filter(date__gte=first, date__lt=today))
+    for offset in range(days):
+        day = first + timedelta(days=offset)
+        if day not in rows:
+            rows[day] = build_digest_day(day)
+            try:
+                with transaction.atomic():
+                    rows[day].save()
+            except IntegrityError:
+                # Another run has stored the same day.
+                pass
+
+    return [rows[day] for day in sorted(rows)]
+
 
 def render_digest(days, text_tmpl, html_tmpl, send, options, limit=10, verbosity=1):
-    from_email = settings.DEFAULT_FROM_EMAIL
-    from biostar.apps.posts.models import Post
+    from biostar.apps.posts.models import Post, DailyStats, DigestDay
     from biostar.apps.users.models import User
+    from biostar.server.api import day_bounds
 
     site = site = Site.objects.get_current()
 
-    start = (now() - timedelta(days=days))
+    # The digest covers the full days before today.
+    rows = digest_days(max(days, 1))
+    start, end = day_bounds(rows[0].date)
 
-    # Posts created since the start date.
-    top_posts = Post.objects.filter(status=Post.OPEN, type__in=Post.TOP_LEVEL,
-                                    creation_date__gt=start).select_related('author')
+    def merged_ids(field):
+        ids = set()
+        for row in rows:
+            ids.update(DailyStats.split_ids(getattr(row, field)))
+        return ids
+
+    posts = Post.objects.filter(status=Post.OPEN).select_related('author')
 
-    top_posts = top_posts.order_by('-view_count')[:limit]
+    # Posts created since the start date.
+    top_posts = posts.filter(id__in=merged_ids('new_posts')).order_by('-view_count')[:limit]
 
     # Updated post created before the start date.
-    upd_posts = Post.objects.filter(status=Post.OPEN,
-                                    lastedit_date__gt=start)
-    upd_posts = upd_posts.exclude(creation_date__gt=start, type__in=Post.TOP_LEVEL).select_related("author")
+    upd_posts = posts.filter(id__in=merged_ids('edited_posts'))
+    upd_posts = upd_posts.exclude(creation_date__gte=start, type__in=Post.TOP_LEVEL)
     upd_posts = upd_posts.order_by('-vote_count')[:limit]
 
     # Blog posts created since the start date.
-    blogs = Post.objects.filter(status=Post.OPEN, type=Post.BLOG,
-                                creation_date__gt=start).select_related('author')
-    blogs = blogs[:limit]
-
-    # Total post count
-    total_post_count = Post.objects.filter(status=Post.OPEN).count()
-
-    # Total user count
-    total_user_count = User.objects.filter().count()
-
-    hard_worker = User.objects.filter(post__status=Post.OPEN, post__lastedit_date__gt=start) \
-        .annotate(total=Count("post")).order_by('-total').select_related("profile")
-    hard_worker = hard_worker[:limit]
+    blogs = posts.filter(id__in=merged_ids('blogs')).order_by('-creation_date')[:limit]
+
+    # Totals at the end of the last day.
+    total_post_count, total_user_count = rows[-1].post_count, rows[-1].user_count
+
+    # Users with the most edited posts.
+    totals = Counter()
+    for row in rows:
+        totals.update(dict(DigestDay.split_counts(row.posters)))
+    top = totals.most_common(limit)
+    users = User.objects.filter(id__in=[uid for uid, total in top]).select_related("profile")
+    users = dict((user.id, user) for user in users)
+    hard_worker = []
+    for uid, total in top:
+        if uid in users:
+            users[uid].total = total
+            hard_worker.append(users[uid])
 
     params = dict(
         site=site,
@@ -70,42 +332,29 @@ def render_digest(days, text_tmpl, html_tmpl, send, options, limit=10, verbosity
     if html_tmpl:
         html_body = html.render(html_tmpl, **params)
 
+    digest = Digest(subject=options['subject'], text_body=text_body, html_body=html_body)
+
     if verbosity > 0:
-        extras = dict(
-            digest_manage=reverse("digest_manage"),
-            digest_unsubscribe=reverse("digest_unsubscribe", kwargs=dict(uuid=1))
-        )
-        print text_body % extras
-        print html_body % extras
+        text_content, html_content = digest.fill(uuid="1")
+        print text_content
+        print html_content
 
     if send:
-
         logger.info('sending emails')
-        emails = map(string.strip, open(send))
-
-        def chunks(data, size):
-            "Break into chunks of 100"
-            for i in xrange(0, len(data), size):
-                yield data[i:i+size]
-
-        for chunk in chunks(emails, 100):
-            users = User.objects.filter(email__in=chunk).select_related('profile')
-            for user in users:
-                try:
-                    extras = dict(
-                        digest_manage=reverse("digest_manage"),
-                        digest_unsubscribe=reverse("digest_unsubscribe", kwargs=dict(uuid=user.profile.uuid))
-                    )
-                    text_content = text_body % extras
-                    html_content = html_body % extras
-                    subject = options['subject']
-                    
-                    msg = EmailMultiAlternatives(subject, text_content, from_email, [user.email])
-                    msg.attach_alternative(html_content, "text/html")
-                    msg.send()
-                    time.sleep(0.3) # Throttle on Amazon.
-                except Exception, exc:
-                    logger.error('error %s sending email to %s' % (exc, user.email))
+        if send in digest_prefs():
+            recipients = pref_recipients(send)
+            fname = "digest-%s-%s.sent" % (send, now().strftime("%Y-%m-%d"))
+        else:
+            recipients = file_recipients(send)
+            fname = "%s-%s.sent" % (send, now().strftime("%Y-%m-%d"))
+        checkpoint = Checkpoint(fname)
+        if checkpoint.done:
+            logger.info('resuming, %s emails already sent' % len(checkpoint.done))
+        send_digest(digest, recipients=recipients, checkpoint=checkpoint,
+                    rate=options['rate'], workers=options['workers'])
+        checkpoint.finish()
+
+    return digest
 
 
 class Command(BaseCommand):
@@ -120,9 +369,16 @@ class Command(BaseCommand):
                     help='the subject line of the email'),
 
         make_option('--send', dest='send', metavar="FILE", default=None,
-                    help='sends the rendered templates to the list of emails in the file. Both text and html templates '
+                    help='sends the rendered templates to the list of emails in the file or to the users with '
+                         'a digest preference (daily, weekly, monthly). Both text and html templates '
                          'are sent in a single multi-part email.'),
 
+        make_option('--rate', dest='rate', default=3.0, type=float, metavar='NUMBER',
+                    help='the maximal number of emails sent per second (default=%default)'),
+
+        make_option('--workers', dest='workers', default=4, type=int, metavar='NUMBER',
+                    help='the number of connections that send emails in parallel (default=%default)'),
+
         make_option('--days', dest='days', default=1, type=int, metavar='NUMBER',
                     help='how many days back to include into the digest (default=%default)'),
 
@@ -150,7 +406,11 @@ class Command(BaseCommand):
 
         if emails:
             # Shows the emails of users registered for a digest
-            pass
+            if emails not in digest_prefs():
+                logger.error('invalid digest preference: %s' % emails)
+                return
+            for email, uuid in pref_recipients(emails):
+                print email
 
         if show:
             # Produces the daily digest.
@@ -10,9 +10,12 @@ from datetime import timedelta
 from django.utils.dateparse import parse_datetime
 from django.utils import timezone, encoding
 
-from django.db import transaction
+from django.db import transaction, connection
 from itertools import *
 from django.db.models import signals
+from collections import defaultdict
+import time
+from biostar.apps.util import worker_pool
 from biostar.const import now
 
 def path_join(*args):
@@ -113,6 +116,103 @@ def get_post(row, users, klass):
 
     return post
 
+def render_html(text):
+    "Renders the post body, runs in the worker processes of the bulk import"
+    from biostar.apps.util import html
+    return html.parse_html(text)
+
+def report(log, stage, count, start):
+    "Logs the throughput of an import stage"
+    elapsed = time.time() - start
+    rate = count / elapsed if elapsed else 0
+    log("%s: %s rows in %.1f seconds (%.0f rows/s)" % (stage, count, elapsed, rate))
+
+def in_chunks(values, size=500):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+def finalize_posts(posts, users, log):
+    """
+    Computes the reply counts, the subscriptions, the tags and the author stats of posts that were
+    inserted in bulk, with set based queries over the range of the new ids.
+    The users are keyed by id. Tags are linked to the top level posts only.
+    """
+    from biostar.apps.posts.models import Post, Subscription, Tag
+    from biostar.apps.users.models import UserStats
+    from biostar.apps.util import split_tags
+    from biostar import const
+
+    low, high = min(post.id for post in posts), max(post.id for post in posts)
+    table = connection.ops.quote_name(Post._meta.db_table)
+
+    # Reply counts of the parents of the imported answers.
+    start = time.time()
+    cursor = connection.cursor()
+    cursor.execute(
+        "UPDATE %(post)s SET reply_count = (SELECT COUNT(*) FROM %(post)s c WHERE c.parent_id = %(post)s.id "
+        "AND c.type = %%s AND c.status = %%s) WHERE id IN (SELECT parent_id FROM %(post)s "
+        "WHERE type = %%s AND id >= %%s AND id <= %%s)" % dict(post=table),
+        [Post.ANSWER, Post.OPEN, Post.ANSWER, low, high])
+    report(log, "reply counts", cursor.rowcount, start)
+
+    # Subscribe the authors to the threads they took part in.
+    start = time.time()
+    pairs = {}
+    for post in posts:
+        pairs.setdefault((post.root_id, post.author_id), post)
+    roots = set(root_id for root_id, author_id in pairs)
+    for ids in in_chunks(roots):
+        for key in Subscription.objects.filter(post_id__in=ids).values_list("post_id", "user_id"):
+            pairs.pop(key, None)
+
+    subs = []
+    date = const.now()
+    for (root_id, author_id), post in sorted(pairs.items()):
+        sub_type = users[author_id].profile.message_prefs
+        if sub_type == const.DEFAULT_MESSAGES:
+            sub_type = const.EMAIL_MESSAGE if post.is_toplevel else const.LOCAL_MESSAGE
+        subs.append(Subscription(post_id=root_id, user_id=author_id, type=sub_type, date=date))
+    Subscription.objects.bulk_create(subs, batch_size=BATCH_SIZE)
+
+    sub_table = connection.ops.quote_name(Subscription._meta.db_table)
+    cursor.execute(
+        "UPDATE %(post)s SET subs_count = (SELECT COUNT(*) FROM %(sub)s s WHERE s.post_id = %(post)s.id) "
+        "WHERE id IN (SELECT root_id FROM %(post)s WHERE id >= %%s AND id <= %%s)" % dict(post=table, sub=sub_table),
+        [low, high])
+    report(log, "subscriptions", len(subs), start)
+
+    # Tags, created in bulk and counted afterwards.
+    start = time.time()
+    post_tags = dict((post.id, set(split_tags(post.tag_val))) for post in posts if post.tag_val and post.is_toplevel)
+    names = set(chain(*post_tags.values()))
+    tags = {}
+    for chunk in in_chunks(names):
+        tags.update(Tag.objects.filter(name__in=chunk).values_list("name", "id"))
+    Tag.objects.bulk_create([Tag(name=name) for name in names if name not in tags], batch_size=BATCH_SIZE)
+    for chunk in in_chunks(names):
+        tags.update(Tag.objects.filter(name__in=chunk).values_list("name", "id"))
+
+    Through = Post.tag_set.through
+    links = [Through(post_id=pk, tag_id=tags[name]) for pk, tag_names in post_tags.items() for name in tag_names]
+    Through.objects.bulk_create(links, batch_size=BATCH_SIZE)
+
+    tag_table = connection.ops.quote_name(Tag._meta.db_table)
+    link_table = connection.ops.quote_name(Through._meta.db_table)
+    cursor.execute(
+        "UPDATE %(tag)s SET %(count)s = (SELECT COUNT(*) FROM %(link)s l WHERE l.tag_id = %(tag)s.id) "
+        "WHERE id IN (SELECT tag_id FROM %(link)s WHERE post_id >= %%s AND post_id <= %%s)"
+        % dict(tag=tag_table, link=link_table, count=connection.ops.quote_name('count')), [low, high])
+    report(log, "tags", len(links), start)
+
+    # The counters of the authors, inserts in bulk bypass the signals.
+    start = time.time()
+    authors = list(set(post.author_id for post in posts))
+    for chunk in in_chunks(authors):
+        UserStats.rebuild(chunk)
+    report(log, "user stats", len(authors), start)
+
+
 def to_unicode(obj, encoding='utf-8'):
     if isinstance(obj, basestring):
         if not isinstance(obj, unicode):
@@ -129,6 +229,10 @@ class Command(BaseCommand):
         make_option("-x", '--votes', action="store_true", dest='votes', default=False, help='import votes'),
         make_option("-t", '--tags', action="store_true", dest='tags', default=False, help='auto tag'),
         make_option("-d", '--dir', dest='dir', default="~/tmp/biostar-migrate", help='import directory'),
+        make_option("-b", '--bulk', action="store_true", dest='bulk', default=False,
+                    help='imports the posts in bulk, bypassing the signals'),
+        make_option("-w", '--workers', dest='workers', default=4, type=int,
+                    help='the number of processes that render the posts in bulk mode (default=%default)'),
     )
 
     def auto_tag(self, source, fname):
@@ -201,6 +305,127 @@ class Command(BaseCommand):
         log("created %s subscriptions" % Subscription.objects.all().count())
         log("created %s messages" % Message.objects.all().count())
 
+    def bulk_migrate_posts(self, source, fname, workers=4):
+        """
+        Imports the posts without going through Post.save and the signals. The rows are
+        inserted with bulk_create, roots first, then each level of replies. The html is
+        rendered in a process pool. The reply counts, subscriptions and tags are computed
+        afterwards over the whole import.
+        """
+        from biostar.server.models import disconnect_all
+        from biostar.apps.posts.models import Post, Change
+        from biostar.apps.util import html
+        import bleach
+
+        log = self.stdout.write
+
+        # Disconnect signals they will generate way too many messages
+        disconnect_all()
+
+        # Stage 1: read the rows.
+        start = time.time()
+        seen = set(Post.objects.values_list("id", flat=True))
+        users = dict((u.id, u) for u in User.objects.all().select_related("profile"))
+
+        posts = []
+        stream = csv.DictReader(file(fname), delimiter=b'\t')
+        for row in stream:
+            uid = int(row['id'])
+
+            # Skip existing posts
+            if uid in seen:
+                continue
+            seen.add(uid)
+
+            post = get_post(row, users, klass=Post)
+            if not post:
+                log("skipped %s" % uid)
+                continue
+
+            # Will break out an not deal with Blogs in Biostar.
+            if row['url'].strip() and post.type == Post.BLOG:
+                continue
+
+            post_file = path_join(source, 'posts', str(post.id))
+            post.content = file(post_file, 'rt').read()
+            posts.append(post)
+
+        report(log, "read", len(posts), start)
+        if not posts:
+            return
+
+        # Stage 2: apply the changes that Post.save would make.
+        start = time.time()
+        posts.sort(key=lambda p: p.id)
+        by_id = dict((p.id, p) for p in posts)
+
+        # Parents that were imported earlier, with their roots.
+        missing = set(p.parent_id for p in posts if p.parent_id not in by_id)
+        known, titles = {}, {}
+        for ids in in_chunks(missing):
+            query = Post.objects.filter(id__in=ids).values_list("id", "type", "root_id", "root__title")
+            for pk, ptype, root_id, root_title in query:
+                known[pk] = (ptype, root_id)
+                titles[root_id] = root_title
+
+        def parent_info(post):
+            parent = by_id.get(post.parent_id)
+            return (parent.type, parent.root_id) if parent else known.get(post.parent_id)
+
+        depth = {}
+        for post in posts:
+            if post.parent_id == post.id:
+                titles[post.id] = post.title
+            elif parent_info(post):
+                # The root follows the parent and the title is inherited from the top level.
+                ptype, post.root_id = parent_info(post)
+                if ptype in (Post.ANSWER, Post.COMMENT):
+                    post.type = Post.COMMENT
+                post.title = Post.reply_title(post.type, titles.get(post.root_id, post.title))
+            parent = by_id.get(post.parent_id)
+            depth[post.id] = depth.get(parent.id, -1) + 1 if parent and parent.id != post.id else 0
+
+            post.tag_val = html.strip_tags(post.tag_val)
+            if post.is_toplevel and post.type != Post.QUESTION:
+                required_tag = post.get_type_display()
+                if required_tag not in post.tag_val:
+                    post.tag_val += "," + required_tag
+            post.tag_val = bleach.clean(post.tag_val.strip(), tags=[], attributes=[], styles={}, strip=True)
+
+        report(log, "prepare", len(posts), start)
+
+        # Stage 3: render the html in parallel.
+        start = time.time()
+        contents = [p.content for p in posts]
+        if workers > 1:
+            pool = worker_pool(workers)
+            try:
+                rendered = pool.map(render_html, contents, chunksize=100)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            rendered = map(render_html, contents)
+        for post, text in izip(posts, rendered):
+            post.html = text
+        report(log, "render", len(posts), start)
+
+        with transaction.atomic():
+            # Stage 4: insert the posts in dependency order.
+            start = time.time()
+            levels = defaultdict(list)
+            for post in posts:
+                levels[depth[post.id]].append(post)
+            for level in sorted(levels):
+                Post.objects.bulk_create(levels[level], batch_size=BATCH_SIZE)
+            report(log, "insert", len(posts), start)
+
+            finalize_posts(posts, users, log)
+
+            Change.log(Change.POST, [post.id for post in posts])
+
+        log("migrated %s posts" % Post.objects.all().count())
+
     def migrate_users(self, source, fname):
 
         #User.objects.all().delete()
@@ -346,7 +571,10 @@ class Command(BaseCommand):
 
         if options['posts']:
             fname = path_join(source, "posts.txt")
-            self.migrate_posts(source, fname)
+            if options['bulk']:
+                self.bulk_migrate_posts(source, fname, workers=options['workers'])
+            else:
+                self.migrate_posts(source, fname)
 
         if options['votes']:
             fname = path_join(source, "votes.txt")
@@ -1,4 +1,4 @@
-import sys, time, os, logging
+import sys, time, os, logging, email
 import mailbox, markdown, pyzmail
 from django.conf import settings
 from django.utils.timezone import utc
@@ -12,7 +12,9 @@ from itertools import *
 import re, textwrap, urllib2, cgi
 from chardet import detect
 
-from django.db.models import signals
+from django.db import connection, transaction
+from django.db.models import signals, Max
+from django.core.management.color import no_style
 import difflib
 from collections import deque
 from datetime import timedelta
@@ -43,6 +45,8 @@ class Command(BaseCommand):
         make_option("-t", '--tags', dest='tags', default=None, help='tags'),
         make_option("-d", '--dry', dest='dry', action='store_true', default=False,
                     help='dry run, parses the emails only'),
+        make_option("-w", '--workers', dest='workers', default=4, type=int,
+                    help='the number of processes that parse the emails (default=%default)'),
     )
 
     def handle(self, *args, **options):
@@ -52,7 +56,7 @@ class Command(BaseCommand):
         limit = options['limit']
         DRY_RUN = options['dry']
         if fname:
-            parse_mboxx(fname, limit=limit, tag_val=tags)
+            parse_mboxx(fname, limit=limit, tag_val=tags, workers=options['workers'])
 
 
 class Bunch(object):
@@ -76,47 +80,18 @@ SIZE_LIMIT = 10000
 SKIPPED_REPLY = 0
 
 
-def create_post(b, author, root=None, parent=None, tag_val=''):
-    from biostar.apps.posts.models import Post
-
-    title = b.subj
-    body = b.body
-    if not parent:
-        title = title.strip()
-        title = ' '.join(title.splitlines())
-        title = ' '.join(title.split())
-        title = title[:180]
-        post = Post(title=title, type=Post.QUESTION, content=body, tag_val=tag_val, author=author)
-    else:
-        post_type = Post.ANSWER if parent.is_toplevel else Post.COMMENT
-        post = Post(type=post_type, content=body, tag_val="galaxy", author=author, parent=parent)
-
-    post.creation_date = post.lastedit_date = b.date
-
-    if not DRY_RUN:
-        post.save()
-
-    tag_val = guess_tags(post.content, tag_val)
-
-    if tag_val and not DRY_RUN:
-        post.add_tags(tag_val)
-
-    logger.info("--- creating %s: %s" % (post.get_type_display(), title))
-
-    return post
-
-
-def fix_file(fname):
-    "Fixes the obfuscated emails in mbox files"
-    new_name = "tmp-output.txt"
-    logger.info("*** fixing obfuscated emails: %s" % new_name)
-    fp = open(new_name, 'wt')
-    for line in file(fname):
+def read_mbox(fname):
+    "Streams the raw messages of an mbox file and fixes the obfuscated emails"
+    lines = []
+    for line in open(fname):
+        if line.startswith("From ") and lines:
+            yield "".join(lines)
+            lines = []
         if line.startswith("From: "):
             line = line.replace(" at ", "@")
-        fp.write(line)
-    fp.close()
-    return new_name
+        lines.append(line)
+    if lines:
+        yield "".join(lines)
 
 
 def no_junk(line):
@@ -218,6 +193,8 @@ def unpack_message(data):
     b.subj = subj
     for patt in REPLACE_PATT:
         b.subj = b.subj.replace(patt, "")
+    # Collapse the whitespace, the subjects are matched to the titles.
+    b.subj = ' '.join(b.subj.split())
 
     # Get the body of the message
     if not msg.text_part:
@@ -247,18 +224,57 @@ def unpack_message(data):
     return b
 
 
-def parse_mboxx(filename, limit=None, tag_val=''):
-    from biostar.server.models import disconnect_all
-    from biostar.apps.users.models import User
+def parse_message(text):
+    "Decodes and formats a raw message, runs in the worker processes"
+    from biostar.apps.util import html
+
+    try:
+        b = unpack_message(email.message_from_string(text))
+    except Exception, exc:
+        logger.error("error parsing message: %s" % exc)
+        return None
+
+    if not b or not b.email or not b.subj:
+        return None
+
+    b.html = html.parse_html(b.body)
+    return b
+
+
+def reserve_ids(count):
+    """
+    Takes the ids of the next posts. On postgresql they are drawn from the sequence so that
+    concurrent inserts or a later import can not take them, even when the import fails.
+    Other databases number the posts past the largest id.
+    """
     from biostar.apps.posts.models import Post
 
-    global SKIPPED_REPLY
+    if connection.vendor == 'postgresql':
+        cursor = connection.cursor()
+        cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                       [Post._meta.db_table, count])
+        return [row[0] for row in cursor.fetchall()]
 
-    #users = User.objects.all().delete()
-    users = User.objects.all()
-    users = dict([(u.email, u) for u in users])
+    first = (Post.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+    return range(first, first + count)
+
+
+def parse_mboxx(filename, limit=None, tag_val='', workers=4, batch_size=500):
+    """
+    Imports an mbox file. The messages are streamed from the file and decoded
+    in a process pool, a single writer assigns the posts to the threads with an
+    in memory map of the message ids and inserts them in bulk.
+    """
+    from biostar.server.models import disconnect_all
+    from biostar.apps.users.models import User, Profile
+    from biostar.apps.posts.models import Post, Change
+    from biostar.server.management.commands.import_biostar1 import finalize_posts, report
+    from biostar.apps.util import worker_pool
 
-    #Post.objects.all().delete()
+    log = logger.info
+
+    users = User.objects.all().select_related('profile')
+    users = dict([(u.email, u) for u in users])
 
     logger.info("*** found %s users" % len(users))
 
@@ -270,99 +286,163 @@ def parse_mboxx(filename, limit=None, tag_val=''):
 
     logger.info("*** parsing mbox %s" % filename)
 
-    new_name = fix_file(filename)
-
-    # Parse the modified mbox.
-    mbox = mailbox.mbox(new_name)
-    rows = imap(unpack_message, mbox)
-
-    # Remove empty elements
-    rows = ifilter(None, rows)
-    # Keep only email with sender and subject.
-    rows = ifilter(lambda b: b.email, rows)
-    rows = ifilter(lambda b: b.subj, rows)
-
-    # Apply limits if necessary.
-    rows = islice(rows, limit)
+    messages = read_mbox(filename)
 
-    tree, posts, fallback = {}, {}, {}
+    # Lightweight records of the posts that may become parents.
+    posts, fallback = {}, {}
 
     # titles that have been seen in the past
     roots = {}
 
-    for b in rows:
-        datefmt = b.date.strftime('%Y-%m-%d')
-        logger.info("*** %s parsing %s " % (datefmt, b.subj))
+    # The ids are assigned here so that replies can refer to their parents before insertion.
+    ids = deque()
+
+    pending, imported = [], []
+
+    def flush():
+        with transaction.atomic():
+            Post.objects.bulk_create(pending, batch_size=100)
+            if connection.vendor != 'postgresql':
+                # The ids were set explicitly, move the sequence past them.
+                cursor = connection.cursor()
+                for sql in connection.ops.sequence_reset_sql(no_style(), [Post]):
+                    cursor.execute(sql)
+        for post in pending:
+            # Only the fields used by finalize_posts are kept.
+            post.content = post.html = ''
+        imported.extend(pending)
+        del pending[:]
+
+    start, count = time.time(), 0
+    pool = worker_pool(workers) if workers > 1 else None
+    try:
+        if pool:
+            rows = pool.imap(parse_message, messages, chunksize=50)
+        else:
+            rows = imap(parse_message, messages)
 
-        if b.email not in users:
+        # Remove empty elements and apply limits if necessary.
+        rows = ifilter(None, rows)
+        rows = islice(rows, limit)
 
-            logger.info("--- creating user name:%s, email:%s" % (b.name, b.email))
-            u = User(email=b.email, name=b.name)
-            if not DRY_RUN:
-                u.save()
-                u.profile.date_joined = b.date
-                u.profile.last_login = b.date
-                u.profile.save()
-
-            users[u.email] = u
-
-        author = users[b.email]
-
-        parent = posts.get(b.reply_to) or fallback.get(b.subj)
-
-        # Looks like a reply but still no parent
-        # Fuzzy matching to commence
-        if not parent and b.subj.lower().startswith("Re:"):
-            curr_key = b.subj
-            logger.info("searching for best match %s" % curr_key)
-            cands = difflib.get_close_matches(curr_key, fallback.keys())
-            if cands:
-                logger.info("found %s" % cands)
-                parent = fallback[cands[0]]
-
-        # some emailers do not append Re: to replies, this is a heuristics
-        if not parent and b.subj in roots:
-            # try a candidate
-            cand = roots[b.subj]
-            delta = b.date - cand.creation_date
-            if delta < timedelta(weeks=5):
-                parent = cand
-
-        if parent:
-            root = parent.root
-            post = create_post(b=b, author=author, parent=parent)
-        else:
-            post = create_post(b=b, author=author, tag_val=tag_val)
+        for b in rows:
+            count += 1
+            if DRY_RUN:
+                continue
 
-        posts[b.id] = post
+            if b.email not in users:
+                logger.info("--- creating user name:%s, email:%s" % (b.name, b.email))
+                u = User(email=b.email, name=b.name)
+                u.save()
+                Profile.objects.filter(user=u).update(date_joined=b.date, last_login=b.date)
+                users[u.email] = u
+
+            author = users[b.email]
+
+            parent = posts.get(b.reply_to) or fallback.get(b.subj)
+
+            # Looks like a reply but still no parent
+            # Fuzzy matching to commence
+            if not parent and b.subj.lower().startswith("Re:"):
+                curr_key = b.subj
+                logger.info("searching for best match %s" % curr_key)
+                cands = difflib.get_close_matches(curr_key, fallback.keys())
+                if cands:
+                    logger.info("found %s" % cands)
+                    parent = fallback[cands[0]]
+
+            # some emailers do not append Re: to replies, this is a heuristics
+            if not parent and b.subj in roots:
+                # try a candidate
+                cand = roots[b.subj]
+                delta = b.date - cand.creation_date
+                if delta < timedelta(weeks=5):
+                    parent = cand
+
+            if not ids:
+                ids.extend(reserve_ids(batch_size))
+
+            post = Post(id=ids.popleft(), content=b.body, html=b.html, author=author, lastedit_user=author,
+                        status=Post.OPEN, creation_date=b.date, lastedit_date=b.date)
+
+            if parent:
+                # The parents carry the title of the top level, the way Post.check_root titles replies.
+                post.type = Post.ANSWER if parent.is_toplevel else Post.COMMENT
+                post.title, post.tag_val = Post.reply_title(post.type, parent.title), "galaxy"
+                post.root_id, post.parent_id = parent.root_id, parent.id
+            else:
+                title = ' '.join(b.subj.split())[:180]
+                post.type, post.title, post.tag_val = Post.QUESTION, title, guess_tags(b.body, tag_val) or ''
+                post.root_id = post.parent_id = post.id
+
+            logger.info("--- creating %s: %s" % (post.get_type_display(), post.title))
+
+            title = parent.title if parent else post.title
+            node = Bunch(id=post.id, root_id=post.root_id, title=title,
+                         is_toplevel=post.is_toplevel, creation_date=post.creation_date)
+            posts[b.id] = node
+
+            # keep track of posts that could be parents
+            if not parent:
+                roots[b.subj] = node
+
+                # Fall back to guessing post inheritance from the title
+                fall_key = "Re: %s" % post.title
+                fallback[fall_key] = node
+
+            pending.append(post)
+            if len(pending) >= batch_size:
+                flush()
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    report(log, "parse", count, start)
 
-        # keep track of posts that could be parents
-        if not parent:
-            roots[b.subj] = post
+    if DRY_RUN:
+        logger.info("*** dry run, no data saved")
+        return
 
-        # Fall back to guessing post inheritance from the title
-        fall_key = "Re: %s" % post.title
-        fallback[fall_key] = post
+    if pending:
+        flush()
+    report(log, "insert", len(imported), start)
 
     logger.info("*** users %s" % len(users))
-    logger.info("*** posts %s" % len(posts))
+    logger.info("*** posts %s" % len(imported))
     logger.info("*** post limit: %s" % limit)
-    logger.info("*** skipped posts due to size: %s" % SKIPPED_SIZE)
-    logger.info("*** skipped posts due to missing parent: %s" % SKIPPED_REPLY)
 
-    if DRY_RUN:
-        logger.info("*** dry run, no data saved")
-        sys.exit()
-
-    logger.info("*** updating user scores")
-    for user in User.objects.all():
-        score = Post.objects.filter(author=user).count()
-        user.score = user.full_score = score
-        user.save()
-        latest = Post.objects.filter(author=user).order_by("-creation_date")[:1]
-        if latest:
-            user.profile.last_login = latest[0].creation_date
-            user.profile.save()
+    if not imported:
+        return
+
+    with transaction.atomic():
+        cursor = connection.cursor()
+
+        by_id = dict((u.id, u) for u in users.values())
+        finalize_posts(imported, by_id, log)
+
+        # A thread is last edited by its latest answer.
+        low, high = imported[0].id, imported[-1].id
+        qn = connection.ops.quote_name
+        post_table, user_table = qn(Post._meta.db_table), qn(User._meta.db_table)
+        profile_table = qn(Profile._meta.db_table)
+        cursor.execute(
+            "UPDATE %(post)s SET lastedit_date = (SELECT MAX(c.creation_date) FROM %(post)s c "
+            "WHERE c.parent_id = %(post)s.id AND c.type = %%s) WHERE id IN (SELECT parent_id FROM %(post)s "
+            "WHERE type = %%s AND id >= %%s AND id <= %%s)" % dict(post=post_table),
+            [Post.ANSWER, Post.ANSWER, low, high])
+
+        logger.info("*** updating user scores")
+        authors = "SELECT author_id FROM %s WHERE id >= %%s AND id <= %%s" % post_table
+        cursor.execute(
+            "UPDATE %(user)s SET score = (SELECT COUNT(*) FROM %(post)s p WHERE p.author_id = %(user)s.id) "
+            "WHERE id IN (%(authors)s)" % dict(user=user_table, post=post_table, authors=authors), [low, high])
+        cursor.execute(
+            "UPDATE %(profile)s SET last_login = (SELECT MAX(p.creation_date) FROM %(post)s p "
+            "WHERE p.author_id = %(profile)s.user_id) WHERE user_id IN (%(authors)s)"
+            % dict(profile=profile_table, post=post_table, authors=authors), [low, high])
+
+        Change.log(Change.POST, [post.id for post in imported])
 
 
 if __name__ == '__main__':
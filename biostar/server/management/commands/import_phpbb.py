@@ -24,9 +24,14 @@ from django.core.exceptions import ImproperlyConfigured
 from datetime import date
 from django.utils import timezone
 from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.core.management.color import no_style
+from bisect import bisect_left
 import csv, re
 from biostar.apps.users.models import User
-from biostar.apps.posts.models import Post
+from biostar.apps.posts.models import Post, Change
+from biostar.apps.util import html
 
 logger = logging.getLogger('simple-logger')
 
@@ -101,30 +106,54 @@ def get_all_users(uname):
     return allusers
 
 
-#Extracts user information with user_id
-def get_user(uid, allusers):
+#Fetches or creates the users of the forum, keyed by their phpbb user_id
+def get_users(uids, allusers):
+    from biostar.server.management.commands.import_biostar1 import in_chunks
 
-    found=0
-    for row in allusers:
-        if row[0] == uid:
-            name = row[1]
-            email = row[2]
-            found=1
-            break
+    found = dict((row[0], row) for row in allusers if row[0] in uids)
+    emails = set(row[2] for row in found.values())
 
-    try:
-        user = User.objects.get(email=email)
-        logger.info('Fetched user: %s' % user.name)
-    except:
-        user = User(email=email, name=name)
-        user.save()
-        logger.info('Created user: %s' % user.name)
+    users = {}
+    for chunk in in_chunks(emails):
+        for user in User.objects.filter(email__in=chunk).select_related('profile'):
+            users[user.email] = user
+            logger.info('Fetched user: %s' % user.name)
 
-    return user 
+    byid = {}
+    for uid, name, email in found.values():
+        if email not in users:
+            user = User(email=email, name=name)
+            user.save()
+            users[email] = user
+            logger.info('Created user: %s' % user.name)
+        byid[uid] = users[email]
+
+    return byid
+
+
+#Returns the topic with a title that starts with the text, from a sorted list of titles
+def find_prefix(titles, topics, text):
+    index = bisect_left(titles, text)
+    if index < len(titles) and titles[index].startswith(text):
+        return topics[titles[index]]
+    return None
+
+
+#Creates an unsaved post with all the fields that save() would fill in
+def make_post(pk, user, body, date, type, title, parent=None):
+    if parent:
+        # The parents are topics, the replies are titled the way Post.check_root does it.
+        title = Post.reply_title(type, parent.title)
+    post = Post(id=pk, title=title, content=body, html=html.parse_html(body), author=user,
+                lastedit_user=user, type=type, status=Post.OPEN, creation_date=date, lastedit_date=date)
+    post.root_id = parent.root_id if parent else pk
+    post.parent_id = parent.id if parent else pk
+    return post
 
 
 #Imports the posts into django models
 def import_posts(fname, uname):
+    from biostar.server.management.commands.import_biostar1 import finalize_posts, in_chunks
 
     logger.info('Extracting posts from file...')
     allposts = get_posts(fname)
@@ -132,54 +161,86 @@ def import_posts(fname, uname):
     logger.info('Extracting users from file...')
     allusers = get_all_users(uname)
 
-    post_count=0
-    for single in allposts:
-        uid = int(single[0])
-        title = single[1]
-        body = single[2]
-        date = single[3]
-        logger.info('Fetched post : %s' % title)
-
-        #Getting the post user
-        user = get_user(uid,allusers)
+    users = get_users(set(int(single[0]) for single in allposts), allusers)
 
-        #List to hold answer posts which could not be matched
-        orphans = []
+    # The ids are assigned up front so that replies can point to their topic before insertion.
+    next_id = (Post.objects.aggregate(Max('id'))['id__max'] or 0) + 1
 
+    topics, replies = [], []
+    for uid, title, body, date in allposts:
+        logger.info('Fetched post : %s' % title)
+        user = users.get(int(uid))
+        if not user:
+            continue
         if title.startswith('Re:'):
-            try:
-                ptitle = title[4:]
-                parent = Post.objects.get(title=ptitle)
-                post = Post(title=title, content=body, author=user, type= Post.ANSWER, creation_date=date)
-                post.parent=parent
-                post.root=parent
-                post.save()
-                post_count+=1
-            except:
-                post = Post(title=title, author=user, type= Post.ANSWER, content=body, creation_date=date)
-                orphans.append(post)
+            replies.append((user, title, body, date))
         else:
-            post = Post(title=title, content=body, author=user, type = Post.QUESTION, creation_date=date)
-            post.save()
-            post_count+=1
-
+            topics.append(make_post(next_id, user, body, date, Post.QUESTION, title))
+            next_id += 1
+
+    #Maps the titles to the topics, the first topic with a title wins
+    bytitle = {}
+    for post in topics:
+        bytitle.setdefault(post.title, post)
+
+    answers, orphans = [], []
+    for user, title, body, date in replies:
+        parent = bytitle.get(title[4:])
+        if parent:
+            answers.append(make_post(next_id, user, body, date, Post.ANSWER, parent.title, parent))
+            next_id += 1
+        else:
+            orphans.append((user, title, body, date))
 
     #Now try to match posts which could not be matched before
+    skipped = 0
     if orphans:
         logger.info('Matching posts which could not be matched earlier')
-        for post in orphans:
-            try:
-                title = post.title
-                ptitle = title[4:]
-                parent = Post.objects.get(title__startswith=ptitle)
-                post.parent=parent
-                post.root=parent
-                post.save()
-                post_count+=1
-            except:
-                pass
-
-    print post_count, ' posts created'
+
+        #Replies to topics imported earlier are looked up in the database
+        missing = set(title[4:] for user, title, body, date in orphans)
+        for chunk in in_chunks(missing):
+            for post in Post.objects.filter(title__in=chunk, type__in=Post.TOP_LEVEL).order_by('id'):
+                bytitle.setdefault(post.title, post)
+
+        titles = sorted(bytitle)
+        for user, title, body, date in orphans:
+            parent = find_prefix(titles, bytitle, title[4:])
+            if parent:
+                answers.append(make_post(next_id, user, body, date, Post.ANSWER, parent.title, parent))
+                next_id += 1
+            else:
+                skipped += 1
+
+    if skipped:
+        logger.warning('Skipped %s replies without a topic' % skipped)
+
+    posts = topics + answers
+    if not posts:
+        logger.info('DONE!')
+        return
+
+    with transaction.atomic():
+        Post.objects.bulk_create(topics, batch_size=500)
+        Post.objects.bulk_create(answers, batch_size=500)
+
+        cursor = connection.cursor()
+        for sql in connection.ops.sequence_reset_sql(no_style(), [Post]):
+            cursor.execute(sql)
+
+        finalize_posts(posts, dict((user.id, user) for user in users.values()), logger.info)
+
+        # A topic is last edited by its latest answer.
+        low, high = min(post.id for post in posts), max(post.id for post in posts)
+        cursor.execute(
+            "UPDATE %(post)s SET lastedit_date = (SELECT MAX(c.creation_date) FROM %(post)s c "
+            "WHERE c.parent_id = %(post)s.id AND c.type = %%s) WHERE id IN (SELECT parent_id FROM %(post)s "
+            "WHERE type = %%s AND id >= %%s AND id <= %%s)" % dict(post=connection.ops.quote_name(Post._meta.db_table)),
+            [Post.ANSWER, Post.ANSWER, low, high])
+
+        Change.log(Change.POST, [post.id for post in posts])
+
+    print len(posts), ' posts created'
     logger.info('DONE!')
 
 
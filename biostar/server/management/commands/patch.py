@@ -11,9 +11,10 @@ from optparse import make_option
 import random
 import logging
 from datetime import timedelta, datetime
-from django.db.models import signals, Q
+from django.db.models import signals, Q, Count, Min, Max
 import string
 import json
+import gzip
 from itertools import *
 
 logger = logging.getLogger(__name__)
@@ -41,6 +42,10 @@ class Command(BaseCommand):
                     help='merges users listed in a file, on per row: master alias1 alias2 ...'),
 
         make_option('--export', dest='export', help='exports data into a directory'),
+        make_option('--workers', dest='workers', default=1, type=int,
+                    help='the number of processes that export in parallel (default=%default)'),
+        make_option('--gzip', dest='gzip', action='store_true', default=False,
+                    help='compresses the exported files'),
         make_option('--limit', dest='limit', default=None, help='limits things, occasionally :-)'),
     )
 
@@ -68,91 +73,183 @@ class Command(BaseCommand):
             merge_users(merge)
 
         if export_path:
-            export_data(export_path, limit=limit)
+            export_data(export_path, limit=limit, workers=options['workers'], compress=options['gzip'])
 
         pk = options['bump_id']
         if pk:
             bump(pk)
 
 
-def export_data(path, limit):
+# The number of ids covered by one file of the export.
+EXPORT_SHARD_SIZE = 10000
+
+EXPORT_MANIFEST = "manifest.json"
+
+USER_VALUES = [
+    "id", "name", "email", "status", "is_active", "is_admin", "is_staff", "new_messages", "score", "type",
+    "profile__date_joined", "profile__last_login", "profile__location", "profile__website",
+    "profile__scholar", "profile__twitter_id", "profile__info", "profile__my_tags", "profile__watched_tags",
+]
+
+POST_VALUES = [
+    "id", "author_id", "title", "content", "html", "tag_val", "view_count", "vote_count", "book_count",
+    "reply_count", "subs_count", "sticky", "comment_count", "has_accepted", "changed", "type", "rank",
+    "thread_score", "root_id", "parent_id", "status", "creation_date", "lastedit_date", "lastedit_user_id",
+]
+
+
+def serialize_user(row):
+    from biostar.apps.users.models import User
+
+    data = dict((key.replace("profile__", ""), value) for key, value in row.items())
+    data['status'] = dict(User.STATUS_CHOICES).get(row['status'])
+    data['type'] = dict(User.TYPE_CHOICES).get(row['type'])
+    data['date_joined'] = row['profile__date_joined'].isoformat()
+    data['last_login'] = row['profile__last_login'].isoformat()
+    return data
+
+
+def serialize_post(row):
     from biostar.apps.posts.models import Post
-    from biostar.apps.users.models import User, Profile
 
-    def save(name, obj):
-        data = json.dumps(obj, indent=4, separators=(',', ': '), sort_keys=True)
-        fp = open(name, 'wt')
-        fp.write(data)
-        fp.close()
-
-    def serialize_user(user):
-        prof = user.profile
-        return dict(
-            name=user.name, id=user.id, email=user.email,
-            status=user.get_status_display(),
-            is_active=user.is_active,
-            is_admin=user.is_admin,
-            is_staff=user.is_staff,
-            new_messages=user.new_messages,
-            score=user.score,
-            date_joined=prof.date_joined.isoformat(),
-            last_login=prof.last_login.isoformat(),
-            type=user.get_type_display(),
-            location=prof.location,
-            website=prof.website,
-            scholar=prof.scholar,
-            twitter_id=prof.twitter_id,
-            info=prof.info,
-            my_tags=prof.my_tags,
-            watched_tags=prof.watched_tags,
-
-        )
-
-    uname = os.path.join(path, "users.json")
-    logger.info('saving users: %s' % uname)
-    users = imap(serialize_user, User.objects.all().select_related('profile').order_by('id')[:limit])
-    save(uname, list(users))
-
-    def serialize_post(post):
-        return dict(
-            id=post.id,
-            author_id=post.author_id,
-            title=post.title,
-            content=post.content,
-            html=post.html,
-            tag_val=post.tag_val,
-            view_count=post.view_count,
-            vote_count=post.vote_count,
-            book_count=post.book_count,
-            reply_count=post.reply_count,
-            subs_count=post.subs_count,
-            sticky=post.sticky,
-            comment_count=post.comment_count,
-            has_accepted=post.has_accepted,
-            changed=post.changed,
-            type=post.get_type_display(),
-            rank=post.rank,
-            thread_score=post.thread_score,
-            root=post.root_id,
-            parent=post.parent_id,
-            status=post.get_status_display(),
-            creation_date=post.creation_date.isoformat(),
-            lastedit_date=post.lastedit_date.isoformat(),
-            lastedit_user=post.lastedit_user_id,
-        )
-
-    ids = []
-    posts = Post.objects.all().order_by('id')[:limit]
-    for post in posts:
-        ids.append(post.id)
-        pname = os.path.join(path, "%s" % post.id)
-        logger.info('saving post: %s' % pname)
-        data = serialize_post(post)
-        save(pname, data)
+    data = dict(row)
+    data['type'] = dict(Post.TYPE_CHOICES).get(row['type'])
+    data['status'] = dict(Post.STATUS_CHOICES).get(row['status'])
+    data['creation_date'] = row['creation_date'].isoformat()
+    data['lastedit_date'] = row['lastedit_date'].isoformat()
+    data['root'] = data.pop('root_id')
+    data['parent'] = data.pop('parent_id')
+    data['lastedit_user'] = data.pop('lastedit_user_id')
+    return data
+
+
+def export_table(name):
+    "Returns the query, the values, the serializer and the change log type of an exported table"
+    from biostar.apps.posts.models import Post, Change
+    from biostar.apps.users.models import User
+
+    tables = dict(
+        users=(User.objects.all(), USER_VALUES, serialize_user, Change.USER),
+        posts=(Post.objects.all(), POST_VALUES, serialize_post, Change.POST),
+    )
+    return tables[name]
+
+
+def shard_counts(query):
+    "The number of rows in each shard, counted in one grouped query"
+    column = "%s.id" % connection.ops.quote_name(query.model._meta.db_table)
+    query = query.extra(select={'shard': '%s / %s' % (column, EXPORT_SHARD_SIZE)}).order_by()
+    return dict((str(row['shard']), row['count']) for row in query.values('shard').annotate(count=Count('id')))
+
+
+def export_shard(task):
+    """
+    Streams the rows of one id range into a JSON Lines file.
+    Runs in the worker processes of the export.
+    """
+    name, shard, path, compress, high = task
+    query, values, serialize, change = export_table(name)
+
+    start = int(shard) * EXPORT_SHARD_SIZE
+    rows = query.filter(id__gte=start, id__lt=start + EXPORT_SHARD_SIZE)
+    if high is not None:
+        rows = rows.filter(id__lte=high)
+    rows = rows.order_by('id').values(*values)
+
+    fname = "%s-%s.jsonl%s" % (name, shard, ".gz" if compress else "")
+    tmp = os.path.join(path, fname + ".tmp")
+    stream = gzip.open(tmp, 'wb') if compress else open(tmp, 'wb')
+    count = 0
+    for row in rows.iterator():
+        stream.write(json.dumps(serialize(row), separators=(',', ':'), sort_keys=True))
+        stream.write("\n")
+        count += 1
+    stream.close()
+    os.rename(tmp, os.path.join(path, fname))
+
+    return name, shard, fname, count
+
+
+def export_data(path, limit=None, workers=1, compress=False):
+    """
+    Exports the users and the posts as JSON Lines files, one file per range of ids,
+    and records the files in a manifest. A later export into the same directory only
+    writes the files whose rows have changed according to the change log.
+    """
+    from biostar.apps.posts.models import Change
+    from biostar.apps.util import worker_pool
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    manifest_name = os.path.join(path, EXPORT_MANIFEST)
+    old = {}
+    if os.path.isfile(manifest_name):
+        old = json.load(open(manifest_name))
+
+    # Read the position in the change log before exporting anything. Only the settled
+    # changes count, a recent one may still have uncommitted changes below its id.
+    low = Change.objects.aggregate(low=Min('id'))['low']
+    seq = Change.settled().aggregate(high=Max('id'))['high'] or 0
+
+    # The changes since the last export must still be in the log.
+    incremental = old.get('shard_size') == EXPORT_SHARD_SIZE and old.get('compress') == compress \
+        and low is not None and old.get('seq', 0) >= low - 1
+
+    tasks, tables = [], {}
+    for name in ("users", "posts"):
+        query, values, serialize, change = export_table(name)
+
+        high = None
+        if limit:
+            ids = query.order_by('id').values_list('id', flat=True)[int(limit) - 1:int(limit)]
+            high = ids[0] if ids else None
+
+        counts = shard_counts(query)
+        previous = old.get('tables', {}).get(name, {}) if incremental else {}
+
+        changed = set()
+        if incremental:
+            ids = Change.objects.filter(id__gt=old['seq'], model=change).values_list('object_id', flat=True)
+            changed = set(str(pk // EXPORT_SHARD_SIZE) for pk in ids.iterator())
+
+        tables[name] = {}
+        for shard, count in counts.items():
+            if high is not None and int(shard) * EXPORT_SHARD_SIZE > high:
+                continue
+            entry = previous.get(shard)
+            if entry and shard not in changed and entry['count'] == count and high is None \
+                    and os.path.isfile(os.path.join(path, entry['file'])):
+                tables[name][shard] = entry
+            else:
+                tasks.append((name, shard, path, compress, high))
+
+        # Remove the files of the shards that have no rows left.
+        for shard in set(previous) - set(counts):
+            fname = os.path.join(path, previous[shard]['file'])
+            if os.path.isfile(fname):
+                os.remove(fname)
+
+    logger.info('exporting %s files into %s with %s workers' % (len(tasks), path, workers))
+    if workers > 1:
+        pool = worker_pool(workers)
+        try:
+            results = pool.map(export_shard, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(export_shard, tasks)
+
+    for name, shard, fname, count in results:
+        logger.info('saved %s rows into %s' % (count, fname))
+        tables[name][shard] = dict(file=fname, count=count)
 
-    iname = os.path.join(path, "posts.json")
-    logger.info('saving post ids: %s' % iname)
-    save(iname, ids)
+    manifest = dict(seq=seq, shard_size=EXPORT_SHARD_SIZE, compress=compress, tables=tables)
+    fp = open(manifest_name, 'wt')
+    json.dump(manifest, fp, indent=4, sort_keys=True)
+    fp.close()
+    return manifest
 
 
 def post_patch():
@@ -258,9 +355,11 @@ def merge_users(fname):
         SocialAccount.objects.filter(user__in=aliases).update(user=master)
         EmailAddress.objects.filter(user__in=aliases).update(user=master)
 
-        # New score for the master
+        # New score for the master, the moved messages are counted again.
         score = sum(u.score for u in aliases) + master.score
-        User.objects.filter(pk=master.pk).update(score=score)
+        message_count = Message.objects.filter(user=master).count()
+        User.objects.filter(pk=master.pk).update(score=score, message_count=message_count)
+        aliases.update(message_count=0)
 
         # Update tokens
         ReplyToken.objects.filter(user__in=aliases).update(user=master)
@@ -9,10 +9,13 @@ from django.core.management.base import BaseCommand, CommandError
 import os, logging
 from optparse import make_option
 from string import strip
-import feedparser, urllib
+import feedparser, urllib, time, hashlib
+from multiprocessing.pool import ThreadPool
 from django.utils.encoding import smart_text
 from datetime import datetime
 from django.utils import timezone
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
 
 logger = logging.getLogger('simple-logger')
 
@@ -31,6 +34,10 @@ class Command(BaseCommand):
                     help='downloads latest feeds'),
         make_option('--update', dest='update', default=0, type=int,
                     help='updates with latest feeds'),
+        make_option('--workers', dest='workers', default=8, type=int,
+                    help='the number of feeds downloaded at the same time (default=%default)'),
+        make_option('--timeout', dest='timeout', default=30, type=int,
+                    help='the number of seconds to wait for a feed (default=%default)'),
     )
 
     def handle(self, *args, **options):
@@ -44,7 +51,7 @@ class Command(BaseCommand):
             add_blogs(add_fname)
 
         if options['download']:
-            download_blogs()
+            download_blogs(workers=options['workers'], timeout=options['timeout'])
 
         count = options['update']
         if count:
@@ -77,16 +84,62 @@ def add_blog(feed):
     logger.info('-' * 10)
     return blog
 
-def download_blogs():
+def download_blogs(workers=8, timeout=30):
+    """
+    Downloads the feeds in parallel. Only the worker threads touch the
+    network, the validators are saved from the calling thread.
+    """
     from biostar.apps.planet.models import Blog
 
-    blogs = Blog.objects.filter(active=True)
-    for blog in blogs:
-        logger.info("downloading: %s" % blog.title)
-        blog.download()
+    blogs = list(Blog.objects.filter(active=True))
+
+    def download(blog):
+        start = time.time()
+        changed = blog.download(timeout=timeout)
+        logger.info("downloading: %s, changed=%s in %.1f seconds" % (blog.title, changed, time.time() - start))
+        return changed
+
+    pool = ThreadPool(max(workers, 1))
+    try:
+        results = pool.map(download, blogs)
+    finally:
+        pool.close()
+        pool.join()
+
+    changed = [blog for blog, result in zip(blogs, results) if result]
+    for blog in changed:
+        Blog.objects.filter(id=blog.id).update(etag=blog.etag, last_modified=blog.last_modified)
+
+    logger.info("downloaded %s of %s feeds" % (len(changed), len(blogs)))
+    return changed
+
+def save_posts(posts):
+    """
+    Inserts the entries with a single query. When that fails the entries are saved
+    one at a time so that only the failing ones are skipped. Returns the saved entries.
+    """
+    from biostar.apps.planet.models import BlogPost
+
+    try:
+        with transaction.atomic():
+            BlogPost.objects.bulk_create(posts)
+        return posts
+    except Exception, exc:
+        logger.error("database error %s, saving the entries one at a time" % exc)
+
+    saved = []
+    for post in posts:
+        try:
+            with transaction.atomic():
+                post.save()
+            saved.append(post)
+        except Exception, exc:
+            logger.error(post.title)
+            logger.error("database error %s" % exc)
+    return saved
 
 def update_entries(count=3):
-    from biostar.apps.planet.models import Blog, BlogPost
+    from biostar.apps.planet.models import Blog, BlogPost, now
     from biostar.apps.util import html
 
     #BlogPost.objects.all().delete()
@@ -94,20 +147,39 @@ def update_entries(count=3):
     blogs = Blog.objects.filter(active=True)
 
     for blog in blogs:
-        logger.info("parsing: %s: %s" % (blog.id, blog.title))
+        start = time.time()
         try:
-            seen = [e.uid for e in BlogPost.objects.filter(blog=blog)]
-            seen = set(seen)
+            text = open(blog.fname, 'rb').read()
+        except IOError, exc:
+            logger.error("missing feed file %s: %s" % (blog.fname, exc))
+            continue
+
+        # Skip the feeds that have not changed since the last parse.
+        feed_hash = hashlib.md5(text).hexdigest()
+        if feed_hash == blog.feed_hash:
+            logger.info("unchanged: %s: %s" % (blog.id, blog.title))
+            continue
 
+        logger.info("parsing: %s: %s" % (blog.id, blog.title))
+        try:
             # Parse the blog
-            doc = blog.parse()
+            doc = feedparser.parse(text)
+            parsed = time.time()
+
+            # Only the entries of the feed are checked against the database.
+            uids = [e.id for e in doc.entries]
+            seen = set()
+            for i in range(0, len(uids), 500):
+                query = BlogPost.objects.filter(blog=blog, uid__in=uids[i:i + 500])
+                seen.update(query.values_list('uid', flat=True))
 
             # get the new posts
-            entries = [ e for e in doc.entries if e.id not in seen ]
+            new_entries = [ e for e in doc.entries if e.id not in seen ]
 
             # Only list a few entries
-            entries = entries[:count]
+            entries = new_entries[:count]
 
+            posts = []
             for r in entries:
                 r.title = smart_text(r.title)
                 r.title = r.title.strip()
@@ -123,13 +195,24 @@ def update_entries(count=3):
                     continue
                 body = html.clean(r.description)[:5000]
                 content = html.strip_tags(body)
-                try:
-                    post = BlogPost.objects.create(title=r.title, blog=blog, uid=r.id, content=content, html=body, creation_date=date, link=r.link)
-                except Exception, exc:
-                    logger.error(r.title)
-                    logger.error("database error %s" % exc)
-                else:
-                    logger.info("added: %s" % post.title)
+                posts.append(BlogPost(title=r.title, blog=blog, uid=r.id, content=content, html=body,
+                                      creation_date=date, link=r.link, insert_date=now()))
+
+            posts = save_posts(posts)
+
+            for post in posts:
+                logger.info("added: %s" % post.title)
+
+            blog.add_posts(posts)
+            if posts:
+                cache.delete(make_template_fragment_key("planet-feeds"))
+
+            # The file is parsed again while it has entries left over.
+            if len(new_entries) <= count:
+                Blog.objects.filter(id=blog.id).update(feed_hash=feed_hash)
+
+            logger.info("blog %s: %s entries, %s added, parsed in %.2f, stored in %.2f seconds" %
+                        (blog.id, len(doc.entries), len(posts), parsed - start, time.time() - parsed))
 
         except KeyError, exc:
             logger.error("%s" % exc)
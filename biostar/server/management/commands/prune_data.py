@@ -4,10 +4,14 @@ Prunes the views. Reduces
 
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Min, Max
 from django.utils.timezone import utc
 from datetime import datetime, timedelta
+from collections import defaultdict
+from optparse import make_option
 
-import logging
+import logging, time
 
 
 def now():
@@ -18,44 +22,100 @@ logger = logging.getLogger("command")
 
 
 class Command(BaseCommand):
-    help = 'Creates a sitemap in the export folder of the site'
+    help = 'Prunes the old views, messages, tokens and change log entries'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch', dest='batch', default=10000, type=int,
+                    help='the size of the id ranges deleted at once (default=%default)'),
+        make_option('--pause', dest='pause', default=0.1, type=float,
+                    help='the number of seconds to wait between batches (default=%default)'),
+    )
 
     def handle(self, *args, **options):
-        main()
+        main(batch_size=options['batch'], pause=options['pause'])
+
+
+def delete_batches(query, date_field, before, batch_size=10000, pause=0.1, callback=None):
+    """
+    Deletes the rows of the query older than `before` in id ranges of `batch_size`,
+    each range in its own short transaction, pausing in between so that other
+    queries are not locked out. Sends no signals and performs no cascades.
+    The callback is invoked with the rows of each range before they are deleted.
+    Returns the number of rows deleted and the time it took.
+    """
+    query = query.filter(**{"%s__lt" % date_field: before}).order_by()
+    bounds = query.aggregate(low=Min('id'), high=Max('id'))
+
+    start, deleted = time.time(), 0
+    if bounds['low'] is not None:
+        for low in xrange(bounds['low'], bounds['high'] + 1, batch_size):
+            batch = query.filter(id__gte=low, id__lt=low + batch_size)
+            with transaction.atomic():
+                if callback:
+                    callback(batch)
+                count = batch.count()
+                batch._raw_delete(using=batch.db)
+            deleted += count
+            if pause:
+                time.sleep(pause)
+
+    elapsed = time.time() - start
+    table = query.model._meta.db_table
+    logger.info("deleted %s rows from %s in %.1f seconds (%.0f rows/s)" %
+                (deleted, table, elapsed, deleted / elapsed if elapsed else 0))
+    return dict(table=table, deleted=deleted, seconds=elapsed)
+
+
+def uncount_messages(messages):
+    "Lowers the message counters of the users that own the messages"
+    from biostar.apps.users.models import User
+    from django.db.models import F
+
+    amounts = defaultdict(list)
+    for row in messages.values('user').annotate(count=Count('id')).order_by():
+        amounts[row['count']].append(row['user'])
 
+    for amount, ids in amounts.items():
+        for i in range(0, len(ids), 500):
+            User.objects.filter(id__in=ids[i:i + 500]).update(message_count=F('message_count') - amount)
 
-def main(days=1, weeks=10):
-    from biostar.apps.posts.models import PostView, ReplyToken
-    from biostar.apps.messages.models import Message
+
+def main(days=1, weeks=10, batch_size=10000, pause=0.1, max_messages=100):
+    from biostar.apps.posts.models import PostView, ReplyToken, Change
+    from biostar.apps.messages.models import Message, QueuedEmail
     from biostar.apps.users.models import User
-    from django.db.models import Count
+
+    params = dict(batch_size=batch_size, pause=pause)
+    results = []
 
     # Reduce post views.
     past = now() - timedelta(days=days)
-    query = PostView.objects.filter(date__lt=past)
-    msg = "deleting %s views" % query.count()
-    logger.info(msg)
-    query.delete()
+    results.append(delete_batches(PostView.objects.all(), 'date', past, **params))
 
     # Reduce messages.
     since = now() - timedelta(weeks=weeks)
-    query = Message.objects.filter(sent_at__lt=since)
-    msg = "deleting %s messages" % query.count()
-    logger.info(msg)
-    query.delete()
+    results.append(delete_batches(Message.objects.all(), 'sent_at', since, callback=uncount_messages, **params))
 
     # Remove old reply tokens
-    query = ReplyToken.objects.filter(date__lt=since)
-    msg = "deleting %s tokens" % query.count()
-    logger.info(msg)
-    query.delete()
-
-    # Get rid of too many messages
-    MAX_MSG = 100
-    users = User.objects.annotate(total=Count("recipients")).filter(total__gt=MAX_MSG)[:100]
-    for user in users:
-        since = now() - timedelta(days=1)
-        Message.objects.filter(user=user, sent_at__lt=since).delete()
+    results.append(delete_batches(ReplyToken.objects.all(), 'date', since, **params))
+
+    # Remove old change log entries.
+    results.append(delete_batches(Change.objects.all(), 'date', since, **params))
+
+    # Remove old emails from the outbound queue.
+    query = QueuedEmail.objects.filter(state__in=[QueuedEmail.SENT, QueuedEmail.FAILED])
+    results.append(delete_batches(query, 'creation_date', since, **params))
+
+    # Get rid of too many messages, the counter finds the full inboxes.
+    users = User.objects.filter(message_count__gt=max_messages).values_list('id', flat=True)[:100]
+    recent = now() - timedelta(days=1)
+    for user_id in users:
+        with transaction.atomic():
+            Message.objects.filter(user_id=user_id, sent_at__lt=recent)._raw_delete(using=Message.objects.db)
+            count = Message.objects.filter(user_id=user_id).count()
+            User.objects.filter(id=user_id).update(message_count=count)
+
+    return results
 
 
 if __name__ == '__main__':
@@ -0,0 +1,89 @@
+"""
+Times page views of a logged in user with each session backend.
+
+The cached_db and cache backends need a cache that outlives the request, with the
+dummy cache of the development settings the cache backend loses the login.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+import logging, time, re
+
+logger = logging.getLogger("command")
+
+BACKENDS = ("db", "cached_db", "cache")
+
+WRITE_PATT = re.compile(r"\b(INSERT|UPDATE|DELETE)\b")
+
+
+class Command(BaseCommand):
+    help = 'Times page views with the db, cached_db and cache session backends'
+
+    option_list = BaseCommand.option_list + (
+        make_option('-n', '--views', dest='views', default=100, type=int,
+                    help='page views per backend (default=%default)'),
+        make_option('--url', dest='url', default="/", help='the page to view (default=%default)'),
+        make_option('--email', dest='email', default=None,
+                    help='the email of the user, default is the first user'),
+    )
+
+    def handle(self, *args, **options):
+        from biostar.apps.users.models import User
+
+        users = User.objects.order_by('id')
+        if options['email']:
+            users = users.filter(email=options['email'])
+        user = users.first()
+        if not user:
+            raise CommandError("no user to log in with")
+
+        for result in benchmark(user, url=options['url'], views=options['views']):
+            logger.info("%(backend)s: %(views)s views in %(seconds).2f seconds, "
+                        "%(queries)s queries, %(session_queries)s on the session table, %(session_writes)s writes" % result)
+
+
+def log_in(client, user):
+    "Logs the client in the way the test client does, without a password"
+    from django.conf import settings
+    from django.contrib import auth
+    from django.utils.importlib import import_module
+
+    store = import_module(settings.SESSION_ENGINE).SessionStore()
+    store[auth.SESSION_KEY] = user.pk
+    store[auth.BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    store.save()
+    client.cookies[settings.SESSION_COOKIE_NAME] = store.session_key
+
+
+def benchmark(user, url="/", views=100, backends=BACKENDS):
+    """
+    Views the page with each session backend and counts the queries. The sessions are
+    only saved when the login state changes, so page views should not write the session table.
+    """
+    from django.contrib.sessions.models import Session
+    from django.db import connection
+    from django.test.client import Client
+    from django.test.utils import override_settings, CaptureQueriesContext
+
+    table = Session._meta.db_table
+
+    results = []
+    for backend in backends:
+        engine = "django.contrib.sessions.backends.%s" % backend
+        with override_settings(SESSION_ENGINE=engine, ALLOWED_HOSTS=["*"]):
+            client = Client()
+            log_in(client, user)
+
+            # The first view fills the caches.
+            client.get(url)
+
+            with CaptureQueriesContext(connection) as context:
+                start = time.time()
+                for step in range(views):
+                    client.get(url)
+                seconds = time.time() - start
+
+        queries = [query['sql'] for query in context.captured_queries if table in query['sql']]
+        writes = [sql for sql in queries if WRITE_PATT.search(sql)]
+        results.append(dict(backend=backend, views=views, seconds=seconds, queries=len(context.captured_queries),
+                            session_queries=len(queries), session_writes=len(writes)))
+    return results
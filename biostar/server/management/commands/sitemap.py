@@ -1,14 +1,16 @@
 """
-Creates a sitemap in the EXPORT directory
+Creates a sitemap in the EXPORT directory: a sitemap index that points
+to gzipped shards of the post urls.
 """
-import os
+import os, gzip, json
 from django.conf import settings
-from django.contrib.sitemaps import GenericSitemap
 from django.contrib.sites.models import Site
 from biostar.apps.posts.models import Post
-from django.utils.encoding import smart_str
-from django.template import loader
 from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.db.models import Count, Max
+from optparse import make_option
 import logging
 from django.contrib import sitemaps
 
@@ -17,8 +19,13 @@ logger = logging.getLogger("command")
 class Command(BaseCommand):
     help = 'Creates a sitemap in the export folder of the site'
 
+    option_list = BaseCommand.option_list + (
+        make_option('--full', dest='full', action='store_true', default=False,
+                    help='writes every shard, not just the changed ones'),
+    )
+
     def handle(self, *args, **options):
-        generate_sitemap()
+        generate_sitemap(full=options['full'])
         #ping_google()
 
 def path(*args):
@@ -34,19 +41,97 @@ def ping_google():
         logger.error(exc)
         pass
 
-def generate_sitemap():
-    sitemap = GenericSitemap({
-        'queryset': Post.objects.filter(type__in=Post.TOP_LEVEL).exclude(type=Post.BLOG),
-    })
-    urlset = sitemap.get_urls()
-    text = loader.render_to_string('sitemap.xml', {'urlset': urlset})
-    text = smart_str(text)
+# Each shard covers a fixed range of post ids, so it never exceeds the 50k url limit.
+SHARD_SIZE = 50000
+
+MANIFEST = 'sitemap-manifest.json'
+
+URLSET_START = '<?xml version="1.0" encoding="UTF-8"?>\n' \
+               '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+URLSET_END = '</urlset>\n'
+
+INDEX_START = '<?xml version="1.0" encoding="UTF-8"?>\n' \
+              '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+INDEX_END = '</sitemapindex>\n'
+
+
+def sitemap_posts():
+    return Post.objects.filter(type__in=Post.TOP_LEVEL).exclude(type=Post.BLOG)
+
+
+def shard_name(shard):
+    return 'sitemap-%s.xml.gz' % shard
+
+
+def shard_signatures():
+    """
+    Returns the number of posts and the latest edit of each shard, computed
+    in a single grouped query. A shard is rewritten when its signature changes.
+    """
+    column = "%s.id" % connection.ops.quote_name(Post._meta.db_table)
+    query = sitemap_posts().extra(select={'shard': '%s / %s' % (column, SHARD_SIZE)}).order_by()
+    query = query.values('shard').annotate(count=Count('id'), last=Max('lastedit_date'))
+    return dict((str(row['shard']), "%s:%s" % (row['count'], row['last'].isoformat())) for row in query)
+
+
+def write_shard(fname, shard, domain):
+    "Streams the urls of a shard into a gzip file"
+    url = "http://%s%s" % (domain, reverse("post-details", kwargs=dict(pk=123456789)))
+    url = url.replace("123456789", "%s")
+
+    start, end = shard * SHARD_SIZE, (shard + 1) * SHARD_SIZE
+    rows = sitemap_posts().filter(id__gte=start, id__lt=end).order_by('id').values_list('id', 'lastedit_date')
+
+    tmp = fname + '.tmp'
+    stream = gzip.open(tmp, 'wb')
+    stream.write(URLSET_START)
+    for pk, date in rows.iterator():
+        stream.write('<url><loc>%s</loc><lastmod>%s</lastmod></url>\n' % (url % pk, date.strftime("%Y-%m-%d")))
+    stream.write(URLSET_END)
+    stream.close()
+    os.rename(tmp, fname)
+
+
+def generate_sitemap(full=False):
+    """
+    Writes the gzipped sitemap shards and the sitemap index. Only the shards
+    whose posts changed since the last run are written again.
+    """
     site = Site.objects.get_current()
+    manifest_name = path(settings.STATIC_ROOT, MANIFEST)
+
+    old = {}
+    if not full and os.path.isfile(manifest_name):
+        old = json.load(open(manifest_name))
+
+    current = shard_signatures()
+
+    for shard, signature in sorted(current.items()):
+        fname = path(settings.STATIC_ROOT, shard_name(shard))
+        if old.get(shard) == signature and os.path.isfile(fname):
+            continue
+        logger.info('*** writing sitemap shard %s' % fname)
+        write_shard(fname, int(shard), site.domain)
+
+    # Remove the shards that have no posts left.
+    for shard in set(old) - set(current):
+        fname = path(settings.STATIC_ROOT, shard_name(shard))
+        if os.path.isfile(fname):
+            os.remove(fname)
+
     fname = path(settings.STATIC_ROOT, 'sitemap.xml')
-    logger.info('*** writing sitemap for %s to %s' % (site, fname))
-    fp = open(fname, 'wt')
-    fp.write(text)
-    fp.close()
+    logger.info('*** writing sitemap index for %s to %s' % (site, fname))
+    stream = open(fname + '.tmp', 'wt')
+    stream.write(INDEX_START)
+    for shard in sorted(current, key=int):
+        lastmod = current[shard].split(":", 1)[1][:10]
+        stream.write('<sitemap><loc>http://%s/%s</loc><lastmod>%s</lastmod></sitemap>\n' %
+                     (site.domain, shard_name(shard), lastmod))
+    stream.write(INDEX_END)
+    stream.close()
+    os.rename(fname + '.tmp', fname)
+
+    json.dump(current, open(manifest_name, 'wt'))
     logger.info('*** done')
 
 if __name__ == '__main__':
@@ -19,6 +19,8 @@ class Command(BaseCommand):
     option_list = BaseCommand.option_list + (
         make_option('--award', dest='award', action='store_true', default=False,
                     help='goes over the users and attempts to create awards'),
+        make_option('--stats', dest='stats', action='store_true', default=False,
+                    help='recomputes the activity counters of all users'),
     )
 
     def handle(self, *args, **options):
@@ -26,6 +28,10 @@ class Command(BaseCommand):
         if options['award']:
             crawl_awards()
 
+        if options['stats']:
+            from biostar.apps.users.models import UserStats
+            UserStats.rebuild()
+
 def crawl_awards():
     from biostar.apps.users.models import User
     from biostar.awards import create_user_award
@@ -38,8 +44,6 @@ def crawl_awards():
     ids = ids[:100]
 
     for pk  in ids:
-        user = User.objects.get(pk=pk)
-        #logger.info("%s: %s" % (user.id, user.name))
-        create_user_award.delay(user=user)
+        create_user_award.delay(user_id=pk)
 
 
@@ -0,0 +1,53 @@
+"""
+Fills in the missing user locations from the local geoip database.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+from collections import defaultdict
+import logging, time
+
+logger = logging.getLogger("command")
+
+
+class Command(BaseCommand):
+    help = 'Sets the location of users that have none from the address of their last visit'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch', dest='batch', default=500, type=int,
+                    help='profiles updated per query (default=%default)'),
+    )
+
+    def handle(self, *args, **options):
+        from biostar.apps.util import geoip
+
+        database = geoip.get_database()
+        if not database:
+            raise CommandError("geoip database not found")
+
+        count = update_locations(database, batch=options['batch'])
+        logger.info("set the location of %s users" % count)
+
+
+def update_locations(database, batch=500):
+    "Looks up the profiles without a location, updates them grouped by country"
+    from biostar.apps.users.models import Profile
+    from biostar.apps.posts.models import Change
+
+    start = time.time()
+    rows = Profile.objects.filter(location="").exclude(last_ip=None).values_list("user_id", "last_ip")
+
+    countries, lookups = defaultdict(list), 0
+    for pk, ip in rows.iterator():
+        lookups += 1
+        name = database.country(ip)
+        if name:
+            countries[name].append(pk)
+
+    count = 0
+    for name, ids in countries.items():
+        for index in range(0, len(ids), batch):
+            count += Profile.objects.filter(user_id__in=ids[index:index + batch]).update(location=name)
+            Change.log(Change.USER, ids[index:index + batch])
+
+    logger.info("%s lookups in %.3f seconds" % (lookups, time.time() - start))
+    return count
@@ -1,18 +1,23 @@
 __author__ = 'ialbert'
 from django.contrib import messages
 from django.conf import settings
-import hmac, logging, re
+import hmac, logging, re, time
 from datetime import timedelta
 from django.contrib.auth import authenticate, login, logout
+from django.contrib.auth.signals import user_logged_in
+from django.utils.functional import SimpleLazyObject
+from django.core.validators import validate_ipv46_address
+from django.core.exceptions import ValidationError
 from biostar.apps.users.models import User, Profile
 from biostar import const
 from django.core.cache import cache
-from biostar.apps.posts.models import Post, Vote
+from biostar.apps.posts.models import Post, Vote, Change
 from biostar.apps.messages.models import Message
 from biostar.apps.planet.models import BlogPost
 
 from collections import defaultdict
 from biostar.awards import create_user_award, check_user_profile
+from biostar.celery import debounce
 
 logger = logging.getLogger(__name__)
 
@@ -95,12 +100,11 @@ def valid_external_login(request):
     return False
 
 
-SESSION_KEY, ANON_USER = settings.SESSION_KEY, "anon-user"
+SESSION_KEY = settings.SESSION_KEY
 
 
-def get_counts(request, weeks=settings.COUNT_INTERVAL_WEEKS):
+def get_counts(user, weeks=settings.COUNT_INTERVAL_WEEKS):
     "Returns the number of counts for each post type in the interval that has passed"
-    user = request.user
     now = const.now()
 
     # Authenticated users get counts since their last login.
@@ -141,15 +145,83 @@ def get_counts(request, weeks=settings.COUNT_INTERVAL_WEEKS):
     return counts
 
 
+def counts_key(user):
+    "The cache key that holds the counts of a user"
+    return "%s-%s" % (SESSION_KEY, user.id) if user.is_authenticated() else SESSION_KEY
+
+
+def load_counts(request):
+    "Returns the counts from the cache, computes them when missing"
+    key = counts_key(request.user)
+    counts = cache.get(key)
+    if counts is None:
+        counts = dict(get_counts(request.user))
+        cache.set(key, counts, settings.SESSION_UPDATE_SECONDS)
+    return counts
+
+
+def reset_counts(request, label):
+    "Clears the count of a label once the user has seen it"
+    user = request.user
+    if not user.is_authenticated():
+        return
+    key, label = counts_key(user), label.lower()
+    counts = cache.get(key)
+    if counts and counts.get(label):
+        counts[label] = ''
+        cache.set(key, counts, settings.SESSION_UPDATE_SECONDS)
+
+
+def refresh_user(request, user):
+    "Recomputes the counts of an authenticated user and updates the login data"
+
+    # The counts are relative to the previous login time.
+    counts = dict(get_counts(user))
+    cache.set(counts_key(user), counts, settings.SESSION_UPDATE_SECONDS)
+
+    # Set the last login time and address.
+    ip = get_ip(request)
+    try:
+        validate_ipv46_address(ip)
+    except ValidationError:
+        ip = None
+    Profile.objects.filter(user_id=user.id).update(last_login=const.now(), last_ip=ip)
+    Change.log(Change.USER, [user.id])
+
+    # Create user awards if possible.
+    debounce(create_user_award, user.id, user_id=user.id)
+
+    # check user and fill in details
+    if ip and not user.profile.location:
+        debounce(check_user_profile, user.id, ip=ip, user_id=user.id)
+
+
+def user_login(sender, request, user, **kwargs):
+    # An anonymous session turned into a logged in one.
+    refresh_user(request, user)
+
+
+user_logged_in.connect(user_login, dispatch_uid="biostar-user-login")
+
+
+# Requests to these paths do not render pages and skip the counts and refreshes.
+EXEMPT_PATHS = [re.compile(patt) for patt in settings.VISIT_EXEMPT_PATHS]
+
+
+def is_exempt(request):
+    "Requests that do not render HTML take the fast path"
+    return request.is_ajax() or any(patt.match(request.path) for patt in EXEMPT_PATHS)
+
+
 class Visit(object):
     """
-    Sets visit specific parameters on objects.
+    Sets visit specific parameters on objects. The counts are kept in the cache
+    and loaded on first use, the session is only written when logging in or out.
     """
 
     def process_request(self, request, weeks=settings.COUNT_INTERVAL_WEEKS):
-        global SESSION_KEY, ANON_USER
-
-        user, session = request.user, request.session
+        start = time.time()
+        user = request.user
 
         # Suspended users are logged out immediately.
         if user.is_authenticated() and user.is_suspended:
@@ -158,58 +230,37 @@ class Visit(object):
 
         # Add attributes to anonymous users.
         if not user.is_authenticated():
-
             # This attribute is required inside templates.
             user.is_moderator = user.is_admin = False
 
-            # Check external logins.
-            if settings.EXTERNAL_AUTH and valid_external_login(request):
-                messages.success(request, "Login completed")
+        if is_exempt(request):
+            request.counts = {}
+            request.visit_time = time.time() - start
+            return
 
-            # We do this to detect when an anonymous session turns into a logged in one.
-            if ANON_USER not in session:
-                session[ANON_USER] = True
+        # Check external logins.
+        if not user.is_authenticated() and settings.EXTERNAL_AUTH and valid_external_login(request):
+            messages.success(request, "Login completed")
 
         # User attributes that refresh at given intervals.
-        if user.is_authenticated():
+        if request.user.is_authenticated():
 
             # The time between two count refreshes.
-            elapsed = (const.now() - user.profile.last_login).seconds
-
-            # The user has an anonymous session already.
-            # Update the user login data now.
-            if ANON_USER in session:
-                del session[ANON_USER]
-                elapsed = settings.SESSION_UPDATE_SECONDS + 1
+            elapsed = (const.now() - request.user.profile.last_login).seconds
 
             # The user session will be updated.
             if elapsed > settings.SESSION_UPDATE_SECONDS:
-                # Set the last login time.
-                Profile.objects.filter(user_id=user.id).update(last_login=const.now())
-
-                # Compute the counts.
-                counts = get_counts(request)
-
-                # Store the counts in the session for later use.
-                session[SESSION_KEY] = counts
-
-                # Create user awards if possible.
-                create_user_award.delay(user=user)
-
-                # check user and fill in details
-                check_user_profile.delay(ip=get_ip(request), user=user)
-
-
-        # Get the counts from the session or the cache.
-        counts = session.get(SESSION_KEY) or cache.get(SESSION_KEY)
-
-        # No sessions found, set the them into the session.
-        if not counts:
-            # Compute the counts
-            counts = get_counts(request)
-
-            # Put them into the session.
-            session[SESSION_KEY] = counts
-
-            # Store them in the cache for the next anonymous user.
-            cache.set(SESSION_KEY, counts, settings.SESSION_UPDATE_SECONDS)
+                refresh_user(request, request.user)
+
+        # The counts are only fetched when a template uses them.
+        request.counts = SimpleLazyObject(lambda: load_counts(request))
+        request.visit_time = time.time() - start
+
+    def process_response(self, request, response):
+        # Requests stopped by an earlier middleware never reached this one.
+        if hasattr(request, "visit_time"):
+            msecs = request.visit_time * 1000
+            logger.debug("%s %s visit %.1fms" % (request.method, request.path, msecs))
+            if settings.VISIT_TIMING_HEADER:
+                response['X-Visit-Time'] = "%.1fms" % msecs
+        return response
@@ -6,12 +6,13 @@ Only signals and connections between models are specfied here.
 """
 from __future__ import print_function, unicode_literals, absolute_import, division
 import logging, datetime
-from django.db.models import signals, Q
+from django.db.models import signals, Q, F
 from allauth.account.signals import user_signed_up
 from allauth.socialaccount.signals import social_account_added
 
-from biostar.apps.posts.models import Post, Subscription, ReplyToken
-from biostar.apps.messages.models import Message, MessageBody
+from biostar.apps.posts.models import Post, Vote, Subscription, ReplyToken, Change
+from biostar.apps.users.models import User, Profile, UserStats
+from biostar.apps.messages.models import Message, MessageBody, QueuedEmail
 from biostar.apps.badges.models import Award
 from biostar.server.orcid import hook_social_account_added
 
@@ -67,13 +68,14 @@ def post_create_messages(sender, instance, created, *args, **kwargs):
         body = MessageBody.objects.create(author=author, subject=post.root.title,
                                           text=content, sent_at=post.creation_date)
 
-        # Collects the emails for bulk sending.
-        emails, tokens = [], []
+        # Collects the emails for the outbound queue, keyed by post and recipient.
+        emails, tokens, recipients = [], [], []
 
         # This generator will produce the messages.
         def messages():
             for sub in subs:
                 message = Message(user=sub.user, body=body, sent_at=body.sent_at)
+                recipients.append(sub.user_id)
 
                 # collect to a bulk email if the subscription is by email:
                 if sub.type in (EMAIL_MESSAGE, ALL_MESSAGES):
@@ -92,7 +94,7 @@ def post_create_messages(sender, instance, created, *args, **kwargs):
                             headers={'Reply-To': reply_to},
                         )
                         email.attach_alternative(email_html, "text/html")
-                        emails.append(email)
+                        emails.append(("post-%s-%s" % (post.id, sub.user.id), email))
                         tokens.append(token)
                     except Exception, exc:
                         # This here can crash the post submission hence the catchall
@@ -104,12 +106,12 @@ def post_create_messages(sender, instance, created, *args, **kwargs):
         Message.objects.bulk_create(messages(), batch_size=100)
         ReplyToken.objects.bulk_create(tokens, batch_size=100)
 
-        try:
-            # Bulk sending email messages.
-            conn = mail.get_connection()
-            conn.send_messages(emails)
-        except Exception, exc:
-            logger.error("email error %s" % exc)
+        # The bulk insert sends no signals, count the messages here.
+        for i in range(0, len(recipients), 500):
+            User.objects.filter(id__in=recipients[i:i + 500]).update(message_count=F('message_count') + 1)
+
+        # The emails are sent from the queue by a periodic task.
+        QueuedEmail.enqueue(emails)
 
 
 def award_create_messages(sender, instance, created, *args, **kwargs):
@@ -128,12 +130,110 @@ def award_create_messages(sender, instance, created, *args, **kwargs):
         body = MessageBody.objects.create(author=user, subject=subject, text=content)
         message = Message.objects.create(user=user, body=body, sent_at=body.sent_at)
 
+def message_counter(sender, instance, created, *args, **kwargs):
+    "Counts the messages that are saved one by one"
+    if created:
+        User.objects.filter(id=instance.user_id).update(message_count=F('message_count') + 1)
+
 # Creates a message to everyone involved
 signals.post_save.connect(post_create_messages, sender=Post, dispatch_uid="post-create-messages")
 
 # Creates a message when an award has been made
 signals.post_save.connect(award_create_messages, sender=Award, dispatch_uid="award-create-messages")
 
+# Keeps the inbox size of the users.
+signals.post_save.connect(message_counter, sender=Message, dispatch_uid="message-counter")
+
+
+# The counters of the user stats that a post or a vote changes.
+POST_STATS = {Post.QUESTION: "question_count", Post.ANSWER: "answer_count", Post.COMMENT: "comment_count"}
+VOTE_STATS = {Vote.UP: "vote_count"}
+
+
+def post_stats(ptype, status, has_accepted):
+    "The user stats counters that a post adds to"
+    if status == Post.DELETED:
+        return set()
+    fields = set(["post_count"])
+    if ptype in POST_STATS:
+        fields.add(POST_STATS[ptype])
+    if ptype == Post.ANSWER and has_accepted:
+        fields.add("accepted_count")
+    return fields
+
+
+def update_stats(instance, change):
+    "Changes the user stats that depend on a post, vote or award"
+    if isinstance(instance, Post):
+        fields = post_stats(instance.type, instance.status, instance.has_accepted)
+        UserStats.add(instance.author_id, fields, change)
+    elif isinstance(instance, Vote):
+        if instance.type in VOTE_STATS:
+            try:
+                author_id = instance.post.author_id
+            except Post.DoesNotExist:
+                # The post is being removed along with its votes.
+                return
+            UserStats.add(author_id, [VOTE_STATS[instance.type]], change)
+    else:
+        UserStats.add(instance.user_id, ["award_count"], change)
+
+
+def stats_presave(sender, instance, *args, **kwargs):
+    # An edit may change the type, the status or the acceptance of the post.
+    if instance.pk:
+        instance._stats = Post.objects.filter(pk=instance.pk).values_list(
+            "author_id", "type", "status", "has_accepted").first()
+
+
+def stats_saved(sender, instance, created, *args, **kwargs):
+    if created:
+        update_stats(instance, 1)
+    elif sender is Post and getattr(instance, "_stats", None):
+        author_id, ptype, status, has_accepted = instance._stats
+        instance._stats = None
+        before = post_stats(ptype, status, has_accepted)
+        after = post_stats(instance.type, instance.status, instance.has_accepted)
+        if author_id != instance.author_id:
+            UserStats.add(author_id, before, -1)
+            UserStats.add(instance.author_id, after, 1)
+        else:
+            UserStats.add(author_id, before - after, -1)
+            UserStats.add(author_id, after - before, 1)
+
+
+def stats_deleted(sender, instance, *args, **kwargs):
+    update_stats(instance, -1)
+
+# Keeps the user stats up to date.
+signals.pre_save.connect(stats_presave, sender=Post, dispatch_uid="stats-presave-post")
+for model in (Post, Vote, Award):
+    signals.post_save.connect(stats_saved, sender=model, dispatch_uid="stats-saved-%s" % model.__name__)
+    signals.post_delete.connect(stats_deleted, sender=model, dispatch_uid="stats-deleted-%s" % model.__name__)
+
+
+# The models recorded in the change log.
+CHANGE_MODELS = {Post: Change.POST, Vote: Change.VOTE, User: Change.USER}
+
+
+def change_saved(sender, instance, *args, **kwargs):
+    Change.log(CHANGE_MODELS[sender], [instance.id])
+
+
+def change_deleted(sender, instance, *args, **kwargs):
+    Change.log(CHANGE_MODELS[sender], [instance.id], action=Change.DELETED)
+
+for model in CHANGE_MODELS:
+    signals.post_save.connect(change_saved, sender=model, dispatch_uid="change-saved-%s" % model.__name__)
+    signals.post_delete.connect(change_deleted, sender=model, dispatch_uid="change-deleted-%s" % model.__name__)
+
+
+def profile_saved(sender, instance, *args, **kwargs):
+    # The profile is exported with the user.
+    Change.log(Change.USER, [instance.user_id])
+
+signals.post_save.connect(profile_saved, sender=Profile, dispatch_uid="change-saved-profile")
+
 
 def disconnect_all():
     signals.post_save.disconnect(post_create_messages, sender=Post, dispatch_uid="post-create-messages")
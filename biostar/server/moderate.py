@@ -1,10 +1,10 @@
 """
 Moderator views
 """
-from biostar.apps.posts.models import Post, Vote
+from biostar.apps.posts.models import Post, Vote, Change
 from biostar.apps.badges.models import Award
 from biostar.apps.posts.auth import post_permissions
-from biostar.apps.users.models import User
+from biostar.apps.users.models import User, UserStats
 from biostar.apps.users.auth import user_permissions
 from biostar.apps.util import html
 from django.conf import settings
@@ -211,6 +211,7 @@ class PostModeration(LoginRequiredMixin, FormView):
         if action == (BUMP_POST) and user.is_moderator:
             now = datetime.utcnow().replace(tzinfo=utc)
             Post.objects.filter(id=post.id).update(lastedit_date=now, lastedit_user=request.user)
+            Change.log(Change.POST, [post.id])
             messages.success(request, "Post bumped")
             return response
 
@@ -224,6 +225,7 @@ class PostModeration(LoginRequiredMixin, FormView):
             post.save()
             has_accepted = Post.objects.filter(root=post.root, type=Post.ANSWER, has_accepted=True).count()
             root.update(has_accepted=has_accepted)
+            Change.log(Change.POST, [post.root_id])
             return response
 
         if action == MOVE_TO_ANSWER and post.type == Post.COMMENT:
@@ -231,6 +233,8 @@ class PostModeration(LoginRequiredMixin, FormView):
             messages.success(request, "Moved post to answer")
             query.update(type=Post.ANSWER, parent=post.root)
             root.update(reply_count=F("reply_count") + 1)
+            Change.log(Change.POST, [post.id, post.root_id])
+            UserStats.rebuild([post.author_id])
             return response
 
         if action == MOVE_TO_COMMENT and post.type == Post.ANSWER:
@@ -238,6 +242,8 @@ class PostModeration(LoginRequiredMixin, FormView):
             messages.success(request, "Moved post to answer")
             query.update(type=Post.COMMENT, parent=post.root)
             root.update(reply_count=F("reply_count") - 1)
+            Change.log(Change.POST, [post.id, post.root_id])
+            UserStats.rebuild([post.author_id])
             return response
 
         # Some actions are valid on top level posts only.
@@ -247,11 +253,15 @@ class PostModeration(LoginRequiredMixin, FormView):
 
         if action == OPEN:
             query.update(status=Post.OPEN)
+            Change.log(Change.POST, [post.id])
+            # Opening undeletes the post.
+            UserStats.rebuild([post.author_id])
             messages.success(request, "Opened post: %s" % post.title)
             return response
 
         if action in CLOSE_OFFTOPIC:
             query.update(status=Post.CLOSED)
+            Change.log(Change.POST, [post.id])
             messages.success(request, "Closed post: %s" % post.title)
             content = html.render(name="messages/offtopic_posts.html", user=post.author, comment=get("comment"), post=post)
             comment = Post(content=content, type=Post.COMMENT, parent=post, author=user)
@@ -266,6 +276,7 @@ class PostModeration(LoginRequiredMixin, FormView):
 
         if action == DUPLICATE:
             query.update(status=Post.CLOSED)
+            Change.log(Change.POST, [post.id])
             posts = Post.objects.filter(id__in=get("dupe"))
             content = html.render(name="messages/duplicate_posts.html", user=post.author, comment=get("comment"), posts=posts)
             comment = Post(content=content, type=Post.COMMENT, parent=post, author=user)
@@ -288,6 +299,8 @@ class PostModeration(LoginRequiredMixin, FormView):
             if delete_only:
                 # Deleted posts can be undeleted by re-opening them.
                 query.update(status=Post.DELETED)
+                Change.log(Change.POST, [post.id])
+                UserStats.rebuild([post.author_id])
                 messages.success(request, "Deleted post: %s" % post.title)
                 response = HttpResponseRedirect(post.root.get_absolute_url())
             else:
@@ -413,18 +426,22 @@ class UserModeration(LoginRequiredMixin, FormView):
             Vote.objects.filter(author=target).delete()
 
             # Mark all posts as deleted.
-            Post.objects.filter(author=target).update(status=Post.DELETED)
+            query = Post.objects.filter(author=target)
+            Change.log(Change.POST, query.values_list("id", flat=True))
+            query.update(status=Post.DELETED)
 
             # Destroy posts with no votes.
             query = Post.objects.filter(author=target, vote_count__lt=2)
             count = query.count()
             query.delete()
+            UserStats.rebuild([target.id])
 
             messages.success(request, "User banned, %s posts removed" % count)
 
 
         # Apply the new status
         User.objects.filter(pk=target.id).update(status=action)
+        Change.log(Change.USER, [target.id])
 
         messages.success(request, 'Moderation completed')
         return response
@@ -0,0 +1,103 @@
+import json
+import logging
+from datetime import timedelta
+
+from django.test import TestCase
+from django.core.urlresolvers import reverse
+from django.test.utils import override_settings
+
+from ..api import datetime_to_unix
+from biostar.apps.posts.models import Post, Vote
+from biostar.apps.users.models import User
+from biostar import const
+
+
+logging.disable(logging.WARNING)
+haystack_logger = logging.getLogger('haystack')
+
+
+class ApiBulkTest(TestCase):
+    def setUp(self):
+        # Disable haystack logger (testing will raise errors on more_like_this field in templates).
+        haystack_logger.setLevel(logging.CRITICAL)
+
+        self.user = User.objects.create(email='test@test.com', password='...')
+
+        self.posts = []
+        for count in range(3):
+            post = Post(title="Post %s, title needs to be sufficiently long" % count,
+                        content='Lorem ipsum', tag_val='tag_val', author=self.user,
+                        type=Post.QUESTION)
+            post.save()
+            self.posts.append(post)
+
+        self.answer = Post(content='Lorem ipsum', author=self.user, type=Post.ANSWER,
+                           parent=self.posts[0])
+        self.answer.save()
+        self.vote = Vote.objects.create(author=self.user, post=self.posts[0], type=Vote.UP)
+
+    def get_lines(self, response):
+        self.assertEqual(response.status_code, 200)
+        text = ''.join(response.streaming_content)
+        return [json.loads(line) for line in text.splitlines()]
+
+    def test_posts_by_ids(self):
+        ids = [self.posts[0].id, self.answer.id]
+        url = reverse('api-post-list') + '?ids=%s' % ','.join(map(str, ids))
+        lines = self.get_lines(self.client.get(url))
+
+        self.assertEqual([line['id'] for line in lines], ids)
+        self.assertEqual(lines[1]['parent_id'], self.posts[0].id)
+        self.assertEqual(lines[1]['author'], self.user.name)
+        self.assertTrue(lines[1]['url'].endswith('#%s' % self.answer.id))
+
+    def test_bulk_matches_details(self):
+        url = reverse('api-post-list') + '?ids=%s' % self.posts[1].id
+        lines = self.get_lines(self.client.get(url))
+
+        r = self.client.get(reverse('api-post', kwargs={'id': self.posts[1].id}))
+        self.assertEqual(lines, [json.loads(r.content)])
+
+    def test_posts_since(self):
+        since = datetime_to_unix(const.now() - timedelta(hours=1))
+        lines = self.get_lines(self.client.get(reverse('api-posts-since', kwargs={'timestamp': since})))
+        self.assertEqual(len(lines), Post.objects.count())
+
+        since = datetime_to_unix(const.now() + timedelta(hours=1))
+        lines = self.get_lines(self.client.get(reverse('api-posts-since', kwargs={'timestamp': since})))
+        self.assertEqual(lines, [])
+
+    def test_votes_since(self):
+        since = datetime_to_unix(const.now() - timedelta(hours=1))
+        lines = self.get_lines(self.client.get(reverse('api-votes-since', kwargs={'timestamp': since})))
+        self.assertEqual([line['id'] for line in lines], [self.vote.id])
+        self.assertEqual(lines[0]['post_id'], self.posts[0].id)
+
+    @override_settings(API_BULK_LIMIT=2)
+    def test_posts_since_pages(self):
+        # All posts share the same second.
+        Post.objects.all().update(lastedit_date=const.now())
+        since = datetime_to_unix(const.now() - timedelta(hours=1))
+        url, ids = reverse('api-posts-since', kwargs={'timestamp': since}), []
+        while url:
+            r = self.client.get(url)
+            ids.extend(line['id'] for line in self.get_lines(r))
+            url = r.get('X-Next-Page')
+        self.assertEqual(ids, sorted(Post.objects.values_list('id', flat=True)))
+
+    @override_settings(API_BULK_LIMIT=1)
+    def test_votes_since_pages(self):
+        Vote.objects.create(author=self.user, post=self.posts[1], type=Vote.UP)
+        Vote.objects.all().update(date=const.now())
+        since = datetime_to_unix(const.now() - timedelta(hours=1))
+        r = self.client.get(reverse('api-votes-since', kwargs={'timestamp': since}))
+        first = self.get_lines(r)
+        r = self.client.get(r['X-Next-Page'])
+        second = self.get_lines(r)
+        self.assertFalse(r.has_header('X-Next-Page'))
+        self.assertEqual([line['id'] for line in first + second],
+                         sorted(Vote.objects.values_list('id', flat=True)))
+
+    def test_invalid_after(self):
+        url = reverse('api-votes-since', kwargs={'timestamp': 0}) + '?after=yesterday,1'
+        self.assertEqual(self.client.get(url).status_code, 404)
@@ -0,0 +1,86 @@
+import json
+import logging
+from datetime import timedelta
+
+from django.test import TestCase
+from django.core.urlresolvers import reverse
+from django.test.utils import override_settings
+
+from biostar.apps.posts.models import Post, Vote, Change
+from biostar.apps.users.models import User
+from biostar.server.ajax import perform_vote
+from biostar import const
+
+
+logging.disable(logging.WARNING)
+haystack_logger = logging.getLogger('haystack')
+
+
+@override_settings(CHANGE_LOG_LAG_SECONDS=0)
+class ApiChangesTest(TestCase):
+    def setUp(self):
+        # Disable haystack logger (testing will raise errors on more_like_this field in templates).
+        haystack_logger.setLevel(logging.CRITICAL)
+
+        self.user = User.objects.create(email='test@test.com', password='...')
+        self.other = User.objects.create(email='other@test.com', password='...')
+        self.post = Post(title="Post 1, title needs to be sufficiently long", content='Lorem ipsum',
+                         tag_val='tag_val', author=self.user, type=Post.QUESTION)
+        self.post.save()
+
+    def get_changes(self, seq):
+        r = self.client.get(reverse('api-changes', kwargs={'seq': seq}))
+        return json.loads(r.content)
+
+    def last_seq(self):
+        return Change.objects.order_by('-id')[0].id
+
+    def test_saves_are_logged(self):
+        content = self.get_changes(0)
+        found = set((c['type'], c['id']) for c in content['changes'])
+        self.assertTrue(('user', self.user.id) in found)
+        self.assertTrue(('post', self.post.id) in found)
+        self.assertEqual(content['last'], self.last_seq())
+        self.assertFalse(content['more'])
+
+    def test_vote_counts_are_logged(self):
+        seq = self.last_seq()
+
+        # Votes update the post counts with queries that bypass the signals.
+        perform_vote(post=self.post, user=self.other, vote_type=Vote.UP)
+        found = set((c['type'], c['id'], c['action']) for c in self.get_changes(seq)['changes'])
+        self.assertTrue(('post', self.post.id, 'saved') in found)
+        self.assertTrue(('user', self.user.id, 'saved') in found)
+        self.assertTrue(('vote', Vote.objects.get().id, 'saved') in found)
+
+        seq = self.last_seq()
+        perform_vote(post=self.post, user=self.other, vote_type=Vote.UP)
+        actions = [(c['type'], c['action']) for c in self.get_changes(seq)['changes']]
+        self.assertTrue(('vote', 'deleted') in actions)
+
+    def test_nothing_new(self):
+        content = self.get_changes(self.last_seq())
+        self.assertEqual(content['changes'], [])
+        self.assertEqual(content['last'], self.last_seq())
+
+    @override_settings(API_BULK_LIMIT=2)
+    def test_paging(self):
+        seq, seen = 0, []
+        while True:
+            content = self.get_changes(seq)
+            self.assertTrue(len(content['changes']) <= 2)
+            seen.extend(c['seq'] for c in content['changes'])
+            seq = content['last']
+            if not content['more']:
+                break
+        self.assertEqual(seen, list(Change.objects.order_by('id').values_list('id', flat=True)))
+
+    @override_settings(CHANGE_LOG_LAG_SECONDS=60)
+    def test_recent_changes_held_back(self):
+        # The changes may still have uncommitted ones with lower ids before them.
+        content = self.get_changes(0)
+        self.assertEqual(content['changes'], [])
+        self.assertEqual(content['last'], 0)
+
+        Change.objects.update(date=const.now() - timedelta(minutes=5))
+        self.assertEqual(self.get_changes(0)['last'], self.last_seq())
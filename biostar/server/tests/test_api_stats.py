@@ -6,7 +6,8 @@ from django.test import TestCase
 from django.core.urlresolvers import reverse
 from django.test.utils import override_settings
 
-from biostar.apps.posts.models import Post, Vote
+from biostar.apps.posts.models import Post, Vote, DailyStats
+from biostar.server.api import backfill_daily_stats, update_daily_stats
 from biostar.apps.users.models import User
 
 
@@ -179,4 +180,99 @@ class ApiStatsTest3(TestCase):
         r = self.client.get(reverse('api-stats-on-day', kwargs={'day': 3}))
         content_day = json.loads(r.content)
 
-        self.assertEqual(content_day, content_date)
\ No newline at end of file
+        self.assertEqual(content_day, content_date)
+
+class ApiStatsRollupTest(ApiStatsTest3):
+    def get_day(self, day):
+        r = self.client.get(reverse('api-stats-on-day', kwargs={'day': day}))
+        return json.loads(r.content)
+
+    @override_settings(DEBUG=True)
+    def test_backfill_matches_computed(self):
+        """
+        The rolled up days match the stats computed on the fly.
+        """
+        computed = [self.get_day(day) for day in range(4)]
+
+        backfill_daily_stats()
+        self.assertTrue(DailyStats.objects.count() >= 4)
+
+        rolled = [self.get_day(day) for day in range(4)]
+        self.assertEqual(computed, rolled)
+
+    @override_settings(DEBUG=True)
+    def test_update_matches_backfill(self):
+        """
+        The nightly update continues the running totals of the last stored day.
+        """
+        backfill_daily_stats()
+        expected = [self.get_day(day) for day in range(4)]
+
+        last = DailyStats.objects.order_by('date')[1]
+        DailyStats.objects.filter(date__gt=last.date).delete()
+        update_daily_stats()
+
+        self.assertEqual(expected, [self.get_day(day) for day in range(4)])
+
+    @override_settings(DEBUG=True)
+    def test_update_fills_gaps(self):
+        """
+        The days missing before a day stored on demand are filled in.
+        """
+        backfill_daily_stats()
+        fields = ('date', 'questions', 'answers', 'comments', 'votes', 'users')
+        expected = list(DailyStats.objects.order_by('date').values_list(*fields))
+        gap = [expected[1][0], expected[2][0]]
+        DailyStats.objects.filter(date__in=gap).delete()
+
+        update_daily_stats()
+        self.assertEqual(list(DailyStats.objects.order_by('date').values_list(*fields)), expected)
+
+
+class ApiStatsRangeTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='test@test.com', password='...')
+        self.user.profile.date_joined = datetime.today() - timedelta(days=5)
+        self.user.profile.save()
+
+        post = Post(title="Post 1, title needs to be sufficiently long", content="Lorem ipsum",
+                    tag_val='tag_val', author=self.user, type=Post.QUESTION)
+        post.creation_date = datetime.today() - timedelta(days=5)
+        post.save()
+        backfill_daily_stats()
+
+        self.start = (datetime.today() - timedelta(days=10)).strftime("%Y-%m-%d")
+        self.end = datetime.today().strftime("%Y-%m-%d")
+
+    def get_range(self, start, end, **extra):
+        return self.client.get(reverse('api-stats-range', kwargs={'start': start, 'end': end}),
+                               **extra)
+
+    def test_columns(self):
+        r = self.get_range(self.start, self.end)
+        content = json.loads(r.content)
+        days = DailyStats.objects.count()
+        self.assertEqual(len(content['date']), days)
+        self.assertEqual(len(content['questions']), days)
+        self.assertEqual(content['questions'][-1], 1)
+        self.assertEqual(content['users'][-1], 1)
+
+    def test_etag(self):
+        r = self.get_range(self.start, self.end)
+        r = self.get_range(self.start, self.end, HTTP_IF_NONE_MATCH=r['ETag'])
+        self.assertEqual(r.status_code, 304)
+
+    def test_gzip(self):
+        r = self.get_range(self.start, self.end, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(r['Content-Encoding'], 'gzip')
+        r = self.get_range(self.start, self.end, HTTP_IF_NONE_MATCH=r['ETag'],
+                           HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(r.status_code, 304)
+
+    def test_invalid_range(self):
+        r = self.get_range(self.end, self.start)
+        self.assertEqual(r.status_code, 404)
+
+    def test_invalid_date(self):
+        r = self.get_range('2014-02-30', self.end)
+        self.assertEqual(r.status_code, 404)
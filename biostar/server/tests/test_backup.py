@@ -0,0 +1,77 @@
+import json, logging, os, shutil, tempfile
+
+from django.test import TestCase
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from biostar.apps.posts.models import Post
+from biostar.apps.users.models import User, Profile
+from biostar.server.management.commands import biostar_pg_dump, biostar_pg_restore
+
+
+logging.disable(logging.WARNING)
+
+
+class BackupTest(TestCase):
+    def setUp(self):
+        self.outdir = tempfile.mkdtemp()
+        self.user = User.objects.create(email='test@test.com', password='...')
+        self.post = Post(title="A question about backups", content="How do I restore?", tag_val="backup",
+                         author=self.user, type=Post.QUESTION)
+        self.post.save()
+        self.post.add_tags(self.post.tag_val)
+
+    def tearDown(self):
+        shutil.rmtree(self.outdir)
+
+    def dump(self, **kwds):
+        return biostar_pg_dump.main(pg_user="www", hourly=False, prog="pg_dump", outdir=self.outdir, **kwds)
+
+    def manifest(self):
+        return json.load(open(os.path.join(self.outdir, biostar_pg_dump.MANIFEST)))
+
+    def test_manifest(self):
+        entry = self.dump()
+        self.assertEqual(entry['format'], "serializer")
+        self.assertEqual(self.manifest()['dumps'], [entry])
+
+        path = os.path.join(self.outdir, entry['name'])
+        self.assertEqual(entry['size'], os.path.getsize(path))
+        self.assertEqual(entry['checksum'], biostar_pg_dump.checksum(path))
+        self.assertFalse(os.path.exists(path + ".tmp"))
+
+    def test_restore(self):
+        self.dump()
+        post_id, tag_ids = self.post.id, list(self.post.tag_set.values_list("id", flat=True))
+
+        # Restores go into an empty database.
+        call_command("flush", interactive=False, load_initial_data=False)
+        self.assertEqual(Profile.objects.count(), 0)
+
+        call_command("biostar_pg_restore", indir=self.outdir)
+
+        post = Post.objects.get(id=post_id)
+        self.assertEqual(post.author.email, self.user.email)
+        self.assertEqual(list(post.tag_set.values_list("id", flat=True)), tag_ids)
+        self.assertEqual(Profile.objects.count(), 1)
+
+    def test_verify(self):
+        entry = self.dump()
+        open(os.path.join(self.outdir, entry['name']), "ab").write("junk")
+        self.assertRaises(CommandError, biostar_pg_restore.main, name=None, indir=self.outdir,
+                          pg_user="www", prog="pg_restore", psql="psql")
+
+    def test_rotate(self):
+        # Pretend that older daily dumps exist.
+        manifest = dict(dumps=[])
+        for day in (1, 2):
+            name = "old-%s.json.gz" % day
+            open(os.path.join(self.outdir, name), "wb").write("...")
+            manifest['dumps'].append(dict(name=name, hourly=False, date="2010-01-0%sT00:00:00" % day))
+        manifest['dumps'].append(dict(name="hourly", hourly=True, date="2010-01-01T00:00:00"))
+        biostar_pg_dump.write_manifest(self.outdir, manifest)
+
+        entry = self.dump(keep=2)
+        names = [e['name'] for e in self.manifest()['dumps']]
+        self.assertEqual(sorted(names), sorted(["old-2.json.gz", "hourly", entry['name']]))
+        self.assertFalse(os.path.exists(os.path.join(self.outdir, "old-1.json.gz")))
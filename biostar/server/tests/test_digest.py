@@ -0,0 +1,103 @@
+import logging, os, tempfile
+from datetime import datetime, timedelta
+
+from django.test import TestCase
+from django.core import mail
+
+from biostar.apps.users.models import User
+from biostar.apps.posts.models import Post, DigestDay
+from biostar.server.api import day_bounds
+from biostar.server.management.commands import digest
+
+
+logging.disable(logging.WARNING)
+
+
+class DigestTest(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create(email='user%s@test.com' % i, password='...') for i in range(5)]
+        self.emails = tempfile.NamedTemporaryFile(delete=False)
+        self.emails.write("\n".join(user.email for user in self.users))
+        self.emails.close()
+        self.digest = digest.Digest(subject="Digest", text_body="Unsubscribe: %(digest_unsubscribe)s",
+                                    html_body="<a href='%(digest_unsubscribe)s'>100%</a>")
+
+    def tearDown(self):
+        os.remove(self.emails.name)
+
+    def send(self, checkpoint):
+        recipients = digest.file_recipients(self.emails.name)
+        return digest.send_digest(self.digest, recipients=recipients, checkpoint=checkpoint,
+                                  rate=1000, workers=2)
+
+    def test_fill(self):
+        text, html = self.digest.fill(uuid="abc")
+        self.assertTrue(text.endswith("/abc/"))
+        self.assertTrue("100%" in html)
+
+    def test_send(self):
+        checkpoint = digest.Checkpoint(self.emails.name + ".sent")
+        counts = self.send(checkpoint)
+        checkpoint.finish()
+        self.assertEqual(counts['sent'], 5)
+        self.assertEqual(len(mail.outbox), 5)
+        body = dict((m.to[0], m.body) for m in mail.outbox)
+        for user in self.users:
+            self.assertTrue(user.profile.uuid in body[user.email])
+        self.assertFalse(os.path.isfile(self.emails.name + ".sent"))
+
+    def test_resume(self):
+        fname = self.emails.name + ".sent"
+        with open(fname, 'wt') as fp:
+            fp.write("user0@test.com\nuser1@test.com\n")
+        checkpoint = digest.Checkpoint(fname)
+        counts = self.send(checkpoint)
+        checkpoint.finish()
+        self.assertEqual(counts['sent'], 3)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox),
+                         ['user2@test.com', 'user3@test.com', 'user4@test.com'])
+
+    def test_pref_recipients(self):
+        user = self.users[0]
+        user.profile.digest_prefs = user.profile.DAILY_DIGEST
+        user.profile.save()
+        banned = self.users[1]
+        banned.profile.digest_prefs = banned.profile.DAILY_DIGEST
+        banned.profile.save()
+        banned.status = User.BANNED
+        banned.save()
+
+        recipients = list(digest.pref_recipients('daily'))
+        self.assertEqual(recipients, [(user.email, user.profile.uuid)])
+        self.assertEqual(len(list(digest.pref_recipients('weekly'))), 3)
+
+
+class DigestContentTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='test@test.com', password='...')
+        today = datetime.today().date()
+        for days in (1, 3):
+            start, end = day_bounds(today - timedelta(days=days))
+            post = Post(title="Post %s days ago, title needs to be long" % days, content="Lorem ipsum " * 10,
+                        tag_val='tag_val', author=self.user, type=Post.QUESTION, status=Post.OPEN)
+            post.creation_date = start + timedelta(hours=1)
+            post.save()
+
+    def render(self, days):
+        options = dict(subject="Digest")
+        return digest.render_digest(days=days, text_tmpl="digest/daily_digest.txt", html_tmpl=None,
+                                    send=None, options=options, verbosity=0)
+
+    def test_daily(self):
+        text, html = self.render(days=1).fill(uuid="abc")
+        self.assertTrue("Post 1 days ago" in text)
+        self.assertFalse("Post 3 days ago" in text)
+        self.assertEqual(DigestDay.objects.count(), 1)
+
+    def test_weekly_reuses_days(self):
+        self.render(days=1)
+        text, html = self.render(days=7).fill(uuid="abc")
+        self.assertTrue("Post 1 days ago" in text)
+        self.assertTrue("Post 3 days ago" in text)
+        self.assertTrue("(2)" in text)
+        self.assertEqual(DigestDay.objects.count(), 7)
@@ -0,0 +1,88 @@
+import gzip, json, logging, os, shutil, tempfile
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from biostar.apps.posts.models import Post
+from biostar.apps.users.models import User, Profile
+from biostar.server.management.commands import patch
+
+
+logging.disable(logging.WARNING)
+
+
+@override_settings(CHANGE_LOG_LAG_SECONDS=0)
+class ExportTest(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.user = User.objects.create(email='test@test.com', password='...')
+        self.post = Post(title="Post title needs to be sufficiently long", content="Lorem ipsum " * 10,
+                         tag_val='tag_val', author=self.user, type=Post.QUESTION, status=Post.OPEN)
+        self.post.save()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def rows(self, manifest, table):
+        rows = []
+        for entry in manifest['tables'][table].values():
+            fname = os.path.join(self.path, entry['file'])
+            stream = gzip.open(fname) if fname.endswith(".gz") else open(fname)
+            rows.extend(json.loads(line) for line in stream)
+        return rows
+
+    def test_export(self):
+        manifest = patch.export_data(self.path)
+        users = self.rows(manifest, 'users')
+        posts = self.rows(manifest, 'posts')
+        self.assertEqual([u['email'] for u in users], ['test@test.com'])
+        self.assertEqual(posts[0]['title'], self.post.title)
+        self.assertEqual(posts[0]['type'], 'Question')
+        self.assertEqual(posts[0]['root'], self.post.id)
+
+    def test_gzip(self):
+        manifest = patch.export_data(self.path, compress=True)
+        self.assertEqual(len(self.rows(manifest, 'posts')), 1)
+
+    def test_incremental(self):
+        first = patch.export_data(self.path)
+        entry = first['tables']['posts'].values()[0]
+        fname = os.path.join(self.path, entry['file'])
+        os.utime(fname, (0, 0))
+
+        # Nothing changed, the file is kept.
+        patch.export_data(self.path)
+        self.assertEqual(os.path.getmtime(fname), 0)
+
+        # A changed post is exported again.
+        self.post.title = "Changed title needs to be sufficiently long"
+        self.post.save()
+        second = patch.export_data(self.path)
+        self.assertNotEqual(os.path.getmtime(fname), 0)
+        self.assertEqual(self.rows(second, 'posts')[0]['title'], self.post.title)
+
+    def test_profile_change(self):
+        first = patch.export_data(self.path)
+        entry = first['tables']['users'].values()[0]
+        os.utime(os.path.join(self.path, entry['file']), (0, 0))
+
+        # The profile is exported with the user.
+        profile = Profile.objects.get(user=self.user)
+        profile.location = "Narnia"
+        profile.save()
+        second = patch.export_data(self.path)
+        self.assertEqual(self.rows(second, 'users')[0]['location'], "Narnia")
+
+    def test_workers(self):
+        manifest = patch.export_data(self.path, workers=2)
+        self.assertEqual(len(self.rows(manifest, 'users')), 1)
+        self.assertEqual(len(self.rows(manifest, 'posts')), 1)
+
+        # The parent can still use the database after the pool is done.
+        self.assertEqual(Post.objects.count(), 1)
+
+    @override_settings(CHANGE_LOG_LAG_SECONDS=60)
+    def test_recent_changes_kept(self):
+        # The recent changes are not settled, the next export looks at them again.
+        manifest = patch.export_data(self.path)
+        self.assertEqual(manifest['seq'], 0)
@@ -0,0 +1,59 @@
+import logging
+from datetime import timedelta
+
+from django.test import TestCase
+from django.core.urlresolvers import reverse
+
+from biostar.apps.posts.models import Post
+from biostar.apps.users.models import User
+from biostar import const
+
+
+logging.disable(logging.WARNING)
+haystack_logger = logging.getLogger('haystack')
+
+
+class FeedTest(TestCase):
+    def setUp(self):
+        # Disable haystack logger (testing will raise errors on more_like_this field in templates).
+        haystack_logger.setLevel(logging.CRITICAL)
+
+        self.user = User.objects.create(email='test@test.com', password='...')
+
+        # The latest feed delays posts by two hours.
+        title = "Post 1, title needs to be sufficiently long"
+        content = ('Lorem ipsum dolor sit amet, consectetur adipisicing elit, sed do eiusmod'
+                   'tempor incididunt ut labore et dolore magna aliqua.')
+        self.post = Post(title=title, content=content, tag_val='tag_val', author=self.user,
+                         type=Post.QUESTION, status=Post.OPEN)
+        self.post.creation_date = const.now() - timedelta(hours=3)
+        self.post.save()
+
+    def test_feed_headers(self):
+        r = self.client.get(reverse('latest-feed'))
+        self.assertEqual(r.status_code, 200)
+        self.assertContains(r, self.post.title)
+        self.assertTrue(r['ETag'])
+        self.assertTrue(r['Last-Modified'])
+
+    def test_etag_not_modified(self):
+        r = self.client.get(reverse('latest-feed'))
+        r = self.client.get(reverse('latest-feed'), HTTP_IF_NONE_MATCH=r['ETag'])
+        self.assertEqual(r.status_code, 304)
+        self.assertEqual(r.content, '')
+
+    def test_last_modified_not_modified(self):
+        r = self.client.get(reverse('tag-feed', kwargs={'text': 'tag_val'}))
+        r = self.client.get(reverse('tag-feed', kwargs={'text': 'tag_val'}),
+                            HTTP_IF_MODIFIED_SINCE=r['Last-Modified'])
+        self.assertEqual(r.status_code, 304)
+
+    def test_stale_etag(self):
+        r = self.client.get(reverse('latest-feed'), HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(r.status_code, 200)
+        self.assertContains(r, self.post.title)
+
+    def test_feeds_differ_by_parameters(self):
+        r1 = self.client.get(reverse('user-feed', kwargs={'text': self.user.id}))
+        r2 = self.client.get(reverse('user-feed', kwargs={'text': self.user.id + 1}))
+        self.assertNotEqual(r1['ETag'], r2['ETag'])
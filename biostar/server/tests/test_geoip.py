@@ -0,0 +1,70 @@
+import gzip, logging, os, shutil, tempfile
+
+from django.test import TestCase
+from django.core.management import call_command
+
+from biostar.apps.users.models import User, Profile
+from biostar.apps.util import geoip
+from biostar import awards
+
+
+logging.disable(logging.WARNING)
+
+RANGES = '''"16777216","16777471","AU","Australia"
+"1.0.1.0","1.0.3.255","CN","China"
+"3232235520","3232301055","-","-"
+"134744064","134744319","US","United States of America"
+'''
+
+
+class GeoIPTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fname = os.path.join(self.dir, "geoip.csv.gz")
+        stream = gzip.open(self.fname, "wb")
+        stream.write(RANGES)
+        stream.close()
+        geoip.DATABASE = None
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        geoip.DATABASE = None
+
+    def test_lookup(self):
+        database = geoip.GeoIP.load(self.fname)
+        self.assertEqual(len(database), 3)
+        self.assertEqual(database.country("1.0.0.1"), "Australia")
+        self.assertEqual(database.country("1.0.2.200"), "China")
+        self.assertEqual(database.country("8.8.8.8"), "United States Of America")
+        self.assertEqual(database.country("1.0.4.0"), "")
+        self.assertEqual(database.country("192.168.0.1"), "")
+        self.assertEqual(database.country("::1"), "")
+        self.assertEqual(database.country("junk"), "")
+        self.assertEqual(database.cache.get("1.0.0.1"), "Australia")
+
+    def test_lru(self):
+        cache = geoip.LRU(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.get("a"), 1)
+
+    def test_user_location(self):
+        user = User.objects.create(email='test@test.com')
+        other = User.objects.create(email='other@test.com')
+        Profile.objects.filter(user=user).update(last_ip="1.0.0.10")
+        Profile.objects.filter(user=other).update(last_ip="1.0.0.11", location="Narnia")
+
+        with self.settings(GEOIP_DATABASE=self.fname):
+            call_command("user_location")
+
+        self.assertEqual(Profile.objects.get(user=user).location, "Australia")
+        self.assertEqual(Profile.objects.get(user=other).location, "Narnia")
+
+    def test_check_user_profile(self):
+        user = User.objects.create(email='test@test.com')
+        with self.settings(GEOIP_DATABASE=self.fname):
+            awards.check_user_profile("1.0.1.1", user.id)
+        self.assertEqual(Profile.objects.get(user=user).location, "China")
@@ -0,0 +1,232 @@
+import csv, logging, os, shutil, tempfile
+from StringIO import StringIO
+
+from django.test import TestCase
+from django.core.management import call_command
+from django.db.models import signals
+
+from biostar.apps.posts.models import Post, Subscription, Tag
+from biostar.apps.users.models import User
+from biostar.apps.badges.models import Award
+
+
+logging.disable(logging.WARNING)
+
+COLUMNS = ["id", "root_id", "parent_id", "title", "tag_val", "author_id", "lastedit_user", "post_type",
+           "post_status", "creation_date", "lastedit_date", "views", "answer_count", "book_count",
+           "full_score", "score", "url"]
+
+
+class BulkImportTest(TestCase):
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.source, "posts"))
+        self.user = User.objects.create(email='test@test.com', password='...')
+        self.other = User.objects.create(email='other@test.com', password='...')
+
+        rows = [
+            (1000, 1000, 1000, "a question title", "rna-seq bwa", self.user.id, "Question"),
+            (1001, 1000, 1000, "", "", self.other.id, "Answer"),
+            (1002, 1000, 1001, "", "", self.user.id, "Comment"),
+            (1003, 1003, 1003, "a tutorial title", "bwa", self.other.id, "Tutorial"),
+        ]
+        lines = ["\t".join(COLUMNS)]
+        for pk, root, parent, title, tags, author, ptype in rows:
+            values = [pk, root, parent, title, tags, author, author, ptype, "Open",
+                      "2010-01-01 10:00:00", "2010-01-02 10:00:00", 10, 0, 0, 0, 1, ""]
+            lines.append("\t".join(map(str, values)))
+            open(os.path.join(self.source, "posts", str(pk)), "wt").write("Body of post %s" % pk)
+        open(os.path.join(self.source, "posts.txt"), "wt").write("\n".join(lines) + "\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.source)
+        # The import disconnects the message signals.
+        from biostar.server import models
+        signals.post_save.connect(models.post_create_messages, sender=Post, dispatch_uid="post-create-messages")
+        signals.post_save.connect(models.award_create_messages, sender=Award, dispatch_uid="award-create-messages")
+
+    def test_bulk_import(self):
+        call_command("import_biostar1", posts=True, bulk=True, workers=1, dir=self.source, stdout=StringIO())
+
+        self.assertEqual(Post.objects.filter(id__gte=1000).count(), 4)
+        question = Post.objects.get(id=1000)
+        self.assertEqual(question.reply_count, 1)
+        self.assertEqual(question.subs_count, 2)
+        self.assertTrue("Body of post 1000" in question.html)
+
+        # The replies are titled like Post.check_root titles them.
+        self.assertEqual(Post.objects.get(id=1001).title, "A: %s" % question.title)
+        comment = Post.objects.get(id=1002)
+        self.assertEqual(comment.title, "C: %s" % question.title)
+        self.assertEqual(comment.root_id, question.id)
+
+        self.assertEqual(Subscription.objects.filter(post_id=1000).count(), 2)
+        self.assertEqual(Tag.objects.get(name="bwa").count, 2)
+        self.assertEqual(sorted(t.name for t in Post.objects.get(id=1003).tag_set.all()), ["bwa", "tutorial"])
+
+        # Importing again skips the existing posts.
+        call_command("import_biostar1", posts=True, bulk=True, workers=1, dir=self.source, stdout=StringIO())
+        self.assertEqual(Tag.objects.get(name="bwa").count, 2)
+
+    def test_bulk_import_workers(self):
+        # The parent keeps writing after the pool of workers has been used.
+        call_command("import_biostar1", posts=True, bulk=True, workers=2, dir=self.source, stdout=StringIO())
+        self.assertEqual(Post.objects.filter(id__gte=1000).count(), 4)
+        self.assertTrue("Body of post 1003" in Post.objects.get(id=1003).html)
+        self.assertEqual(Post.objects.get(id=1000).reply_count, 1)
+
+
+MBOX = """From alice at test.com  Mon Jan  4 10:00:00 2010
+From: Alice <alice at test.com>
+Subject: [BioC] reading bam files
+Date: Mon, 4 Jan 2010 10:00:00 +0000
+Message-ID: <1@test.com>
+
+How do I read bam files?
+
+From bob at test.com  Mon Jan  4 11:00:00 2010
+From: Bob <bob at test.com>
+Subject: Re: [BioC] reading bam files
+Date: Mon, 4 Jan 2010 11:00:00 +0000
+Message-ID: <2@test.com>
+In-Reply-To: <1@test.com>
+
+Use Rsamtools.
+
+From alice at test.com  Mon Jan  4 12:00:00 2010
+From: Alice <alice at test.com>
+Subject: Re: [BioC] reading bam files
+Date: Mon, 4 Jan 2010 12:00:00 +0000
+Message-ID: <3@test.com>
+In-Reply-To: <2@test.com>
+
+Thanks.
+"""
+
+
+SUBJECT_REPLY = """
+From carol at test.com  Tue Jan  5 10:00:00 2010
+From: Carol <carol at test.com>
+Subject: Re: [BioC] reading bam files
+Date: Tue, 5 Jan 2010 10:00:00 +0000
+Message-ID: <4@test.com>
+
+Try samtools view.
+"""
+
+
+class MboxImportTest(TestCase):
+    def setUp(self):
+        self.fname = tempfile.mktemp(suffix=".mbox")
+        open(self.fname, "wt").write(MBOX)
+
+    def tearDown(self):
+        os.remove(self.fname)
+        from biostar.server import models
+        signals.post_save.connect(models.post_create_messages, sender=Post, dispatch_uid="post-create-messages")
+        signals.post_save.connect(models.award_create_messages, sender=Award, dispatch_uid="award-create-messages")
+
+    def test_mbox_import(self):
+        call_command("import_mbox", file=self.fname, tags="bam", workers=1, stdout=StringIO())
+
+        question = Post.objects.get(type=Post.QUESTION)
+        self.assertEqual(question.title, "reading bam files")
+        self.assertEqual(question.author.email, "alice@test.com")
+        self.assertEqual(question.reply_count, 1)
+        self.assertEqual(question.subs_count, 2)
+        self.assertEqual(list(question.tag_set.values_list("name", flat=True)), ["bam"])
+
+        answer = Post.objects.get(type=Post.ANSWER)
+        comment = Post.objects.get(type=Post.COMMENT)
+        self.assertEqual(answer.parent_id, question.id)
+        self.assertEqual(comment.parent_id, answer.id)
+        self.assertEqual(comment.root_id, question.id)
+        self.assertEqual(question.lastedit_date, answer.creation_date)
+        self.assertEqual(User.objects.get(email="alice@test.com").score, 2)
+        self.assertEqual(answer.title, "A: reading bam files")
+        self.assertEqual(comment.title, "C: reading bam files")
+
+        # The sequence continues after the explicit ids.
+        post = Post.objects.create(title="a new question", content="...", type=Post.QUESTION, author=question.author)
+        self.assertTrue(post.id > comment.id)
+
+    def test_subject_match(self):
+        # A reply without In-Reply-To is matched to the thread by its subject.
+        open(self.fname, "at").write(SUBJECT_REPLY)
+        call_command("import_mbox", file=self.fname, workers=1, stdout=StringIO())
+
+        question = Post.objects.get(type=Post.QUESTION)
+        answers = Post.objects.filter(type=Post.ANSWER).order_by('id')
+        self.assertEqual([a.parent_id for a in answers], [question.id, question.id])
+        self.assertEqual(answers[1].title, "A: reading bam files")
+        self.assertEqual(Post.objects.get(id=question.id).reply_count, 2)
+
+    def test_mbox_import_workers(self):
+        call_command("import_mbox", file=self.fname, tags="bam", workers=2, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 3)
+        self.assertEqual(Post.objects.get(type=Post.QUESTION).reply_count, 1)
+        self.assertTrue("Rsamtools" in Post.objects.get(type=Post.ANSWER).html)
+
+    def test_dry_run(self):
+        call_command("import_mbox", file=self.fname, dry=True, workers=1, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 0)
+
+
+class PhpbbImportTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.posts = os.path.join(self.dir, "phpbb_posts.csv")
+        self.users = os.path.join(self.dir, "phpbb_users.csv")
+
+        def row(uid, stamp, title, body):
+            values = [""] * 16
+            values[3], values[6], values[14], values[15] = uid, stamp, title, body
+            return values
+
+        writer = csv.writer(open(self.posts, "wb"))
+        writer.writerow(["header"] * 16)
+        writer.writerow(row(2, 1262600000, "Installing tools", "How to install?"))
+        writer.writerow(row(3, 1262603600, "Re: Installing tools", "Use the toolshed."))
+        writer.writerow(row(2, 1262607200, "Re: Installing", "Truncated reply title."))
+        writer.writerow(row(3, 1262610800, "Re: Missing topic", "Never matched."))
+
+        writer = csv.writer(open(self.users, "wb"))
+        writer.writerow(["header"] * 13)
+        for uid, name, email in [(2, "Alice", "alice@test.com"), (3, "Bob", "bob@test.com")]:
+            values = [""] * 13
+            values[0], values[7], values[12] = uid, name, email
+            writer.writerow(values)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_phpbb_import(self):
+        call_command("import_phpbb", post=self.posts, user=self.users, stdout=StringIO())
+
+        self.assertEqual(Post.objects.count(), 3)
+        topic = Post.objects.get(type=Post.QUESTION)
+        self.assertEqual(topic.title, "Installing tools")
+        self.assertEqual(topic.reply_count, 2)
+        self.assertEqual(topic.subs_count, 2)
+
+        answers = Post.objects.filter(type=Post.ANSWER)
+        self.assertEqual(set(answers.values_list("root_id", flat=True)), set([topic.id]))
+        self.assertEqual(set(answers.values_list("title", flat=True)), set(["A: %s" % topic.title]))
+        self.assertEqual(topic.lastedit_date, answers.order_by("-creation_date")[0].creation_date)
+
+    def test_existing_topic(self):
+        # A reply in a later dump goes to the topic imported before.
+        call_command("import_phpbb", post=self.posts, user=self.users, stdout=StringIO())
+        topic = Post.objects.get(type=Post.QUESTION)
+
+        values = [""] * 16
+        values[3], values[6], values[14], values[15] = 3, 1262620000, "Re: Installing tools", "Another reply."
+        with open(self.posts, "wb") as stream:
+            writer = csv.writer(stream)
+            writer.writerow(["header"] * 16)
+            writer.writerow(values)
+        call_command("import_phpbb", post=self.posts, user=self.users, stdout=StringIO())
+
+        self.assertEqual(Post.objects.filter(type=Post.ANSWER, root_id=topic.id).count(), 3)
+        self.assertEqual(Post.objects.order_by('-id')[0].title, "A: Installing tools")
+        self.assertEqual(Post.objects.get(id=topic.id).reply_count, 3)
@@ -0,0 +1,43 @@
+import logging
+
+from django.test import TestCase
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.core.mail.backends.locmem import EmailBackend
+
+from biostar import mailer
+
+
+logging.disable(logging.WARNING)
+
+
+class FailingBackend(EmailBackend):
+    "Fails on the messages sent to a bad address"
+    def send_messages(self, messages):
+        for message in messages:
+            if 'bad@test.com' in message.to:
+                raise Exception("rejected")
+        return super(FailingBackend, self).send_messages(messages)
+
+
+class MailerTest(TestCase):
+    def setUp(self):
+        self.backend = mailer.BACKEND
+
+    def tearDown(self):
+        mailer.BACKEND = self.backend
+
+    def messages(self, emails):
+        return [EmailMessage("Subject", "Body", "from@test.com", [email]) for email in emails]
+
+    def test_send_chunk(self):
+        mailer.BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+        sent = mailer.send_emails(self.messages(["a@test.com", "b@test.com", "c@test.com"]))
+        self.assertEqual(sent, 3)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_failures_do_not_stop_the_chunk(self):
+        mailer.BACKEND = 'biostar.server.tests.test_mailer.FailingBackend'
+        sent = mailer.send_emails(self.messages(["a@test.com", "bad@test.com", "c@test.com"]))
+        self.assertEqual(sent, 2)
+        self.assertEqual([m.to[0] for m in mail.outbox], ["a@test.com", "c@test.com"])
@@ -0,0 +1,31 @@
+import logging, os, tempfile
+
+from django.test import TestCase
+
+from biostar.apps.users.models import User
+from biostar.apps.messages.models import Message
+from biostar.server.management.commands import patch
+
+
+logging.disable(logging.WARNING)
+
+
+class MergeTest(TestCase):
+    def setUp(self):
+        self.master = User.objects.create(email='master@test.com', password='...')
+        self.alias = User.objects.create(email='alias@test.com', password='...')
+
+    def test_message_count(self):
+        # Each user has the welcome message.
+        fd, fname = tempfile.mkstemp()
+        with os.fdopen(fd, "w") as stream:
+            stream.write("master@test.com alias@test.com\n")
+        try:
+            patch.merge_users(fname)
+        finally:
+            os.remove(fname)
+
+        master = User.objects.get(id=self.master.id)
+        self.assertFalse(User.objects.filter(id=self.alias.id).exists())
+        self.assertEqual(Message.objects.filter(user=master).count(), 2)
+        self.assertEqual(master.message_count, 2)
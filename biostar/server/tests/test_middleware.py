@@ -0,0 +1,148 @@
+import logging
+from datetime import timedelta
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.core.cache import get_cache
+from django.core.urlresolvers import reverse
+from django.contrib.sessions.models import Session
+
+from biostar.apps.posts.models import Post
+from biostar.apps.users.models import User, Profile
+from biostar.server import middleware
+from biostar import const
+
+
+logging.disable(logging.WARNING)
+haystack_logger = logging.getLogger('haystack')
+
+
+class CountsTest(TestCase):
+    def setUp(self):
+        haystack_logger.setLevel(logging.CRITICAL)
+
+        # The test settings use a dummy cache.
+        self.cache = middleware.cache
+        middleware.cache = get_cache('django.core.cache.backends.locmem.LocMemCache')
+
+        self.user = User.objects.create(email='test@test.com')
+        self.user.set_password('password')
+        self.user.save()
+
+        author = User.objects.create(email='other@test.com')
+        post = Post(title="A question that is sufficiently long", content="Lorem ipsum dolor sit amet",
+                    tag_val="rna-seq", author=author, type=Post.QUESTION)
+        post.save()
+        post.add_tags(post.tag_val)
+
+    def tearDown(self):
+        middleware.cache = self.cache
+
+    def counts(self):
+        return middleware.cache.get(middleware.counts_key(self.user))
+
+    def test_anonymous_session(self):
+        self.client.get(reverse("home"))
+        self.assertFalse(Session.objects.exists())
+        # The page does not show counts to anonymous users so none are computed.
+        self.assertEqual(middleware.cache.get(middleware.SESSION_KEY), None)
+
+    def test_session_not_written(self):
+        self.assertTrue(self.client.login(email=self.user.email, password='password'))
+        self.assertEqual(self.counts()['latest'], 1)
+
+        session = Session.objects.get()
+        for i in range(3):
+            self.client.get(reverse("home"))
+        self.assertEqual(Session.objects.get().session_data, session.session_data)
+        self.assertEqual(Session.objects.get().expire_date, session.expire_date)
+
+    def test_session_bench(self):
+        from biostar.server.management.commands import session_bench
+
+        results = session_bench.benchmark(self.user, url=reverse("home"), views=3)
+        self.assertEqual([r['backend'] for r in results], list(session_bench.BACKENDS))
+        for result in results:
+            self.assertEqual(result['session_writes'], 0)
+
+    def test_reset_counts(self):
+        self.client.login(email=self.user.email, password='password')
+        self.client.get(reverse("topic-list", kwargs=dict(topic="rna-seq")))
+        self.assertEqual(self.counts()['rna-seq'], '')
+        self.assertEqual(self.counts()['latest'], 1)
+
+
+class ExemptTest(TestCase):
+    def setUp(self):
+        haystack_logger.setLevel(logging.CRITICAL)
+        self.user = User.objects.create(email='test@test.com')
+        self.user.set_password('password')
+        self.user.save()
+        self.client.login(email=self.user.email, password='password')
+
+        # The counts are due for a refresh.
+        self.last_login = const.now() - timedelta(hours=1)
+        Profile.objects.filter(user=self.user).update(last_login=self.last_login)
+
+    def test_exempt_paths(self):
+        for url in [reverse("api-traffic"), reverse("latest-feed")]:
+            self.client.get(url)
+        self.client.get(reverse("home"), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(Profile.objects.get(user=self.user).last_login, self.last_login)
+
+    def test_page_refresh(self):
+        self.client.get(reverse("home"))
+        self.assertTrue(Profile.objects.get(user=self.user).last_login > self.last_login)
+
+    @override_settings(VISIT_TIMING_HEADER=True)
+    def test_timing_header(self):
+        r = self.client.get(reverse("api-traffic"))
+        self.assertTrue(r['X-Visit-Time'].endswith("ms"))
+
+
+class DebounceTest(TestCase):
+    def setUp(self):
+        from django.core import cache
+
+        # The test settings use a dummy cache.
+        self.default = cache.cache
+        cache.cache = get_cache('django.core.cache.backends.locmem.LocMemCache')
+        cache.cache.clear()
+        self.user = User.objects.create(email='test@test.com')
+
+    def tearDown(self):
+        from django.core import cache
+        cache.cache = self.default
+
+    def test_debounce(self):
+        from biostar.awards import create_user_award
+        from biostar.celery import debounce, task_meter
+
+        for i in range(3):
+            debounce(create_user_award, self.user.id, user_id=self.user.id)
+        debounce(create_user_award, self.user.id + 1, user_id=self.user.id + 1)
+        self.assertEqual(task_meter("create_user_award"), dict(sent=2, dropped=2))
+
+    def test_failed_delay(self):
+        from biostar.celery import debounce, task_meter
+
+        class Broken(object):
+            name = "biostar.awards.create_user_award"
+
+            def delay(self, *args, **kwargs):
+                raise IOError("broker is down")
+
+        self.assertRaises(IOError, debounce, Broken(), self.user.id, user_id=self.user.id)
+        self.assertEqual(task_meter("create_user_award"), dict(sent=0, dropped=0))
+
+        # The marker was removed, the next call is not dropped.
+        from biostar.awards import create_user_award
+        debounce(create_user_award, self.user.id, user_id=self.user.id)
+        self.assertEqual(task_meter("create_user_award"), dict(sent=1, dropped=0))
+
+    def test_queued_with_user(self):
+        from biostar.awards import create_user_award, check_user_profile
+
+        # Tasks queued before the switch to ids still run.
+        create_user_award(user=self.user)
+        check_user_profile("127.0.0.1", user=self.user)
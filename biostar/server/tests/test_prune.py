@@ -0,0 +1,53 @@
+import logging
+from datetime import timedelta
+
+from django.test import TestCase
+
+from biostar.apps.users.models import User
+from biostar.apps.messages.models import Message, MessageBody
+from biostar.apps.posts.models import Post
+from biostar.server.management.commands import prune_data
+from biostar import const
+
+
+logging.disable(logging.WARNING)
+
+
+class PruneTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='test@test.com', password='...')
+        self.other = User.objects.create(email='other@test.com', password='...')
+
+    def add_messages(self, user, count, days):
+        date = const.now() - timedelta(days=days)
+        body = MessageBody.objects.create(author=user, subject="Subject", text="Text", sent_at=date)
+        for i in range(count):
+            Message.objects.create(user=user, body=body)
+
+    def test_message_counter(self):
+        # The welcome message.
+        self.assertEqual(User.objects.get(id=self.user.id).message_count, 1)
+
+        # Messages created in bulk for a new post.
+        self.other.profile.message_prefs = const.ALL_MESSAGES
+        self.other.profile.save()
+        Post.objects.create(title="Post title needs to be sufficiently long", content="Lorem ipsum " * 10,
+                            tag_val='tag_val', author=self.user, type=Post.QUESTION, status=Post.OPEN)
+        self.assertEqual(User.objects.get(id=self.other.id).message_count, 2)
+
+    def test_prune_old_messages(self):
+        self.add_messages(self.user, count=5, days=100)
+        self.add_messages(self.user, count=2, days=2)
+        results = prune_data.main(batch_size=2, pause=0)
+
+        deleted = dict((result['table'], result['deleted']) for result in results)
+        self.assertEqual(deleted[Message._meta.db_table], 5)
+        self.assertEqual(Message.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(User.objects.get(id=self.user.id).message_count, 3)
+
+    def test_trim_full_inbox(self):
+        self.add_messages(self.user, count=5, days=2)
+        prune_data.main(pause=0, max_messages=4)
+        self.assertEqual(Message.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(User.objects.get(id=self.user.id).message_count, 1)
+        self.assertEqual(Message.objects.filter(user=self.other).count(), 1)
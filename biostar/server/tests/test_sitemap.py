@@ -0,0 +1,53 @@
+import gzip, logging, os, shutil, tempfile
+
+from django.test import TestCase
+
+from biostar.apps.posts.models import Post
+from biostar.apps.users.models import User
+from biostar.server.management.commands import sitemap
+
+
+logging.disable(logging.WARNING)
+
+
+class SitemapTest(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.user = User.objects.create(email='test@test.com', password='...')
+        self.posts = []
+        for i in range(3):
+            post = Post(title="Post %s, title needs to be sufficiently long" % i, content="Lorem ipsum " * 10,
+                        tag_val='tag_val', author=self.user, type=Post.QUESTION, status=Post.OPEN)
+            post.save()
+            self.posts.append(post)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def shard(self):
+        return os.path.join(self.root, sitemap.shard_name(self.posts[0].id // sitemap.SHARD_SIZE))
+
+    def test_index_and_shard(self):
+        with self.settings(STATIC_ROOT=self.root):
+            sitemap.generate_sitemap()
+        index = open(os.path.join(self.root, 'sitemap.xml')).read()
+        self.assertTrue(os.path.basename(self.shard()) in index)
+        urls = gzip.open(self.shard()).read()
+        for post in self.posts:
+            self.assertTrue("/p/%s/" % post.id in urls)
+
+    def test_unchanged_shards_are_kept(self):
+        with self.settings(STATIC_ROOT=self.root):
+            sitemap.generate_sitemap()
+            mtime = int(os.path.getmtime(self.shard()))
+            os.utime(self.shard(), (mtime - 100, mtime - 100))
+
+            sitemap.generate_sitemap()
+            self.assertEqual(int(os.path.getmtime(self.shard())), mtime - 100)
+
+            post = Post(title="Post 4, title needs to be sufficiently long", content="Lorem ipsum " * 10,
+                        tag_val='tag_val', author=self.user, type=Post.QUESTION, status=Post.OPEN)
+            post.save()
+            sitemap.generate_sitemap()
+            self.assertNotEqual(int(os.path.getmtime(self.shard())), mtime - 100)
+            self.assertTrue("/p/%s/" % post.id in gzip.open(self.shard()).read())
@@ -0,0 +1,102 @@
+import logging
+
+from django.test import TestCase
+from django.core.urlresolvers import reverse
+from django.contrib.auth.models import AnonymousUser
+
+from biostar.apps.posts.models import Post, Vote
+from biostar.apps.users.models import User, UserStats
+from biostar.apps.badges.models import Badge, Award
+from biostar.server.ajax import perform_vote
+from biostar import const
+
+
+logging.disable(logging.WARNING)
+haystack_logger = logging.getLogger('haystack')
+
+
+class UserStatsTest(TestCase):
+    def setUp(self):
+        haystack_logger.setLevel(logging.CRITICAL)
+        self.user = User.objects.create(email='test@test.com', name="Alice Smith")
+        self.other = User.objects.create(email='other@test.com', name="Bob")
+
+        self.question = Post(title="A question that is sufficiently long", content="Lorem ipsum dolor sit amet",
+                             tag_val="tag", author=self.user, type=Post.QUESTION)
+        self.question.save()
+        self.answer = Post(content="An answer to the question", author=self.other, type=Post.ANSWER,
+                           parent=self.question)
+        self.answer.save()
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def counts(self, user):
+        stats = self.stats(user)
+        return [stats.post_count, stats.question_count, stats.answer_count, stats.comment_count,
+                stats.accepted_count, stats.vote_count, stats.award_count]
+
+    def test_incremental(self):
+        self.assertEqual(self.counts(self.user), [1, 1, 0, 0, 0, 0, 0])
+
+        Vote.objects.create(author=self.user, post=self.answer, type=Vote.UP)
+        perform_vote(Post.objects.get(id=self.answer.id), self.user, Vote.ACCEPT)
+        badge = Badge.objects.create(name="Badge")
+        Award.objects.create(user=self.other, badge=badge, date=const.now())
+        self.assertEqual(self.counts(self.other), [1, 0, 1, 0, 1, 1, 1])
+
+        Vote.objects.filter(type=Vote.UP).delete()
+        self.assertEqual(self.stats(self.other).vote_count, 0)
+
+        # The votes are removed along with the post.
+        Post.objects.get(id=self.answer.id).delete()
+        self.assertEqual(self.counts(self.other), [0, 0, 0, 0, 0, 0, 1])
+
+    def test_accept_vote(self):
+        perform_vote(Post.objects.get(id=self.answer.id), self.user, Vote.ACCEPT)
+        self.assertEqual(self.stats(self.other).accepted_count, 1)
+        perform_vote(Post.objects.get(id=self.answer.id), self.user, Vote.ACCEPT)
+        self.assertEqual(self.stats(self.other).accepted_count, 0)
+
+    def test_type_change(self):
+        # An edit turns the answer into a comment, then a moderator accepts it as an answer.
+        self.answer.type = Post.COMMENT
+        self.answer.save()
+        self.assertEqual(self.counts(self.other), [1, 0, 0, 1, 0, 0, 0])
+
+        answer = Post.objects.get(id=self.answer.id)
+        answer.type, answer.has_accepted = Post.ANSWER, True
+        answer.save()
+        self.assertEqual(self.counts(self.other), [1, 0, 1, 0, 1, 0, 0])
+
+        expected = self.counts(self.other)
+        UserStats.rebuild([self.other.id])
+        self.assertEqual(self.counts(self.other), expected)
+
+    def test_rebuild(self):
+        Vote.objects.create(author=self.user, post=self.answer, type=Vote.UP)
+        expected = [self.counts(self.user), self.counts(self.other)]
+
+        UserStats.objects.update(post_count=100, vote_count=100)
+        UserStats.rebuild([self.other.id])
+        self.assertEqual(self.counts(self.other), expected[1])
+        self.assertEqual(self.stats(self.user).post_count, 100)
+
+        UserStats.rebuild()
+        self.assertEqual([self.counts(self.user), self.counts(self.other)], expected)
+
+    def test_deleted_posts(self):
+        Post.objects.filter(id=self.question.id).update(status=Post.DELETED)
+        UserStats.rebuild([self.user.id])
+        self.assertEqual(self.stats(self.user).post_count, 0)
+
+    def test_name_prefix(self):
+        find = lambda q: list(User.objects.get_users(sort=const.USER_SORT_DEFAULT, limit=const.POST_LIMIT_DEFAULT,
+                                                     q=q, user=AnonymousUser()))
+        self.assertEqual(find("ALI"), [self.user])
+        self.assertEqual(find("smith"), [])
+
+    def test_user_details(self):
+        r = self.client.get(reverse("user-details", kwargs=dict(pk=self.user.id)))
+        self.assertEqual(r.context['stats'].question_count, 1)
+        self.assertEqual(r.context['page_obj'].paginator.count, 1)
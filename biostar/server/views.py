@@ -5,7 +5,7 @@ from biostar.apps.users.views import EditUser
 import os, random
 from django.core.cache import cache
 from biostar.apps.messages.models import Message
-from biostar.apps.users.models import User
+from biostar.apps.users.models import User, UserStats
 from biostar.apps.posts.models import Post, Vote, Tag, Subscription, ReplyToken
 from biostar.apps.posts.views import NewPost, NewAnswer, ShortForm
 from biostar.apps.badges.models import Badge, Award
@@ -28,6 +28,7 @@ from django.http import Http404
 import markdown, pyzmail
 from biostar.apps.util.email_reply_parser import EmailReplyParser
 from django.core.urlresolvers import reverse
+from biostar.server.middleware import reset_counts
 
 logger = logging.getLogger(__name__)
 
@@ -137,15 +138,6 @@ def posts_by_topic(request, topic):
     return Post.objects.top_level(user)
 
 
-def reset_counts(request, label):
-    "Resets counts in the session"
-    label = label.lower()
-    counts = request.session.get(settings.SESSION_KEY, {})
-    if label in counts:
-        counts[label] = ''
-        request.session[settings.SESSION_KEY] = counts
-
-
 class PostList(BaseListMixin):
     """
     This is the base class for any view that produces a list of posts.
@@ -328,6 +320,8 @@ class UserDetails(BaseDetailMixin):
         target = context[self.context_object_name]
         #posts = Post.objects.filter(author=target).defer("content").order_by("-creation_date")
         posts = Post.objects.my_posts(target=target, user=self.request.user)
+        stats, created = UserStats.objects.get_or_create(user=target)
+        context['stats'] = stats
         paginator = Paginator(posts, 10)
         try:
             page = int(self.request.GET.get("page", 1))
@@ -340,17 +334,28 @@ class UserDetails(BaseDetailMixin):
         awards = Award.objects.filter(user=target).select_related("badge", "user").order_by("-date")
         context['awards'] = awards[:25]
 
+        context.update(orcid_details(target))
+
+        return context
+
+
+def orcid_details(target):
+    "Returns the ORCID profile url and id of the user, cached as the lookup is rarely needed"
+    key = "orcid-%s" % target.id
+    details = cache.get(key)
+    if details is None:
+        details = {}
         # Get user's ORCID profile URL.
         try:
             social_account = target.socialaccount_set.get(provider__icontains='orcid')
-            context['orcid_profile_url'] = (social_account.extra_data['orcid-profile']
+            details['orcid_profile_url'] = (social_account.extra_data['orcid-profile']
                                             ['orcid-identifier']['uri'])
-            context['orcid_id'] = (social_account.extra_data['orcid-profile']
-                                            ['orcid-identifier']['path'])
+            details['orcid_id'] = (social_account.extra_data['orcid-profile']
+                                   ['orcid-identifier']['path'])
         except Exception:
             pass
-
-        return context
+        cache.set(key, details, settings.SESSION_UPDATE_SECONDS)
+    return details
 
 
 class EditUser(EditUser):
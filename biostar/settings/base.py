@@ -443,6 +443,9 @@ POST_VIEW_MINUTES = 5
 # Default  expiration in seconds.
 CACHE_TIMEOUT = 60
 
+# How long, in seconds, are the rendered RSS feeds kept in the cache.
+FEED_CACHE_SECONDS = 5 * 60
+
 # Should the messages go to email by default
 # Valid values are local, default, email
 DEFAULT_MESSAGE_PREF = "local"
@@ -487,11 +490,37 @@ COUNT_INTERVAL_WEEKS = 10000
 
 # How frequently do we update the counts for authenticated users.
 SESSION_UPDATE_SECONDS = 10 * 60
+
+# Paths (regular expressions) where the Visit middleware skips the counts and user refreshes.
+VISIT_EXEMPT_PATHS = [
+    r'^/api/', r'^/feeds/', r'^/x/', r'^/static/', r'^/local/email/',
+    r'^/local/search/(title|tags)/', r'^/robots\.txt$', r'^/sitemap',
+]
+
+# The local IP range database used to fill in user locations, see biostar/apps/util/geoip.py.
+GEOIP_DATABASE = abspath(LIVE_DIR, "geoip.csv.gz")
+
+# How many recent ip lookups are remembered.
+GEOIP_CACHE_SIZE = 10000
+
+# Background tasks started on a visit run at most once per user within these many seconds.
+TASK_DEBOUNCE_SECONDS = dict(create_user_award=60 * 60, check_user_profile=24 * 60 * 60)
+
+# Adds a header with the time spent in the Visit middleware.
+VISIT_TIMING_HEADER = DEBUG
+
 SESSION_COOKIE_NAME = "biostar2"
 
 # The number of posts to show per page.
 PAGINATE_BY = 25
 
+# The maximal number of objects returned by a bulk api call.
+API_BULK_LIMIT = 1000
+
+# Changes are handed out once they are this old, by then the transactions
+# that logged the lower ids have committed.
+CHANGE_LOG_LAG_SECONDS = 60
+
 # Used by crispyforms.
 # CRISPY_FAIL_SILENTLY = not DEBUG
 
@@ -518,6 +547,9 @@ NOCAPTCHA = True
 SESSION_SERIALIZER = 'django.contrib.sessions.serializers.JSONSerializer'
 SESSION_KEY = "session"
 
+# The session backend: db, cached_db or cache. The counts live in the cache, sessions only change on login/logout.
+SESSION_ENGINE = "django.contrib.sessions.backends.%s" % get_env("SESSION_BACKEND", "db")
+
 # Use a mock email backend for development.
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
@@ -112,9 +112,15 @@ urlpatterns = patterns('',
     url(r'^api/user/(?P<id>\d+)/$', api.user_details, name='api-user'),
     url(r'^api/post/(?P<id>\d+)/$', api.post_details, name='api-post'),
     url(r'^api/vote/(?P<id>\d+)/$', api.vote_details, name='api-vote'),
+    url(r'^api/posts/$', api.post_list, name='api-post-list'),
+    url(r'^api/posts/since/(?P<timestamp>\d+)/$', api.posts_since, name='api-posts-since'),
+    url(r'^api/votes/since/(?P<timestamp>\d+)/$', api.votes_since, name='api-votes-since'),
+    url(r'^api/changes/(?P<seq>\d+)/$', api.changes_since, name='api-changes'),
     url(r'^api/stats/day/(?P<day>\d+)/$', api.daily_stats_on_day, name='api-stats-on-day'),
     url(r'^api/stats/date/(?P<year>\d{4})/(?P<month>\d{2})/(?P<day>\d{2})/$',
         api.daily_stats_on_date, name='api-stats-on-date'),
+    url(r'^api/stats/range/(?P<start>\d{4}-\d{2}-\d{2})/(?P<end>\d{4}-\d{2}-\d{2})/$',
+        api.daily_stats_range, name='api-stats-range'),
 
     # Uncomment the next line to enable the admin:
     url(r'^admin/', include(admin.site.urls)),